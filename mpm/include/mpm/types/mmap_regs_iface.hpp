@@ -37,7 +37,44 @@ public:
     //! Read data from \p addr
     uint32_t peek32(const uint32_t addr);
 
+    //! Write \p num_words words from \p data to consecutive registers,
+    // starting at \p addr
+    void poke32_block(const uint32_t addr, const uint32_t* data, const size_t num_words);
+
+    //! Read \p num_words words from consecutive registers, starting at
+    // \p addr, into \p data
+    void peek32_block(const uint32_t addr, uint32_t* data, const size_t num_words);
+
+    //! Write data[i] to addrs[i] for all i < \p num_words, in that order
+    void poke32_scatter(
+        const uint32_t* addrs, const uint32_t* data, const size_t num_words);
+
+    //! Read addrs[i] into data[i] for all i < \p num_words, in that order
+    void peek32_gather(const uint32_t* addrs, uint32_t* data, const size_t num_words);
+
+    //! Return the mapped memory, or NULL if it's not mapped
+    uint32_t* get_mmap()
+    {
+        return _mmap;
+    }
+
+    //! Return the length of the mapped memory in bytes
+    size_t get_length() const
+    {
+        return _length;
+    }
+
+    //! Return true if the mapped memory is read-only
+    bool is_read_only() const
+    {
+        return _read_only;
+    }
+
 private:
+    //! Throw if \p addr is not 32-bit aligned, or if the \p num_bytes bytes
+    // starting at \p addr are not mapped
+    void check_range(const uint32_t addr, const size_t num_bytes);
+
     void log(mpm::types::log_level_t level, const std::string path, const char* comment);
 
     const std::string _path;
@@ -11,6 +11,34 @@
 #include "log_buf.hpp"
 #include "mmap_regs_iface.hpp"
 #include "regs_iface.hpp"
+#include <mpm/exception.hpp>
+
+//! Return true if \p format is a struct format string of a native integer
+static bool is_int_format(const std::string& format)
+{
+    if (format.size() != 1
+        && !(format.size() == 2 && (format[0] == '@' || format[0] == '='))) {
+        return false;
+    }
+    return std::string("iIlL").find(format.back()) != std::string::npos;
+}
+
+//! Return the words of a one-dimensional, contiguous buffer of 32-bit integers
+// (e.g., an array.array('I') or a numpy.uint32 array) and their number
+//
+// Other buffers throw an mpm::value_error, which reaches Python as a
+// RuntimeError.
+static std::pair<uint32_t*, size_t> get_u32_buffer(py::buffer buf, bool writable)
+{
+    const py::buffer_info info = buf.request(writable);
+    if (info.ndim != 1 || info.itemsize != sizeof(uint32_t)
+        || !is_int_format(info.format)
+        || (info.shape[0] > 1 && info.strides[0] != sizeof(uint32_t))) {
+        throw mpm::value_error(
+            "Expected a contiguous, one-dimensional buffer of 32-bit integers");
+    }
+    return {static_cast<uint32_t*>(info.ptr), static_cast<size_t>(info.shape[0])};
+}
 
 void export_types(py::module& top_module)
 {
@@ -40,10 +68,43 @@ void export_types(py::module& top_module)
                 std::get<2>(log_msg));
         });
 
-    py::class_<mmap_regs_iface, std::shared_ptr<mmap_regs_iface>>(m, "mmap_regs_iface")
+    py::class_<mmap_regs_iface, std::shared_ptr<mmap_regs_iface>>(
+        m, "mmap_regs_iface", py::buffer_protocol())
         .def(py::init<std::string, size_t, size_t, bool, bool>())
         .def("open", &mmap_regs_iface::open)
         .def("close", &mmap_regs_iface::close)
         .def("peek32", &mmap_regs_iface::peek32)
-        .def("poke32", &mmap_regs_iface::poke32);
+        .def("poke32", &mmap_regs_iface::poke32)
+        .def("peek32_block",
+            [](mmap_regs_iface& self, const uint32_t addr, py::buffer data) {
+                auto words = get_u32_buffer(data, true);
+                self.peek32_block(addr, words.first, words.second);
+            })
+        .def("poke32_block",
+            [](mmap_regs_iface& self, const uint32_t addr, py::buffer data) {
+                auto words = get_u32_buffer(data, false);
+                self.poke32_block(addr, words.first, words.second);
+            })
+        .def("peek32_gather",
+            [](mmap_regs_iface& self, py::buffer addrs, py::buffer data) {
+                auto addr_words = get_u32_buffer(addrs, false);
+                auto data_words = get_u32_buffer(data, true);
+                MPM_ASSERT_THROW(addr_words.second == data_words.second);
+                self.peek32_gather(addr_words.first, data_words.first, data_words.second);
+            })
+        .def("poke32_scatter",
+            [](mmap_regs_iface& self, py::buffer addrs, py::buffer data) {
+                auto addr_words = get_u32_buffer(addrs, false);
+                auto data_words = get_u32_buffer(data, false);
+                MPM_ASSERT_THROW(addr_words.second == data_words.second);
+                self.poke32_scatter(addr_words.first, data_words.first, data_words.second);
+            })
+        // Exposes the mapped registers as 32-bit words. The buffer must not be
+        // used after close().
+        .def_buffer([](mmap_regs_iface& self) -> py::buffer_info {
+            MPM_ASSERT_THROW(self.get_mmap());
+            return py::buffer_info(self.get_mmap(),
+                static_cast<py::ssize_t>(self.get_length() / sizeof(uint32_t)),
+                self.is_read_only());
+        });
 }
@@ -91,6 +91,67 @@ uint32_t mmap_regs_iface::peek32(const uint32_t addr)
     return _mmap[addr / sizeof(uint32_t)];
 }
 
+void mmap_regs_iface::poke32_block(
+    const uint32_t addr, const uint32_t* data, const size_t num_words)
+{
+    check_range(addr, num_words * sizeof(uint32_t));
+    // Registers need to be written one word at a time, so don't use memcpy()
+    volatile uint32_t* regs = _mmap + addr / sizeof(uint32_t);
+    for (size_t i = 0; i < num_words; i++) {
+        regs[i] = data[i];
+    }
+}
+
+void mmap_regs_iface::peek32_block(
+    const uint32_t addr, uint32_t* data, const size_t num_words)
+{
+    check_range(addr, num_words * sizeof(uint32_t));
+    volatile uint32_t* regs = _mmap + addr / sizeof(uint32_t);
+    for (size_t i = 0; i < num_words; i++) {
+        data[i] = regs[i];
+    }
+}
+
+void mmap_regs_iface::poke32_scatter(
+    const uint32_t* addrs, const uint32_t* data, const size_t num_words)
+{
+    for (size_t i = 0; i < num_words; i++) {
+        check_range(addrs[i], sizeof(uint32_t));
+    }
+    volatile uint32_t* regs = _mmap;
+    for (size_t i = 0; i < num_words; i++) {
+        regs[addrs[i] / sizeof(uint32_t)] = data[i];
+    }
+}
+
+void mmap_regs_iface::peek32_gather(
+    const uint32_t* addrs, uint32_t* data, const size_t num_words)
+{
+    for (size_t i = 0; i < num_words; i++) {
+        check_range(addrs[i], sizeof(uint32_t));
+    }
+    volatile uint32_t* regs = _mmap;
+    for (size_t i = 0; i < num_words; i++) {
+        data[i] = regs[addrs[i] / sizeof(uint32_t)];
+    }
+}
+
+void mmap_regs_iface::check_range(const uint32_t addr, const size_t num_bytes)
+{
+    MPM_ASSERT_THROW(_mmap);
+    if (addr % sizeof(uint32_t)) {
+        throw mpm::value_error(str(
+            boost::format("Address 0x%X of %s is not 32-bit aligned") % addr % _path));
+    }
+    // Written so that neither side can overflow
+    if (num_bytes > _length || addr > _length - num_bytes) {
+        throw mpm::index_error(
+            str(boost::format("Access to 0x%X bytes at address 0x%X exceeds mapped "
+                              "length 0x%X of %s")
+                % num_bytes % addr % _length % _path));
+    }
+}
+
 void mmap_regs_iface::log(
     mpm::types::log_level_t level, const std::string path, const char* comment)
 {
@@ -4,17 +4,146 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 #
 """
-Tests the components classes (currently ZynqComponents)
+Tests the components classes (currently ComponentUpload and ZynqComponents)
 """
 
-from usrp_mpm.components import ZynqComponents
+from usrp_mpm.components import ComponentUpload, ZynqComponents
 from base_tests import TestBase
 
 import copy
+import hashlib
 import os.path
 import tempfile
 import unittest
 
+class _log_dummy():
+    def _dummy(self, *args):
+        pass
+    trace = _dummy
+    debug = _dummy
+    info = _dummy
+    warning = _dummy
+    error = _dummy
+
+class TestComponentUpload(TestBase):
+    """
+    Test chunked uploads with the ComponentUpload class
+    """
+    _data = bytes(range(256)) * 40
+    _chunk_size = 4000
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmpdir.cleanup)
+        self.metadata = {
+            'id': 'fpga',
+            'filename': 'image.bit',
+            'md5': hashlib.md5(self._data).hexdigest(),
+            'size': len(self._data),
+        }
+        self.filepath = os.path.join(self._tmpdir.name, 'image.bit')
+
+    def _start(self, metadata=None):
+        """ Start (or resume) an upload of self._data """
+        return ComponentUpload(
+            _log_dummy(), self._tmpdir.name, metadata or self.metadata)
+
+    def _upload(self, upload, end=None):
+        """ Append chunks starting at upload.offset, until end """
+        end = len(self._data) if end is None else end
+        offset = upload.offset
+        while offset < end:
+            chunk = self._data[offset:min(offset + self._chunk_size, end)]
+            offset = upload.append(offset, chunk)
+        return offset
+
+    def _assert_no_leftovers(self):
+        """ Neither the partial file nor its metadata may be left behind """
+        self.assertFalse(os.path.exists(self.filepath + '.part'))
+        self.assertFalse(os.path.exists(self.filepath + '.part.json'))
+
+    def test_upload(self):
+        """ A complete upload ends up at its final path """
+        upload = self._start()
+        self.assertEqual(upload.offset, 0)
+        self.assertEqual(self._upload(upload), len(self._data))
+        upload.commit()
+        with open(self.filepath, 'rb') as comp_file:
+            self.assertEqual(comp_file.read(), self._data)
+        self._assert_no_leftovers()
+
+    def test_resume(self):
+        """ An interrupted upload continues where it stopped """
+        upload = self._start()
+        self._upload(upload, end=2 * self._chunk_size)
+        upload.close()
+        upload = self._start()
+        self.assertEqual(upload.offset, 2 * self._chunk_size)
+        self._upload(upload)
+        upload.commit()
+        with open(self.filepath, 'rb') as comp_file:
+            self.assertEqual(comp_file.read(), self._data)
+        self._assert_no_leftovers()
+
+    def test_resume_identity(self):
+        """ A partial upload of a different file is not resumed """
+        upload = self._start()
+        self._upload(upload, end=self._chunk_size)
+        upload.close()
+        for key, value in (('md5', 'f' * 32), ('size', len(self._data) + 1),
+                           ('id', 'dts')):
+            metadata = dict(self.metadata, **{key: value})
+            upload = self._start(metadata)
+            self.assertEqual(upload.offset, 0, "Resumed with different " + key)
+            upload.close()
+            self.assertEqual(os.path.getsize(self.filepath + '.part'), 0)
+        # The metadata was overwritten by the last upload, so the original
+        # one can't resume either
+        upload = self._start()
+        self.assertEqual(upload.offset, 0)
+        upload.abort()
+
+    def test_bad_offset(self):
+        """ Chunks must be appended in order """
+        upload = self._start()
+        self._upload(upload, end=self._chunk_size)
+        with self.assertRaises(RuntimeError):
+            upload.append(0, self._data[:self._chunk_size])
+        with self.assertRaises(RuntimeError):
+            upload.append(2 * self._chunk_size, self._data[:self._chunk_size])
+        self.assertEqual(upload.offset, self._chunk_size)
+        upload.abort()
+
+    def test_size_mismatch(self):
+        """ Uploads can neither exceed nor fall short of the given size """
+        upload = self._start()
+        self._upload(upload, end=len(self._data) - 1)
+        with self.assertRaises(RuntimeError):
+            upload.append(upload.offset, self._data[-1:] + b'\x00')
+        with self.assertRaises(RuntimeError):
+            upload.commit()
+        self.assertFalse(os.path.exists(self.filepath))
+        self._assert_no_leftovers()
+
+    def test_md5_mismatch(self):
+        """ A corrupted upload is discarded on commit """
+        upload = self._start(dict(self.metadata, md5='f' * 32))
+        self._upload(upload)
+        with self.assertRaises(RuntimeError):
+            upload.commit()
+        self.assertFalse(os.path.exists(self.filepath))
+        self._assert_no_leftovers()
+
+    def test_abort(self):
+        """ Aborting discards the upload, so it starts over next time """
+        upload = self._start()
+        self._upload(upload, end=self._chunk_size)
+        upload.abort()
+        self._assert_no_leftovers()
+        upload = self._start()
+        self.assertEqual(upload.offset, 0)
+        upload.abort()
+
 class TestZynqComponents(TestBase):
     """
     Test functions of the ZynqComponents class
@@ -55,14 +184,6 @@ class TestZynqComponents(TestBase):
 
     def test_verify_compatibility(self):
         """ Test function ZynqComponents._verify_compatibility """
-        class _log_dummy():
-            def _dummy(self, *args):
-                pass
-            trace = _dummy
-            info = _dummy
-            warning = _dummy
-            error = _dummy
-
         f = self._write_dts_file_from_test_cases(self._testcase_input)
         compatibility = self._testcase_result
         for version_type in ['current', 'oldest']:
@@ -0,0 +1,331 @@
+#
+# Copyright 2020 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests the adaptive sweep and resuming of the Eye Scan tool, and how Rhodium
+passes its arguments on
+"""
+
+from array import array
+from unittest import mock
+from base_tests import TestBase
+from usrp_mpm.cores import eyescan
+from usrp_mpm.cores.eyescan import EyeScanTool, EyeScanResults
+from usrp_mpm.dboard_manager import rh_init
+from usrp_mpm.mpmlog import get_main_logger
+
+import datetime
+import os
+import sys
+import tempfile
+import unittest
+
+class MockJesdCore:
+    """
+    JESD core without any GTs, the acquisitions are stubbed out instead
+    """
+    def set_drp_target(self, *args):
+        pass
+
+    def disable_drp_target(self):
+        pass
+
+    def drp_access(self, *args, **kwargs):
+        return 0
+
+def read_pes_file(pes_path, parsed_ranges):
+    """
+    Read the .pes file of a scan of one lane in LPM mode, and its completion
+    bitmap. Returns a tuple (counters, measured), where counters maps every
+    (hor_offset, ver_offset) to its (sample_count, error_count) tuple, and
+    measured is the set of coordinates marked as measured.
+    """
+    with open(pes_path, 'rb') as pes_file:
+        header = pes_file.read(0x12)
+        data_offset = int.from_bytes(header[0x10:0x12], 'little')
+        pes_file.seek(data_offset)
+        words = array('H', pes_file.read())
+    if sys.byteorder != 'little':
+        words.byteswap()
+    with open(pes_path + EyeScanResults.BITMAP_SUFFIX, 'rb') as bitmap_file:
+        bitmap = bitmap_file.read()
+    counters = {}
+    measured = set()
+    for point in range(len(words) // 2):
+        hor_idx, ver_idx = divmod(point, parsed_ranges['ver_iterations'])
+        coord = (parsed_ranges['hor_start'] + hor_idx * parsed_ranges['hor_step'],
+                 parsed_ranges['ver_start'] + ver_idx * parsed_ranges['ver_step'])
+        counters[coord] = (words[2 * point], words[2 * point + 1])
+        if bitmap[point >> 3] & (1 << (point & 7)):
+            measured.add(coord)
+    return counters, measured
+
+class TestEyeScanAdaptive(TestBase):
+    """
+    Test EyeScanTool.eyescan_adaptive_sweep() against a full sweep, with an
+    acquisition stub that models a rectangular eye
+    """
+    HOR_RANGE = {'start': -16, 'stop': 16, 'step': 1}
+    VER_RANGE = {'start': -32, 'stop': 32, 'step': 2}
+    # The eye is open within these offsets. It needs to be wider than a coarse
+    # cell, or the coarse grid could miss parts of it.
+    EYE_HOR = 9
+    EYE_VER = 20
+    SAMPLE_COUNT = 100
+    ERROR_COUNT = 50
+    COARSE_FACTOR = 4
+
+    @classmethod
+    def setUpClass(cls):
+        """ EyeScanTool needs the main logger """
+        get_main_logger(use_logbuf=False)
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmpdir.cleanup)
+        self.tool = EyeScanTool(MockJesdCore(), SAVE_DIR=self._tmpdir.name + '/')
+        self.tool.eyescan_config = lambda: None
+        self.acquired = []
+        self.tool.eyescan_acquisition = self._acquisition
+
+    def _acquisition(self, hor_offset=0, ver_offset=0):
+        """ Stub for EyeScanTool.eyescan_acquisition() """
+        self.acquired.append((hor_offset, ver_offset))
+        is_open = abs(hor_offset) <= self.EYE_HOR and abs(ver_offset) <= self.EYE_VER
+        acq_counters = [{} for _ in range(max(self.tool.lanes) + 1)]
+        for lane in self.tool.lanes:
+            acq_counters[lane]['+UT'] = {
+                'sample_count': self.SAMPLE_COUNT,
+                'error_count': 0 if is_open else self.ERROR_COUNT,
+            }
+        return acq_counters
+
+    def _scan(self, **kwargs):
+        """
+        Run a scan of one lane. Returns a tuple (counters, measured), see
+        read_pes_file().
+        """
+        self.acquired = []
+        file_name = self.tool.eyescan_full_scan(
+            [0], self.HOR_RANGE, self.VER_RANGE, **kwargs)
+        return read_pes_file(os.path.join(self._tmpdir.name, file_name),
+                             self.tool.parse_ranges(self.HOR_RANGE, self.VER_RANGE))
+
+    def test_matches_full_scan(self):
+        """ An adaptive sweep finds the same eye as a full one, in fewer steps """
+        full_counters, full_measured = self._scan()
+        num_full = len(self.acquired)
+        self.assertEqual(num_full, len(full_counters))
+        self.assertEqual(full_measured, set(full_counters))
+        adaptive_counters, adaptive_measured = self._scan(
+            adaptive=True, coarse_factor=self.COARSE_FACTOR)
+        self.assertLess(len(self.acquired), num_full / 2)
+        self.assertEqual(adaptive_counters, full_counters)
+        # Every acquisition is marked as measured, and nothing else is
+        self.assertEqual(adaptive_measured, set(self.acquired))
+        self.assertEqual(len(self.acquired), len(set(self.acquired)))
+
+    def test_coarse_grid(self):
+        """ The coarse grid, including the last coordinate of each axis, is acquired """
+        _, measured = self._scan(adaptive=True, coarse_factor=self.COARSE_FACTOR)
+        hor_grid = set(range(-16, 17, self.COARSE_FACTOR)) | {16}
+        ver_grid = set(range(-32, 33, 2 * self.COARSE_FACTOR)) | {32}
+        for hor_offset in hor_grid:
+            for ver_offset in ver_grid:
+                self.assertIn((hor_offset, ver_offset), measured)
+
+    def test_boundary_refined(self):
+        """ Cells crossing the eye boundary are acquired completely """
+        _, measured = self._scan(adaptive=True, coarse_factor=self.COARSE_FACTOR)
+        # Horizontal boundary between 9 and 10 lies in the cell from 8 to 12.
+        for hor_offset in range(8, 13):
+            self.assertIn((hor_offset, 0), measured)
+            self.assertIn((-hor_offset, 0), measured)
+        # The center of the eye and the corners of the range are not refined
+        self.assertNotIn((1, 2), measured)
+        self.assertNotIn((-15, -30), measured)
+
+    def test_filled_from_nearest_corner(self):
+        """ Coordinates that weren't acquired hold the nearest corner's counters """
+        counters, measured = self._scan(
+            adaptive=True, coarse_factor=self.COARSE_FACTOR)
+        self.assertNotIn((1, 2), measured)
+        self.assertEqual(counters[(1, 2)], counters[(0, 0)])
+        self.assertNotIn((-15, -30), measured)
+        self.assertEqual(counters[(-15, -30)], counters[(-16, -32)])
+
+    def test_uniform_eye(self):
+        """ If no cell crosses the boundary, only the coarse grid is acquired """
+        with mock.patch.object(self, 'EYE_HOR', 100), mock.patch.object(self, 'EYE_VER', 200):
+            counters, measured = self._scan(
+                adaptive=True, coarse_factor=self.COARSE_FACTOR)
+        self.assertEqual(len(measured), len(set(range(-16, 17, 4)) | {16}) *
+                         len(set(range(-32, 33, 8)) | {32}))
+        self.assertEqual(set(counters.values()), {(self.SAMPLE_COUNT, 0)})
+
+    def test_coarse_factor_one(self):
+        """ With a coarse factor of 1, every coordinate is acquired """
+        counters, measured = self._scan(adaptive=True, coarse_factor=1)
+        self.assertEqual(measured, set(counters))
+
+class AcquisitionInterrupted(Exception):
+    """ Raised by the acquisition stub to interrupt a scan """
+
+class TestEyeScanResume(TestBase):
+    """
+    Test resuming an interrupted eye scan from its .pes file and completion
+    bitmap
+    """
+    HOR_RANGE = {'start': -4, 'stop': 4, 'step': 1}
+    VER_RANGE = {'start': -8, 'stop': 8, 'step': 2}
+    NUM_POINTS = 81
+    # The file name holds a time stamp, which is fixed so that scans started at
+    # different times of one test get the same name
+    NOW = datetime.datetime(2020, 1, 2, 3, 4)
+
+    @classmethod
+    def setUpClass(cls):
+        """ EyeScanTool needs the main logger """
+        get_main_logger(use_logbuf=False)
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmpdir.cleanup)
+        self.tool = EyeScanTool(MockJesdCore(), SAVE_DIR=self._tmpdir.name + '/')
+        self.tool.eyescan_config = lambda: None
+        self.tool.eyescan_acquisition = self._acquisition
+        self.acquired = []
+        self.interrupt_after = None
+        datetime_patch = mock.patch.object(eyescan, 'datetime')
+        datetime_patch.start().datetime.now.return_value = self.NOW
+        self.addCleanup(datetime_patch.stop)
+
+    def _acquisition(self, hor_offset=0, ver_offset=0):
+        """
+        Stub for EyeScanTool.eyescan_acquisition(). Every coordinate gets its
+        own error count. Raises AcquisitionInterrupted once interrupt_after
+        acquisitions were made.
+        """
+        if self.interrupt_after is not None and len(self.acquired) >= self.interrupt_after:
+            raise AcquisitionInterrupted()
+        self.acquired.append((hor_offset, ver_offset))
+        acq_counters = [{} for _ in range(max(self.tool.lanes) + 1)]
+        for lane in self.tool.lanes:
+            acq_counters[lane]['+UT'] = {
+                'sample_count': 100,
+                'error_count': abs(hor_offset) * 10 + abs(ver_offset),
+            }
+        return acq_counters
+
+    def _scan(self, **kwargs):
+        """ Run a scan of lane 0, and return the name of its .pes file """
+        return self.tool.eyescan_full_scan(
+            [0], self.HOR_RANGE, self.VER_RANGE, **kwargs)
+
+    def _read(self, file_name):
+        """ Read the results of a scan, see read_pes_file() """
+        return read_pes_file(os.path.join(self._tmpdir.name, file_name),
+                             self.tool.parse_ranges(self.HOR_RANGE, self.VER_RANGE))
+
+    def test_resume_matching_header(self):
+        """ A .pes file with a matching header is reopened at its data offset """
+        file_name = self._scan()
+        resumed_name, pes_file = self.tool.create_pes_file(
+            self.HOR_RANGE, self.VER_RANGE, resume_file=file_name)
+        with pes_file:
+            self.assertEqual(resumed_name, file_name)
+            data_offset = pes_file.tell()
+            pes_file.seek(0x10)
+            self.assertEqual(int.from_bytes(pes_file.read(2), 'little'), data_offset)
+
+    def test_resume_mismatched_header(self):
+        """ A .pes file with a different header can't be resumed """
+        file_name = self._scan()
+        with self.assertRaises(RuntimeError):
+            self.tool.create_pes_file(
+                self.HOR_RANGE, dict(self.VER_RANGE, step=4), resume_file=file_name)
+        self.tool.lanes = [1]
+        with self.assertRaises(RuntimeError):
+            self.tool.create_pes_file(
+                self.HOR_RANGE, self.VER_RANGE, resume_file=file_name)
+
+    def test_interrupt_and_resume(self):
+        """ A resumed scan acquires exactly the points the interrupted one missed """
+        self.interrupt_after = 50
+        with self.assertRaises(AcquisitionInterrupted):
+            self._scan()
+        file_names = [name for name in os.listdir(self._tmpdir.name)
+                      if name.endswith('.pes')]
+        self.assertEqual(len(file_names), 1)
+        _, measured = self._read(file_names[0])
+        self.assertEqual(measured, set(self.acquired))
+        self.assertEqual(len(measured), 50)
+        interrupted = self.acquired
+        self.acquired = []
+        self.interrupt_after = None
+        self.assertEqual(self._scan(resume_file=file_names[0]), file_names[0])
+        self.assertEqual(len(self.acquired), self.NUM_POINTS - 50)
+        self.assertFalse(set(self.acquired) & set(interrupted))
+        counters, measured = self._read(file_names[0])
+        self.assertEqual(len(measured), self.NUM_POINTS)
+        for (hor_offset, ver_offset), counts in counters.items():
+            self.assertEqual(counts, (100, abs(hor_offset) * 10 + abs(ver_offset)))
+
+    def test_skip_measured_points(self):
+        """ Resuming a complete scan acquires nothing """
+        file_name = self._scan()
+        self.assertEqual(len(self.acquired), self.NUM_POINTS)
+        self.acquired = []
+        self._scan(resume_file=file_name)
+        self.assertEqual(self.acquired, [])
+        _, measured = self._read(file_name)
+        self.assertEqual(len(measured), self.NUM_POINTS)
+
+    def test_fresh_scan_removes_stale_bitmap(self):
+        """ A new scan doesn't pick up the bitmap of an older one of the same name """
+        file_name = self._scan()
+        self.acquired = []
+        self.assertEqual(self._scan(), file_name)
+        self.assertEqual(len(self.acquired), self.NUM_POINTS)
+        _, pes_file = self.tool.create_pes_file(self.HOR_RANGE, self.VER_RANGE)
+        pes_file.close()
+        self.assertFalse(os.path.exists(
+            os.path.join(self._tmpdir.name, file_name) + EyeScanResults.BITMAP_SUFFIX))
+
+class TestRhodiumEyeScanArgs(TestBase):
+    """
+    Test that RhodiumInitManager._rx_eyescan() converts the adaptive sweep
+    arguments, which arrive as strings from the init args
+    """
+    def _rx_eyescan(self, args):
+        """
+        Run _rx_eyescan() with a mock EyeScanTool. Returns the adaptive,
+        target_ber, coarse_factor and resume_file arguments passed to
+        eyescan_full_scan().
+        """
+        adc_regs = mock.Mock(**{'peek8.return_value': 0})
+        init_mgr = rh_init.RhodiumInitManager(mock.Mock(slot_idx=0), {'adc': adc_regs})
+        with mock.patch.object(rh_init, 'EyeScanTool') as eyescan_tool:
+            init_mgr._rx_eyescan(mock.Mock(), args)
+        return eyescan_tool.return_value.eyescan_full_scan.call_args[0][3:]
+
+    def test_string_args(self):
+        """ Strings are converted to the types eyescan_full_scan() expects """
+        self.assertEqual(
+            self._rx_eyescan({'adaptive': 'False', 'target_ber': '1e-6',
+                              'coarse_factor': '4', 'resume_file': 'foo.pes'}),
+            (False, 1e-6, 4, 'foo.pes'))
+        adaptive, target_ber, coarse_factor, _ = self._rx_eyescan(
+            {'adaptive': 'True', 'target_ber': '1e-9', 'coarse_factor': '2'})
+        self.assertIs(adaptive, True)
+        self.assertIsInstance(target_ber, float)
+        self.assertIsInstance(coarse_factor, int)
+
+    def test_absent_args(self):
+        """ Missing arguments fall back to the EyeScanTool defaults """
+        self.assertEqual(self._rx_eyescan({}), (False, None, None, None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,254 @@
+#
+# Copyright 2020 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests the RPC server's response cache, multi_call() and call statistics
+"""
+
+import sys
+import time
+import types
+import unittest
+from unittest import mock
+from base_tests import TestBase
+from usrp_mpm import rpc_server
+from usrp_mpm.mpmtypes import SharedState
+from usrp_mpm.rpc_server import MPMServer, RPCStats, no_claim, rpc_cache, rpc_invalidates
+
+class MockLog:
+    """
+    Logger which records warnings, and drops everything else
+    """
+    def __init__(self):
+        self.warnings = []
+
+    def _dummy(self, *args):
+        pass
+    trace = _dummy
+    debug = _dummy
+    info = _dummy
+    error = _dummy
+
+    def warning(self, *args):
+        self.warnings.append(args)
+
+    def getChild(self, _name):
+        return self
+
+class MockPeriphManager:
+    """
+    Periph manager with cached getters, and counters for how often they
+    were actually called
+    """
+    dboards = []
+    clear_rpc_registry_on_unclaim = False
+    FAST_TTL = 0.05 # seconds
+
+    def __init__(self, _args):
+        self.claimed = False
+        self.value = 1
+        self.value_reads = 0
+        self.fast_reads = 0
+
+    @rpc_cache()
+    def get_value(self, offset=0):
+        " Cached until set_value() is called "
+        self.value_reads += 1
+        return self.value + offset
+
+    @rpc_cache(ttl=FAST_TTL)
+    def get_fast(self):
+        " Cached for FAST_TTL seconds "
+        self.fast_reads += 1
+        return self.fast_reads
+
+    @rpc_invalidates('get_value')
+    def set_value(self, value):
+        " Change what get_value() returns "
+        self.value = value
+
+    @no_claim
+    def get_version(self):
+        " Callable without a claim "
+        return '1.0'
+
+    def fail(self):
+        " Always fails "
+        raise RuntimeError("This is just a drill")
+
+    def get_device_info(self):
+        return {}
+
+    def claim(self):
+        pass
+
+    def unclaim(self):
+        pass
+
+    def deinit(self):
+        pass
+
+    def set_connection_type(self, conn_type):
+        pass
+
+class TestRPCServer(TestBase):
+    """
+    Test the RPC server's response cache and multi_call() with a mock periph
+    manager
+    """
+    def setUp(self):
+        mock_periph_manager = types.ModuleType('usrp_mpm.periph_manager')
+        mock_periph_manager.periph_manager = MockPeriphManager
+        patches = [
+            mock.patch.dict(sys.modules, {'usrp_mpm.periph_manager': mock_periph_manager}),
+            mock.patch.object(rpc_server, 'get_main_logger', MockLog),
+            mock.patch.object(rpc_server.watchdog, 'has_watchdog', lambda: False),
+            mock.patch.object(rpc_server, '_is_connection_local', lambda host: True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.server = MPMServer(SharedState(), {})
+        self.server.client_host = '127.0.0.1'
+        self.server.client_port = 0
+        self.mgr = self.server.periph_manager
+        self.token = self.server.claim('test')
+
+    def tearDown(self):
+        self.server._timer.kill(block=False)
+
+    def test_cache_hit(self):
+        """ Repeated calls with the same arguments are served from the cache """
+        self.assertEqual(self.server.get_value(self.token), 1)
+        self.assertEqual(self.server.get_value(self.token), 1)
+        self.assertEqual(self.mgr.value_reads, 1)
+        # Different arguments are cached separately
+        self.assertEqual(self.server.get_value(self.token, 1), 2)
+        self.assertEqual(self.server.get_value(self.token, 1), 2)
+        self.assertEqual(self.mgr.value_reads, 2)
+
+    def test_ttl_expiry(self):
+        """ Responses are cached for no longer than their TTL """
+        self.assertEqual(self.server.get_fast(self.token), 1)
+        self.assertEqual(self.server.get_fast(self.token), 1)
+        time.sleep(2 * MockPeriphManager.FAST_TTL)
+        self.assertEqual(self.server.get_fast(self.token), 2)
+
+    def test_invalidate_on_setter(self):
+        """ Setters drop the cached responses of their getters """
+        self.assertEqual(self.server.get_value(self.token), 1)
+        self.server.set_value(self.token, 5)
+        self.assertEqual(self.server.get_value(self.token), 5)
+        self.assertEqual(self.mgr.value_reads, 2)
+
+    def test_invalidate_on_claim(self):
+        """ A new claim starts with an empty cache """
+        self.assertEqual(self.server.get_value(self.token), 1)
+        self.mgr.value = 3
+        self.assertEqual(self.server.get_value(self.token), 1)
+        self.assertTrue(self.server.unclaim(self.token))
+        self.token = self.server.claim('test')
+        self.assertEqual(self.server.get_value(self.token), 3)
+
+    def test_invalidate_rpc_cache(self):
+        """ invalidate_rpc_cache() drops all cached responses """
+        self.assertEqual(self.server.get_value(self.token), 1)
+        self.mgr.value = 3
+        self.server.invalidate_rpc_cache()
+        self.assertEqual(self.server.get_value(self.token), 3)
+
+    def test_multi_call_valid_token(self):
+        """ multi_call() runs all calls in order, failing ones included """
+        results = self.server.multi_call(self.token, [
+            ('set_value', [7]),
+            ('get_value', []),
+            ('fail', []),
+            ('get_value', [1]),
+            ('get_version', []),
+        ])
+        self.assertEqual(results[0], (True, None))
+        self.assertEqual(results[1], (True, 7))
+        self.assertEqual(results[2], (False, "This is just a drill"))
+        self.assertEqual(results[3], (True, 8))
+        self.assertEqual(results[4], (True, '1.0'))
+
+    def test_multi_call_invalid_token(self):
+        """ Without a valid token, only calls which need no claim succeed """
+        results = self.server.multi_call('x' * rpc_server.TOKEN_LEN, [
+            ('set_value', [7]),
+            ('get_version', []),
+            ('ping', ['foo']),
+        ])
+        self.assertEqual(results[0], (False, "Invalid token!"))
+        self.assertEqual(results[1], (True, '1.0'))
+        self.assertEqual(results[2], (True, 'foo'))
+        self.assertEqual(self.mgr.value, 1)
+
+    def test_multi_call_rejected_methods(self):
+        """ multi_call() can't be nested, and can't reach private methods """
+        results = self.server.multi_call(self.token, [
+            ('multi_call', [self.token, []]),
+            ('_unclaim', []),
+            ('no_such_method', []),
+        ])
+        for success, _ in results:
+            self.assertFalse(success)
+        self.assertTrue(self.server._check_token_valid(self.token))
+
+    def test_rpc_stats(self):
+        """ Calls and errors are counted, also when run via multi_call() """
+        self.server.get_value(self.token)
+        self.server.multi_call(self.token, [('get_value', []), ('fail', [])])
+        with self.assertRaises(RuntimeError):
+            self.server.fail(self.token)
+        stats = self.server.get_rpc_stats(reset=True)
+        self.assertEqual(stats['get_value']['calls'], 2)
+        self.assertEqual(stats['get_value']['errors'], 0)
+        self.assertEqual(stats['fail']['calls'], 2)
+        self.assertEqual(stats['fail']['errors'], 2)
+        self.assertEqual(self.server.get_rpc_stats(), {})
+
+class TestRPCStats(TestBase):
+    """
+    Test the RPCStats class
+    """
+    def test_percentiles(self):
+        """ Percentiles, mean and max of a known set of latencies """
+        stats = RPCStats(MockLog(), slow_call_threshold=1.0)
+        # Record 1 ms to 100 ms, in a shuffled order
+        for latency_ms in range(100, 0, -1):
+            stats.record('foo', latency_ms / 1000, failed=(latency_ms % 10 == 0))
+        result = stats.get()['foo']
+        self.assertEqual(result['calls'], 100)
+        self.assertEqual(result['errors'], 10)
+        self.assertAlmostEqual(result['mean'], 0.0505)
+        self.assertAlmostEqual(result['max'], 0.1)
+        self.assertAlmostEqual(result['p50'], 0.051)
+        self.assertAlmostEqual(result['p95'], 0.096)
+        self.assertAlmostEqual(result['p99'], 0.1)
+
+    def test_window(self):
+        """ Percentiles only cover the most recent WINDOW calls """
+        stats = RPCStats(MockLog(), slow_call_threshold=1.0)
+        for _ in range(RPCStats.WINDOW):
+            stats.record('foo', 0.5, failed=False)
+        for _ in range(RPCStats.WINDOW):
+            stats.record('foo', 0.001, failed=False)
+        result = stats.get()['foo']
+        self.assertEqual(result['calls'], 2 * RPCStats.WINDOW)
+        self.assertAlmostEqual(result['p99'], 0.001)
+        self.assertAlmostEqual(result['max'], 0.5)
+
+    def test_slow_calls(self):
+        """ Calls above the threshold are logged """
+        log = MockLog()
+        stats = RPCStats(log, slow_call_threshold=0.1)
+        stats.record('foo', 0.05, failed=False)
+        self.assertEqual(log.warnings, [])
+        stats.record('foo', 0.2, failed=False)
+        self.assertEqual(len(log.warnings), 1)
+
+if __name__ == '__main__':
+    unittest.main()
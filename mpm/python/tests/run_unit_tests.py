@@ -14,6 +14,8 @@ from compatnum_tests import TestCompatNum
 from sys_utils_tests import TestNet
 from mpm_utils_tests import TestMpmUtils
 from eeprom_tests import TestEeprom
+from rpc_server_tests import TestRPCServer, TestRPCStats
+from components_tests import TestComponentUpload
 from usrp_mpm import __simulated__
 
 import importlib.util
@@ -26,16 +28,32 @@ TESTS = {
         TestMpmUtils,
         TestEeprom,
         TestCompatNum,
+        TestRPCServer,
+        TestRPCStats,
+        TestComponentUpload,
     },
     'n3xx': set(),
-    'x4xx': set()
+    'x4xx': set(),
+    'sim': set(),
 }
 
 if not __simulated__:
     from components_tests import TestZynqComponents
+    from eyescan_tests import TestEyeScanAdaptive, TestEyeScanResume, \
+        TestRhodiumEyeScanArgs
+    TESTS['n3xx'].update({
+        TestEyeScanAdaptive,
+        TestEyeScanResume,
+        TestRhodiumEyeScanArgs,
+    })
     TESTS['x4xx'].update({
         TestZynqComponents
     })
+else:
+    from simulator_tests import TestMultiDeviceHost
+    TESTS['sim'].update({
+        TestMultiDeviceHost
+    })
 
 def parse_args():
     """Parse arguments when running this as a script"""
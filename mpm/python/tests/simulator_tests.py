@@ -0,0 +1,87 @@
+#
+# Copyright 2020 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests the simulator (currently MultiDeviceHost)
+"""
+
+from base_tests import TestBase
+from uhd.chdr import ChdrPacket, ChdrHeader, ChdrWidth, PacketType, MgmtPayload, \
+    MgmtHop, MgmtOp, MgmtOpCode, MgmtOpNodeInfo
+from usrp_mpm.mpmlog import get_main_logger
+from usrp_mpm.simulator.config import Config
+from usrp_mpm.simulator.device_host import MultiDeviceHost
+
+import socket
+import unittest
+
+CHDR_W = ChdrWidth.W64
+
+class TestMultiDeviceHost(TestBase):
+    """
+    Test that all devices of a MultiDeviceHost are served by its shared
+    event loop
+    """
+    BASE_PORT = 50153
+    NUM_DEVICES = 2
+    FIRST_DEVICE_ID = 5
+    CLIENT_EPID = 1
+    PROTO_VER = 0x0100
+    RECV_TIMEOUT = 2.0 # seconds
+
+    @classmethod
+    def setUpClass(cls):
+        """ Bring up the devices once, their sockets stay bound for good """
+        log = get_main_logger(use_logbuf=False)
+        configs = [Config.default() for _ in range(cls.NUM_DEVICES)]
+        cls.host = MultiDeviceHost(log, configs, base_port=cls.BASE_PORT,
+                                   first_device_id=cls.FIRST_DEVICE_ID)
+
+    def _info_request(self, port, data=None):
+        """
+        Send an xport node info request (or data, if given) to port on
+        localhost. Returns the MgmtOpNodeInfo of the response.
+        """
+        payload = MgmtPayload()
+        payload.set_header(self.CLIENT_EPID, self.PROTO_VER, CHDR_W)
+        for ops in ([MgmtOp(MgmtOpCode.INFO_REQ), MgmtOp(MgmtOpCode.RETURN)],
+                    [MgmtOp(MgmtOpCode.NOP)]):
+            hop = MgmtHop()
+            for op in ops:
+                hop.add_op(op)
+            payload.add_hop(hop)
+        header = ChdrHeader()
+        header.pkt_type = PacketType.MGMT
+        packet = ChdrPacket(CHDR_W, header, payload)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(self.RECV_TIMEOUT)
+            sock.connect(("127.0.0.1", port))
+            if data is not None:
+                sock.send(data)
+            sock.send(bytes(packet.serialize()))
+            response = ChdrPacket.deserialize(CHDR_W, sock.recv(8000))
+        self.assertEqual(response.get_header().pkt_type, PacketType.MGMT)
+        hop = response.get_payload_mgmt().get_hop(0)
+        for op_index in range(hop.get_num_ops()):
+            op = hop.get_op(op_index)
+            if op.op_code == MgmtOpCode.INFO_RESP:
+                return MgmtOpNodeInfo.parse(op.get_op_payload())
+        self.fail("Response from port {} has no node info".format(port))
+
+    def test_all_devices_respond(self):
+        """ Every device answers on its own port, with its own device id """
+        for index in range(self.NUM_DEVICES):
+            info = self._info_request(self.BASE_PORT + index)
+            self.assertEqual(info.device_id, self.FIRST_DEVICE_ID + index)
+
+    def test_malformed_packet(self):
+        """ A malformed packet to one device does not stop the event loop """
+        info = self._info_request(self.BASE_PORT, data=b"\x00")
+        self.assertEqual(info.device_id, self.FIRST_DEVICE_ID)
+        info = self._info_request(self.BASE_PORT + 1)
+        self.assertEqual(info.device_id, self.FIRST_DEVICE_ID + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,6 +32,20 @@ class TestNet(TestBase):
         expected_hostname = platform.node()
         self.assertEqual(expected_hostname, net.get_hostname())
 
+    def test_get_local_ip_addrs(self):
+        """
+        Test net.get_local_ip_addrs() returns the loopback address, that
+        the ipv4_only filter works, and that modifying the returned set
+        does not modify the cached addresses.
+        """
+        local_addrs = net.get_local_ip_addrs()
+        self.assertIn('127.0.0.1', local_addrs)
+        local_ipv4_addrs = net.get_local_ip_addrs(ipv4_only=True)
+        self.assertIn('127.0.0.1', local_ipv4_addrs)
+        self.assertTrue(all(':' not in addr for addr in local_ipv4_addrs))
+        local_addrs.clear()
+        self.assertIn('127.0.0.1', net.get_local_ip_addrs())
+
     @TestBase.skipUnlessOnUsrp()
     def test_get_valid_interfaces(self):
         """
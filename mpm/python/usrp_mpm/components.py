@@ -8,10 +8,126 @@ MPM Component management
 """
 import os
 import re
+import json
 import shutil
 import subprocess
+from hashlib import md5
 from usrp_mpm.rpc_server import no_rpc
 
+# Size of the blocks in which partial uploads are read back when resuming
+UPLOAD_READ_BLOCK_SIZE = 1024 * 1024
+
+class ComponentUpload(object):
+    """
+    A component file which is uploaded in chunks.
+
+    Chunks are written to <filename>.part as they arrive, and the MD5 hash is
+    updated incrementally, so only one chunk is held in memory at a time. The
+    metadata is stored next to it in <filename>.part.json. If an upload of the
+    same file (same component, filename, hash and size) is started again
+    while those files exist, it picks up where the previous one stopped.
+    """
+    # Metadata keys which identify an upload when resuming it
+    IDENTITY_KEYS = ('id', 'filename', 'md5', 'size')
+
+    def __init__(self, log, basepath, metadata):
+        self.log = log
+        self.metadata = metadata
+        self.id_str = metadata['id']
+        self.filepath = os.path.join(
+            basepath, os.path.basename(metadata['filename']))
+        self._part_path = self.filepath + '.part'
+        self._info_path = self.filepath + '.part.json'
+        self.size = int(metadata['size']) if 'size' in metadata else None
+        self.offset = 0
+        self._hash = md5()
+        if not os.path.isdir(basepath):
+            self.log.trace("Creating directory {}".format(basepath))
+            os.makedirs(basepath)
+        identity = {key: metadata.get(key) for key in self.IDENTITY_KEYS}
+        if self._read_info() == identity and os.path.isfile(self._part_path):
+            with open(self._part_path, 'rb') as part_file:
+                for block in iter(
+                        lambda: part_file.read(UPLOAD_READ_BLOCK_SIZE), b''):
+                    self._hash.update(block)
+                    self.offset += len(block)
+            self.log.debug("Resuming upload of component `{}' at byte {}"
+                           .format(self.id_str, self.offset))
+            self._file = open(self._part_path, 'ab')
+        else:
+            with open(self._info_path, 'w') as info_file:
+                json.dump(identity, info_file)
+            self._file = open(self._part_path, 'wb')
+
+    def _read_info(self):
+        " Return the identity of the interrupted upload, if there is one "
+        try:
+            with open(self._info_path, 'r') as info_file:
+                return json.load(info_file)
+        except (OSError, ValueError):
+            return None
+
+    def append(self, offset, data):
+        """
+        Append data, which must start at offset. Returns the offset of the
+        next chunk.
+        """
+        if offset != self.offset:
+            raise RuntimeError(
+                "Chunk for component `{}' starts at byte {}, expected byte {}"
+                .format(self.id_str, offset, self.offset))
+        if self.size is not None and self.offset + len(data) > self.size:
+            raise RuntimeError(
+                "Chunk for component `{}' exceeds the file size of {} bytes"
+                .format(self.id_str, self.size))
+        self._file.write(data)
+        self._hash.update(data)
+        self.offset += len(data)
+        return self.offset
+
+    def commit(self):
+        """
+        Check size and hash of the upload and move it to its final path. If
+        the check fails, the upload is discarded.
+        """
+        self._file.close()
+        try:
+            if self.size is not None and self.offset != self.size:
+                raise RuntimeError(
+                    "Component `{}' is incomplete: Got {} of {} bytes".format(
+                        self.id_str, self.offset, self.size))
+            comp_hash = self._hash.hexdigest()
+            if 'md5' in self.metadata:
+                if comp_hash != self.metadata['md5']:
+                    self.log.error("Component file hash mismatched:\n"
+                                   "Calculated {}\n"
+                                   "Given      {}\n".format(
+                                       comp_hash, self.metadata['md5']))
+                    raise RuntimeError("Component file hash mismatch")
+                self.log.trace("Component file hash matched: {}".format(
+                    comp_hash
+                ))
+        except RuntimeError:
+            self.abort()
+            raise
+        os.replace(self._part_path, self.filepath)
+        os.remove(self._info_path)
+
+    def abort(self):
+        """
+        Discard the upload, including any data written so far
+        """
+        self._file.close()
+        for path in (self._part_path, self._info_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        """
+        Stop writing to the upload, but keep it around so it can be resumed
+        """
+        self._file.close()
+
 
 class ZynqComponents(object):
     """
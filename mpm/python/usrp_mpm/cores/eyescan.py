@@ -122,6 +122,24 @@ Using the Eye Scan tool:
        ver_range  = {'start':-127, 'stop':127, 'step': 2}
        pes_file_name = eyescan_tool.eyescan_full_scan(scan_lanes, hor_range, ver_range)
 
+     The results are written to the PES file as they are acquired, and the points
+     already measured are tracked in a "<pes_file_name>.done" file next to it. If a
+     scan is interrupted, it can be resumed by passing the name of its PES file as
+     resume_file, along with the same configuration, lanes and ranges:
+       eyescan_tool.eyescan_full_scan(scan_lanes, hor_range, ver_range,
+                                      resume_file=pes_file_name)
+     See EyeScanResults for how to read partial results while a scan is running.
+
+     To speed up the scan, pass adaptive=True. Only a coarse grid and the coordinates
+     close to the eye boundary are then acquired (see eyescan_adaptive_sweep()):
+       pes_file_name = eyescan_tool.eyescan_full_scan(scan_lanes, hor_range, ver_range,
+                                                      adaptive=True)
+     The PES file still holds counters for every coordinate, but for all coordinates
+     that were not acquired, these are COPIED from the nearest acquired coordinate on
+     the coarse grid. They are not measurements, which matters when post-processing
+     the results. Only acquired coordinates are marked in the "<pes_file_name>.done"
+     file, so it tells the two apart.
+
   7. Process and visualize the PES file.
      The resulting .pes binary file must be manually copied to a known location for
      LabVIEW access (i.e. a Windows machine running LV).
@@ -166,15 +184,158 @@ Future work ideas:
 """
 
 import os
+import sys
 import time
 import math
+import mmap
 import datetime
 from builtins import object
 from usrp_mpm.mpmlog import get_logger
 
+def _le16(value):
+    " Convert a 16-bit value between host and little-endian byte order "
+    if sys.byteorder == 'little':
+        return value
+    return ((value & 0xFF) << 8) | (value >> 8)
+
+class EyeScanResults(object):
+    """
+    Memory-mapped storage for the counters of an eye scan sweep.
+
+    The counters are mapped straight from the data section of a .pes file (see
+    EyeScanTool.eyescan_sweep()), which is extended to its final size up front.
+    Every offset coordinate of the sweep is a "point", numbered in sweep order
+    (vertical offset in the inner loop).
+
+    Which points were actually measured is tracked in a completion bitmap, which
+    is mapped from a sidecar file next to the .pes file (same name plus
+    BITMAP_SUFFIX). Bit (point % 8) of byte (point // 8) is set once the counters
+    of that point have been stored. Counters are always stored before their bit
+    is set, so both files can be read while a sweep is still running, and a sweep
+    that was interrupted can be resumed by skipping all points marked as measured.
+    Points filled by an adaptive sweep hold copied counters (see copy_point()), and
+    are never marked as measured.
+    """
+    BITMAP_SUFFIX = ".done"
+
+    def __init__(self, parsed_ranges, num_lanes, eq_mode, pes_file):
+        """
+        pes_file is the .pes file, opened for reading and writing, with its file
+        pointer at the start of the data section.
+        """
+        self.hor_start = parsed_ranges['hor_start']
+        self.hor_step = parsed_ranges['hor_step']
+        self.hor_iterations = parsed_ranges['hor_iterations']
+        self.ver_start = parsed_ranges['ver_start']
+        self.ver_step = parsed_ranges['ver_step']
+        self.ver_iterations = parsed_ranges['ver_iterations']
+        self.num_points = self.hor_iterations * self.ver_iterations
+        self.num_lanes = num_lanes
+        # sample_count and error_count for +UT, and for -UT in DFE mode
+        self.words_per_lane = 4 if eq_mode == 'DFE' else 2
+        self.words_per_point = self.words_per_lane * num_lanes
+        data_offset = pes_file.tell()
+        data_size = 2 * self.num_points * self.words_per_point
+        self._pes_map = self._map_file(pes_file.name, data_offset + data_size)
+        self.measured = self._map_file(pes_file.name + self.BITMAP_SUFFIX,
+                                       (self.num_points + 7) // 8)
+        self.data = memoryview(self._pes_map)[data_offset:].cast('H')
+
+    @staticmethod
+    def _map_file(path, size):
+        " Map the first size bytes of path, creating or extending it as needed "
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            return mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def point(self, hor_idx, ver_idx):
+        """
+        Return the point number of the hor_idx-th horizontal and ver_idx-th
+        vertical offset.
+        """
+        return hor_idx * self.ver_iterations + ver_idx
+
+    def get_offsets(self, point):
+        """
+        Return the (hor_offset, ver_offset) tuple of a point.
+        """
+        hor_idx, ver_idx = divmod(point, self.ver_iterations)
+        return (self.hor_start + hor_idx * self.hor_step,
+                self.ver_start + ver_idx * self.ver_step)
+
+    def set_counters(self, point, lane_counters):
+        """
+        Store the acquisition counters of a point, and mark it as measured.
+        lane_counters has one entry per lane, as returned by
+        EyeScanTool.eyescan_acquisition().
+        """
+        index = point * self.words_per_point
+        for sl_counters in lane_counters:
+            for ut_sign in ('+UT', '-UT')[:self.words_per_lane // 2]:
+                self.data[index] = _le16(sl_counters[ut_sign]['sample_count'])
+                self.data[index + 1] = _le16(sl_counters[ut_sign]['error_count'])
+                index += 2
+        self.measured[point >> 3] |= 1 << (point & 7)
+
+    def get_lane_counts(self, point):
+        """
+        Return a list with a (sample_count, error_count) tuple per lane for a
+        point, summed up over +UT and -UT.
+        """
+        index = point * self.words_per_point
+        words = [_le16(word) for word in self.data[index:index + self.words_per_point]]
+        return [(sum(words[lane_index:lane_index + self.words_per_lane:2]),
+                 sum(words[lane_index + 1:lane_index + self.words_per_lane:2]))
+                for lane_index in range(0, self.words_per_point, self.words_per_lane)]
+
+    def copy_point(self, dst_point, src_point):
+        """
+        Copy the counters of src_point to dst_point, without marking it as
+        measured.
+        """
+        dst = dst_point * self.words_per_point
+        src = src_point * self.words_per_point
+        self.data[dst:dst + self.words_per_point] = \
+            self.data[src:src + self.words_per_point]
+
+    def is_measured(self, point):
+        """
+        Return True if point was measured.
+        """
+        return bool(self.measured[point >> 3] & (1 << (point & 7)))
+
+    def num_measured(self):
+        """
+        Return the number of measured points.
+        """
+        return sum(bin(byte).count('1') for byte in self.measured[:])
+
+    def flush(self):
+        """
+        Write the counters, and then the completion bitmap, back to disk.
+        """
+        self._pes_map.flush()
+        self.measured.flush()
+
+    def close(self):
+        """
+        Flush and unmap both files.
+        """
+        self.flush()
+        self.data.release()
+        self._pes_map.close()
+        self.measured.close()
+
 class EyeScanTool(object):
     """
     Provides a library to perform Eye Scan measurements using the NI JESD core.
+
+    Note that an adaptive sweep (see eyescan_adaptive_sweep()) does not measure all
+    offset coordinates. The others hold counters copied from an acquired coordinate.
     """
 
     MGT_TYPE  = "GTX"
@@ -185,6 +346,13 @@ class EyeScanTool(object):
     # Set this value according to the status message printing rate desired. (Min=1)
     # E.g. PRINT_STATUS_EVERY = 1 will print a status message every offset measurement.
     PRINT_STATUS_EVERY = 10
+    # Number of acquisitions after which the results are flushed to disk.
+    CHECKPOINT_EVERY = 100
+
+    # Defaults for adaptive sweeps (see eyescan_adaptive_sweep()): The BER that
+    # defines the eye boundary, and the coarse grid spacing in steps.
+    ADAPTIVE_TARGET_BER = 1e-6
+    ADAPTIVE_COARSE_FACTOR = 4
 
     lanes = None
     # Array that defines the available lanes to measure.
@@ -634,12 +802,13 @@ class EyeScanTool(object):
         return acq_counters
 
 
-    def eyescan_sweep(self, bin_file, parsed_ranges):
+    def eyescan_sweep(self, bin_file, parsed_ranges, adaptive=False,
+                      target_ber=None, coarse_factor=None):
         """
         Performs Eye Scan "measurement loop" (error counting) acquisitions across the
         given phase and voltage offset ranges.
 
-        This function creates a binary file containing the sweep results.
+        This function writes the sweep results to a binary file.
           The binary file is a set of bytes, where file[position] represents a byte
           (8-bit) at the given position. The bytes are saved as follows:
 
@@ -648,73 +817,168 @@ class EyeScanTool(object):
             file[offset + 4*lanes*i + 4*curr_lane + 2] =  error_count[15:0] (+UT) (ith acquisition)
 
           If eq_mode = 'DFE'...
-            file[offset + 4*lanes*(i*2 + 0) + 4*curr_lane + 0] = sample_count[15:0] (+UT) (ith acquisition)
-            file[offset + 4*lanes*(i*2 + 0) + 4*curr_lane + 2] =  error_count[15:0] (+UT) (ith acquisition)
-            file[offset + 4*lanes*(i*2 + 1) + 4*curr_lane + 0] = sample_count[15:0] (-UT) (ith acquisition)
-            file[offset + 4*lanes*(i*2 + 1) + 4*curr_lane + 2] =  error_count[15:0] (-UT) (ith acquisition)
+            file[offset + 8*lanes*i + 8*curr_lane + 0] = sample_count[15:0] (+UT) (ith acquisition)
+            file[offset + 8*lanes*i + 8*curr_lane + 2] =  error_count[15:0] (+UT) (ith acquisition)
+            file[offset + 8*lanes*i + 8*curr_lane + 4] = sample_count[15:0] (-UT) (ith acquisition)
+            file[offset + 8*lanes*i + 8*curr_lane + 6] =  error_count[15:0] (-UT) (ith acquisition)
 
           Where,
             i         -> single acquisition iteration number, ranging from 0 to
-                         (hor_iterations * ver_iterations - 1).
+                         (hor_iterations * ver_iterations - 1). The vertical offset
+                         is iterated in the inner loop.
             offset    -> set offset for metadata to be stored at the beginning of
                          the binary file.
             lanes     -> total number of lanes to be scanned. Defined as len(self.lanes).
-            curr_lane -> a given lane number. It should be any value in the lanes array.
+            curr_lane -> index of a given lane number in the lanes array.
+
+          The data section is memory-mapped (see EyeScanResults), so every acquisition
+          lands in the file right away. Points that are already marked as measured in
+          the completion bitmap are skipped, which resumes an interrupted sweep.
 
         Parameters:
-          bin_file      -> Binary file reference to write data to. Passed from top level function.
+          bin_file      -> Binary file reference to write data to, opened for reading
+                           and writing and positioned at the data offset. Passed from
+                           top level function.
           parsed_ranges -> This is a keyed list with parsed parameters from parse_ranges().
+          adaptive      -> If True, run an adaptive sweep (see eyescan_adaptive_sweep())
+                           instead of acquiring every offset coordinate.
+          target_ber    -> BER threshold for the adaptive sweep.
+                           Defaults to ADAPTIVE_TARGET_BER.
+          coarse_factor -> Coarse grid spacing for the adaptive sweep, in steps.
+                           Defaults to ADAPTIVE_COARSE_FACTOR.
+        """
+        results = EyeScanResults(parsed_ranges, len(self.lanes), self.eq_mode, bin_file)
+        try:
+            num_measured = results.num_measured()
+            if num_measured:
+                self.log.info("Resuming Eye Scan: %d of %d coordinates already acquired.",
+                              num_measured, results.num_points)
+            if adaptive:
+                self.eyescan_adaptive_sweep(
+                    results,
+                    target_ber or self.ADAPTIVE_TARGET_BER,
+                    coarse_factor or self.ADAPTIVE_COARSE_FACTOR)
+            else:
+                self._eyescan_measure_points(results, range(results.num_points))
+        finally:
+            results.close()
+
+
+    def eyescan_adaptive_sweep(self, results, target_ber, coarse_factor):
+        """
+        Fills results with an adaptive sweep, which only acquires the offset
+        coordinates close to the eye boundary:
+
+          1. Acquire a coarse grid, made of every coarse_factor-th coordinate (plus
+             the last one) on both axes.
+          2. For every cell of the coarse grid, compare its four corners. A corner is
+             "open" for a lane if the lane's BER there is below target_ber. If any
+             lane has open and closed corners, the boundary runs through the cell,
+             and all of its coordinates are acquired.
+          3. All other coordinates are filled with the counters of the nearest corner
+             of their cell.
+
+        The .pes file format is unchanged, but filled coordinates hold copied
+        counters rather than measurements. They are not marked as measured in the
+        completion bitmap (see EyeScanResults), which is the only way to tell them
+        apart in the results.
+
+        Parameters:
+          results       -> An EyeScanResults object.
+          target_ber    -> BER threshold that defines the eye boundary.
+          coarse_factor -> Coarse grid spacing, in steps.
+        """
+        assert coarse_factor >= 1
+        hor_iterations = results.hor_iterations
+        ver_iterations = results.ver_iterations
+        def grid(iterations):
+            " Return the coarse grid indices of an axis "
+            return sorted(set(range(0, iterations, coarse_factor)) | {iterations - 1})
+        hor_grid = grid(hor_iterations)
+        ver_grid = grid(ver_iterations)
+        self.log.info("Adaptive Eye Scan: acquiring %d x %d coarse grid...",
+                      len(hor_grid), len(ver_grid))
+        self._eyescan_measure_points(
+            results,
+            [results.point(hor_idx, ver_idx) for hor_idx in hor_grid for ver_idx in ver_grid])
+        # Number of sampled bits per unit of the sample counter (see UG476).
+        bits_per_count = self.rx_int_datawidth * 2 ** (1 + self.prescale)
+        def open_lanes(point):
+            " Return a tuple with a bool per lane, True where the BER is below target "
+            return tuple(
+                errors < target_ber * samples * bits_per_count
+                for samples, errors in results.get_lane_counts(point))
+        # Cells of the coarse grid, as (hor_lo, hor_hi, ver_lo, ver_hi) indices
+        cells = [(hor_lo, hor_hi, ver_lo, ver_hi)
+                 for hor_lo, hor_hi in zip(hor_grid, hor_grid[1:] or hor_grid)
+                 for ver_lo, ver_hi in zip(ver_grid, ver_grid[1:] or ver_grid)]
+        refine_points = []
+        for hor_lo, hor_hi, ver_lo, ver_hi in cells:
+            corners = {open_lanes(results.point(hor_idx, ver_idx))
+                       for hor_idx in (hor_lo, hor_hi) for ver_idx in (ver_lo, ver_hi)}
+            if len(corners) > 1:
+                refine_points.extend(
+                    results.point(hor_idx, ver_idx)
+                    for hor_idx in range(hor_lo, hor_hi + 1)
+                    for ver_idx in range(ver_lo, ver_hi + 1)
+                    if not results.is_measured(results.point(hor_idx, ver_idx)))
+        refine_points = sorted(set(refine_points))
+        self.log.info("Adaptive Eye Scan: refining %d of %d remaining coordinates...",
+                      len(refine_points), results.num_points - results.num_measured())
+        self._eyescan_measure_points(results, refine_points)
+        # Fill everything else from the nearest corner of its coarse cell.
+        for hor_lo, hor_hi, ver_lo, ver_hi in cells:
+            for hor_idx in range(hor_lo, hor_hi + 1):
+                for ver_idx in range(ver_lo, ver_hi + 1):
+                    point = results.point(hor_idx, ver_idx)
+                    if results.is_measured(point):
+                        continue
+                    results.copy_point(point, results.point(
+                        hor_lo if hor_idx - hor_lo <= hor_hi - hor_idx else hor_hi,
+                        ver_lo if ver_idx - ver_lo <= ver_hi - ver_idx else ver_hi))
+        self.log.info("Adaptive Eye Scan: %d of %d coordinates hold counters copied from "
+                      "the coarse grid, not measurements. Only measured coordinates are "
+                      "marked in the %s file.",
+                      results.num_points - results.num_measured(), results.num_points,
+                      EyeScanResults.BITMAP_SUFFIX)
+
+
+    def _eyescan_measure_points(self, results, points):
+        """
+        Acquire the given points (indices into results, see EyeScanResults.point()) in
+        order, and store their counters in results. Points that were already measured
+        are skipped.
         """
-        def write_byte_counters(acq_counters):
-            """
-            This method writes the acquisition counters for each lane to the binary file.
-            """
-            # Write the sample and error counters for all given lanes.
-            for current_lane in self.lanes:
-                # Write the counters for the current lane.
-                sl_counters = acq_counters[current_lane]
-                self.log.debug("Writing +UT counters for GT #{0}: {1}"
-                               .format(current_lane, sl_counters))
-                byte_number = (sl_counters['+UT']['sample_count']).to_bytes(2, 'little')
-                bin_file.write(byte_number)
-                byte_number = (sl_counters['+UT']['error_count' ]).to_bytes(2, 'little')
-                bin_file.write(byte_number)
-                # -UT results only exists when DFE eq. mode is used.
-                if '-UT' in sl_counters:
-                    self.log.debug("Writing -UT counters for GT #%d...", current_lane)
-                    byte_number = (sl_counters['-UT']['sample_count']).to_bytes(2, 'little')
-                    bin_file.write(byte_number)
-                    byte_number = (sl_counters['-UT']['error_count' ]).to_bytes(2, 'little')
-                    bin_file.write(byte_number)
-        #
         gts_string = "GTs {}".format(self.lanes)
         self.log.trace("Starting sweep for %s ...", gts_string)
-        # Perform the Eye Scan sweep!
-        acq_counters = []
-        total_iterations = parsed_ranges['hor_iterations'] * parsed_ranges['ver_iterations']
+        points = [point for point in points if not results.is_measured(point)]
+        total_iterations = len(points)
         iterations = 0
-        # Outer loop iterates horizontally.
-        for hor_offset in range(parsed_ranges['hor_start'], parsed_ranges['hor_stop'] + 1,
-                                parsed_ranges['hor_step']):
-            # Inner loop iterates vertically.
-            for ver_offset in range(parsed_ranges['ver_start'], parsed_ranges['ver_stop'] + 1,
-                                    parsed_ranges['ver_step']):
-                # Perform a single acquisition at each "coordinate".
-                acq_counters = self.eyescan_acquisition(hor_offset, ver_offset)
-                # Write the data to a binary file.
-                write_byte_counters(acq_counters)
-                # Report Eye Scan progress.
-                iterations += 1
-                progress = iterations / total_iterations * 100
-                # Only print status messages every PRINT_STATUS_EVERY iterations.
-                if iterations % self.PRINT_STATUS_EVERY == 0:
-                    self.log.info("Eye Scan progress for %s sweep: %.2f %%", gts_string, progress)
-
-
-    def create_pes_file(self, hor_range, ver_range):
+        for point in points:
+            hor_offset, ver_offset = results.get_offsets(point)
+            # Perform a single acquisition at each "coordinate".
+            acq_counters = self.eyescan_acquisition(hor_offset, ver_offset)
+            results.set_counters(point, [acq_counters[lane] for lane in self.lanes])
+            # Report Eye Scan progress.
+            iterations += 1
+            progress = iterations / total_iterations * 100
+            # Only print status messages every PRINT_STATUS_EVERY iterations.
+            if iterations % self.PRINT_STATUS_EVERY == 0:
+                self.log.info("Eye Scan progress for %s sweep: %.2f %%", gts_string, progress)
+            if iterations % self.CHECKPOINT_EVERY == 0:
+                results.flush()
+        results.flush()
+
+
+    def create_pes_file(self, hor_range, ver_range, resume_file=None):
         """
         This function creates a .pes file and writes the metadata header.
-        The file object is returned.
+        The file name and the file object, opened for reading and writing and
+        positioned at the data offset, are returned.
+
+        If resume_file is given, that existing .pes file (in SAVE_DIR) is opened
+        instead. Its header must match the one this function would write, i.e. it
+        must have been created with the same configuration, lanes and ranges.
 
           0x00 -> 0x0F : "PythonEyeScanXpY" [16 bytes] (X -> Major, Y -> Minor)
           --- Data offset ---
@@ -759,25 +1023,18 @@ class EyeScanTool(object):
         #
         def write_byte_number(number=0, size=2, offset=None):
             """
-            This function writes a number as bytes in the binary file.
-            When an offset is given, the data is written at that address, leaving the
-            pointer there.
+            This function writes a number as bytes in the header.
+            When an offset is given, the data is written at that address.
             """
-            if offset:
-                pes_file.seek(offset)
             byte_number = (number).to_bytes(size, 'little', signed=True)
-            pes_file.write(byte_number)
+            if offset:
+                header[offset:offset + size] = byte_number
+            else:
+                header.extend(byte_number)
         #
-        # Create the directory to save the pes files if it does not exist.
-        if not os.path.isdir(self.SAVE_DIR):
-            self.log.trace("Creating directory: {}".format(self.SAVE_DIR))
-            os.makedirs(self.SAVE_DIR)
-        # Open the binary file which data will be saved to.
-        file_name = build_file_name()
-        pes_file  = open(self.SAVE_DIR + file_name, "wb+")
-        # Write the metadata header.
-        byte_string = ("PythonEyeScan"+self.VER_MAJOR+"p"+self.VER_MINOR).encode('utf-8')
-        pes_file.write(byte_string)                                # 0x00: signature string.
+        # Build the metadata header.
+        signature = "PythonEyeScan"+self.VER_MAJOR+"p"+self.VER_MINOR
+        header = bytearray(signature.encode('utf-8'))              # 0x00: signature string.
         write_byte_number(number=0x0000)                           # 0x10: data_offset (placeholder).
         write_byte_number(number=self.prescale)                    # 0x12: prescale.
         write_byte_number(number=self.rxout_div)                   # 0x14: rxout_div.
@@ -794,10 +1051,31 @@ class EyeScanTool(object):
         for lane_index in range(0, len(self.lanes)):
             nibble |= (self.lanes[lane_index] & 0xF) << lane_index*4
         write_byte_number(number=nibble)                          # 0x28: lane_num array.
-        # Write data offset and set pointer ready for data writing.
-        data_offset = pes_file.tell()
-        write_byte_number(number=data_offset, offset=0x10)
-        pes_file.seek(data_offset)
+        # Fill in the data offset.
+        write_byte_number(number=len(header), offset=0x10)
+        if resume_file:
+            # Reopen the existing binary file, leaving the pointer at the data offset.
+            file_name = resume_file
+            pes_file = open(self.SAVE_DIR + file_name, "rb+")
+            if pes_file.read(len(header)) != header:
+                pes_file.close()
+                raise RuntimeError(
+                    "Cannot resume eye scan from {}: It was created with a different "
+                    "configuration, lanes or ranges.".format(file_name))
+            self.log.info("Resuming eye scan in {}".format(file_name))
+            return (file_name, pes_file)
+        # Create the directory to save the pes files if it does not exist.
+        if not os.path.isdir(self.SAVE_DIR):
+            self.log.trace("Creating directory: {}".format(self.SAVE_DIR))
+            os.makedirs(self.SAVE_DIR)
+        # Open the binary file which data will be saved to, and drop any completion
+        # bitmap left behind by an older scan of the same name.
+        file_name = build_file_name()
+        pes_file  = open(self.SAVE_DIR + file_name, "wb+")
+        if os.path.exists(pes_file.name + EyeScanResults.BITMAP_SUFFIX):
+            os.remove(pes_file.name + EyeScanResults.BITMAP_SUFFIX)
+        # Write the metadata header, leaving the pointer ready for data writing.
+        pes_file.write(header)
         # Return the opened file.
         return (file_name, pes_file)
 
@@ -805,7 +1083,11 @@ class EyeScanTool(object):
     def eyescan_full_scan(self,
                           scan_lanes=[0],
                           hor_range={'start':-32 , 'stop':32 , 'step': 1},
-                          ver_range={'start':-127, 'stop':127, 'step': 2}):
+                          ver_range={'start':-127, 'stop':127, 'step': 2},
+                          adaptive=False,
+                          target_ber=None,
+                          coarse_factor=None,
+                          resume_file=None):
         """
         This function performs all the GT configuration and starts the eye scan sweep.
         The binary file should be open here.
@@ -823,17 +1105,26 @@ class EyeScanTool(object):
                           'start' -> Defines the first point of the range. [-127,127].
                           'stop'  -> Defines the last point of the range. [-127,127].
                           'step'  -> Defines the step at which the range is iterated. [1,2,4,8].
+          adaptive   -> If True, only acquire the coordinates close to the eye boundary.
+                        See eyescan_adaptive_sweep().
+          target_ber -> BER threshold for the adaptive sweep.
+          coarse_factor -> Coarse grid spacing (in steps) for the adaptive sweep.
+          resume_file -> Name of the .pes file of an interrupted scan to resume, as
+                         returned by an earlier call. The scan must use the same
+                         configuration, lanes and ranges.
         """
         # Set the global lanes variable that defines which lanes will be scanned.
         self.lanes = scan_lanes
         # Extract the needed parameters from the given ranges.
         parsed_ranges = self.parse_ranges(hor_range, ver_range)
         # Create the .pes binary file.
-        file_name, pes_file = self.create_pes_file(hor_range, ver_range)
-        # Configure the requested lanes.
-        self.eyescan_config()
-        # Perform the sweep on the requested lanes.
-        self.eyescan_sweep(pes_file, parsed_ranges)
-        # Close the binary file.
-        pes_file.close()
+        file_name, pes_file = self.create_pes_file(hor_range, ver_range, resume_file)
+        try:
+            # Configure the requested lanes.
+            self.eyescan_config()
+            # Perform the sweep on the requested lanes.
+            self.eyescan_sweep(pes_file, parsed_ranges, adaptive, target_ber, coarse_factor)
+        finally:
+            # Close the binary file.
+            pes_file.close()
         return file_name
@@ -9,6 +9,7 @@ TDC clock synchronization
 
 import time
 import math
+from array import array
 from fractions import gcd
 from functools import reduce
 from builtins import object
@@ -46,6 +47,9 @@ class ClockSynchronizer(object):
     SYNC_REVISION            = 0x104
     SYNC_OLDESTCOMPAT        = 0x108
     SYNC_SCRATCH             = 0x10C
+    # Registers read for every TDC measurement, in this order. Reading
+    # SP_OFFSET_1 latches the other ones, see _read_tdc_meas().
+    TDC_MEAS_REGS = (SP_OFFSET_1, SP_OFFSET_0, RP_OFFSET_1, RP_OFFSET_0)
 
     def __init__(
             self,
@@ -67,6 +71,12 @@ class ClockSynchronizer(object):
         self.slot_idx = slot_idx
         self.peek32 = lambda addr: self._iface.peek32(addr + offset)
         self.poke32 = lambda addr, data: self._iface.poke32(addr + offset, data)
+        # If the regs iface can read a list of addresses in one call (like
+        # UIO), all measurements of a run are read with a single call
+        self._tdc_meas_addrs = None
+        if hasattr(self._iface, 'peek32_gather'):
+            self._tdc_meas_addrs = array(
+                'I', [reg + offset for reg in self.TDC_MEAS_REGS])
         self.lmk = lmk
         self.phase_dac = phase_dac
         self.radio_clk_freq = radio_clk_freq
@@ -398,25 +408,23 @@ class ClockSynchronizer(object):
             self.log.error("TDC is not configured prior to requesting measurements!")
             raise RuntimeError("TDC is not configured prior to requesting measurements!")
 
-        measure_offset = lambda: self._read_tdc_meas(
-            self.meas_clk_freq, self.ref_clk_freq, self.radio_clk_freq
-        )
-
         # Retrieve the measurements.
         tdc_start_time = time.time()
         self.log.trace("Reading {} TDC measurements from device...".format(num_meas))
-        measurements = [measure_offset() for _ in range(num_meas)]
+        measurements = self._read_tdc_meas_block(num_meas)
 
         # All the measurements taken in a single run should be nearly identical. The
         # expected max delta between all measurements (from accuracy calculations)
-        # is 1 ns. Take the average of the measurements and then compare each value mean
-        # to see if it fits this criteria.
+        # is 1 ns. Take the average of the measurements and then check that the
+        # extreme values are within the tolerated skew of it.
         current_value = mean(measurements)
+        min_meas = min(measurements)
+        max_meas = max(measurements)
 
         max_skew = 0.5e-9 # 500 ps of tolerated skew either direction
-        meas_err = bool(sum([x < current_value-max_skew for x in measurements])) or \
-                   bool(sum([x > current_value+max_skew for x in measurements]))
-        meas_range = max(measurements) - min(measurements)
+        meas_err = min_meas < current_value-max_skew or \
+                   max_meas > current_value+max_skew
+        meas_range = max_meas - min_meas
 
         self.log.trace("TDC Measurements Collected! Average = {:.3f} ns. "
                        "Range: {:.3f} ns".format(current_value*1e9, meas_range*1e9))
@@ -492,6 +500,61 @@ class ClockSynchronizer(object):
         """
         Return the offset (in seconds) from the SP to the RP.
         """
+        sp_offset_msb = self._wait_for_tdc_meas()
+
+        # CRITICAL: These register values are locked when SP_OFFSET_1 is read and
+        # reloaded when SP_OFFSET_1 is read again, to keep one value from updating before
+        # the other. The SP and RP measurements are only meaningful when compared to one
+        # another from the same TDC run.
+        sp_offset_lsb = self.peek32(self.SP_OFFSET_0)
+        rp_offset_msb = self.peek32(self.RP_OFFSET_1)
+        rp_offset_lsb = self.peek32(self.RP_OFFSET_0)
+        return self._tdc_meas_to_offset(
+            sp_offset_msb, sp_offset_lsb, rp_offset_msb, rp_offset_lsb,
+            meas_clk_freq, ref_clk_freq, radio_clk_freq)
+
+
+    def _read_tdc_meas_block(self, num_meas):
+        """
+        Return a list of num_meas offsets (in seconds) from the SP to the RP.
+
+        If the regs iface supports it, the raw offset registers of all
+        measurements are read with a single peek32_gather() call, reading
+        SP_OFFSET_1 first for every measurement just like _read_tdc_meas()
+        does. Otherwise, this falls back to calling _read_tdc_meas() num_meas
+        times.
+
+        Either way, the measurements are read back to back, without waiting
+        for the TDC in between. Every read of SP_OFFSET_1 latches the offsets
+        of the most recent TDC run, so consecutive measurements may report the
+        same run. All of them have to be within the tolerated skew regardless,
+        see measure().
+        """
+        if self._tdc_meas_addrs is None:
+            return [self._read_tdc_meas(
+                self.meas_clk_freq, self.ref_clk_freq, self.radio_clk_freq
+            ) for _ in range(num_meas)]
+        self._wait_for_tdc_meas()
+        words = self._iface.peek32_gather(self._tdc_meas_addrs * num_meas)
+        # The offsets stay valid once the first run completed, so this is only
+        # a sanity check
+        if not all(sp_offset_msb & 0x100 for sp_offset_msb in words[0::4]):
+            error_msg = "TDC offsets became invalid while reading measurements."
+            self.log.error(error_msg)
+            raise RuntimeError(error_msg)
+        return [
+            self._tdc_meas_to_offset(
+                sp_offset_msb, sp_offset_lsb, rp_offset_msb, rp_offset_lsb,
+                self.meas_clk_freq, self.ref_clk_freq, self.radio_clk_freq)
+            for sp_offset_msb, sp_offset_lsb, rp_offset_msb, rp_offset_lsb
+            in zip(words[0::4], words[1::4], words[2::4], words[3::4])
+        ]
+
+
+    def _wait_for_tdc_meas(self):
+        """
+        Wait until the TDC offsets are valid. Returns the value of SP_OFFSET_1.
+        """
         # Current worst-case time given a 40kHz pulse rate and 2^17 measurements for
         # the period average operation is ~3.28 s... Round up to 5.0 s. This value is
         # only for the first measurement to appear... subsequent repeat runs should be
@@ -500,20 +563,27 @@ class ClockSynchronizer(object):
         while True:
             sp_offset_msb = self.peek32(self.SP_OFFSET_1)
             if sp_offset_msb & 0x100 == 0x100:
-                break
+                return sp_offset_msb
             if time.time() > timeout:
                 error_msg = "Offsets failed to update within timeout."
                 self.log.error(error_msg)
                 raise RuntimeError(error_msg)
 
-        # CRITICAL: These register values are locked when SP_OFFSET_1 is read and
-        # reloaded when SP_OFFSET_1 is read again, to keep one value from updating before
-        # the other. The SP and RP measurements are only meaningful when compared to one
-        # another from the same TDC run.
-        sp_offset_lsb = self.peek32(self.SP_OFFSET_0)
-        rp_offset_msb = self.peek32(self.RP_OFFSET_1)
-        rp_offset_lsb = self.peek32(self.RP_OFFSET_0)
 
+    @staticmethod
+    def _tdc_meas_to_offset(
+            sp_offset_msb,
+            sp_offset_lsb,
+            rp_offset_msb,
+            rp_offset_lsb,
+            meas_clk_freq,
+            ref_clk_freq,
+            radio_clk_freq,
+        ):
+        """
+        Convert the raw TDC offset register values of one measurement to the
+        offset (in seconds) from the SP to the RP.
+        """
         sp_offset = (sp_offset_msb & 0xFF) << 32
         sp_offset = (sp_offset | sp_offset_lsb)
         rp_offset = (rp_offset_msb & 0xFF) << 32
@@ -8,6 +8,7 @@ dboard base implementation module
 """
 
 from builtins import object
+from functools import partial
 from six import iteritems
 from usrp_mpm.mpmlog import get_logger
 from usrp_mpm.mpmutils import to_native_str
@@ -31,11 +32,17 @@ class DboardManagerBase(object):
     rx_sensor_callback_map = {}
     # See PeriphManager.mboard_sensor_callback_map for a description.
     tx_sensor_callback_map = {}
+    # See PeriphManager.mboard_sensor_sample_intervals for a description. This
+    # applies to both RX and TX sensors.
+    sensor_sample_intervals = {}
     # A dictionary that maps chips or components to chip selects for SPI.
     # If this is given, a dictionary called self._spi_nodes is created which
     # maps these keys to actual spidev paths. Also throws a warning/error if
     # the SPI configuration is invalid.
     spi_chipselect = {}
+    # The background sensor sampler. This is set by the PeriphManager if
+    # sampling is enabled, otherwise sensors are read directly.
+    _sensor_sampler = None
     ### End of overridables #################################################
 
     def __init__(self, slot_idx, **kwargs):
@@ -173,7 +180,12 @@ class DboardManagerBase(object):
             )
             self.log.error(error_msg)
             raise RuntimeError(error_msg)
-        return getattr(
-            self, callback_map.get(sensor_name)
-        )(chan)
+        read_func = getattr(self, callback_map.get(sensor_name))
+        if self._sensor_sampler is not None \
+                and not self._sensor_sampler.is_direct_read(sensor_name):
+            return self._sensor_sampler.get(
+                ('db', self.slot_idx, direction.lower(), sensor_name, chan),
+                partial(read_func, chan),
+                self.sensor_sample_intervals.get(sensor_name))
+        return read_func(chan)
 
@@ -16,6 +16,7 @@ from usrp_mpm.dboard_manager.mg_init import MagnesiumInitManager
 from usrp_mpm.dboard_manager.mg_periphs import DboardClockControl
 from usrp_mpm.cores import nijesdcore
 from usrp_mpm.mpmlog import get_logger
+from usrp_mpm.rpc_server import rpc_invalidates
 from usrp_mpm.sys_utils.uio import open_uio
 from usrp_mpm.user_eeprom import BfrfsEEPROM
 from usrp_mpm.mpmutils import async_exec
@@ -360,6 +361,7 @@ class Magnesium(BfrfsEEPROM, DboardManagerBase):
         # self.master_clock_rate is now OK again
 
 
+    @rpc_invalidates('clocks')
     def set_master_clock_rate(self, rate):
         """
         Set the master clock rate to rate. Note this will trigger a
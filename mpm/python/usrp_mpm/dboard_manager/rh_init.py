@@ -15,6 +15,7 @@ from usrp_mpm.dboard_manager.rh_periphs import DboardClockControl
 from usrp_mpm.cores import ClockSynchronizer
 from usrp_mpm.cores import nijesdcore
 from usrp_mpm.cores.eyescan import EyeScanTool
+from usrp_mpm.mpmutils import str2bool
 from usrp_mpm.dboard_manager.gain_rh import GainTableRh
 
 
@@ -413,9 +414,16 @@ class RhodiumInitManager(object):
         # adc_regs.poke8(0x0550, 0x05)
         test_val = adc_regs.peek8(0x0573)
         adc_regs.poke8(0x0573, 0x13)
-        # Perform eye scan on given lanes and range.
-        file_name = eyescan_tool.eyescan_full_scan(args['scan_lanes'],
-                                                   args['hor_range'], args['ver_range'])
+        # Perform eye scan on given lanes and range. Like rx_eyescan, the adaptive sweep
+        # arguments may come in as strings.
+        target_ber = args.get('target_ber')
+        coarse_factor = args.get('coarse_factor')
+        file_name = eyescan_tool.eyescan_full_scan(
+            args['scan_lanes'], args['hor_range'], args['ver_range'],
+            str2bool(args.get('adaptive', False)),
+            float(target_ber) if target_ber is not None else None,
+            int(coarse_factor) if coarse_factor is not None else None,
+            args.get('resume_file'))
         # Do some housekeeping...
         # adc_regs.poke8(0x0550, test_val) # Enable normal operation.
         adc_regs.poke8(0x0573, test_val) # Enable normal operation.
@@ -18,6 +18,7 @@ from usrp_mpm.cores import nijesdcore
 from usrp_mpm.dboard_manager.adc_rh import AD9695Rh
 from usrp_mpm.dboard_manager.dac_rh import DAC37J82Rh
 from usrp_mpm.mpmlog import get_logger
+from usrp_mpm.rpc_server import rpc_invalidates
 from usrp_mpm.sys_utils.uio import open_uio
 from usrp_mpm.user_eeprom import BfrfsEEPROM
 
@@ -436,6 +437,7 @@ class Rhodium(BfrfsEEPROM, DboardManagerBase):
         self.init(args)
         # self.master_clock_rate is now OK again
 
+    @rpc_invalidates('clocks')
     def set_master_clock_rate(self, rate):
         """
         Set the master clock rate to rate. Note this will trigger a
@@ -8,7 +8,9 @@ Code to run the discovery port
 """
 
 from multiprocessing import Process
+import ipaddress
 import socket
+import time
 from usrp_mpm.mpmtypes import MPM_DISCOVERY_PORT
 from usrp_mpm.mpmlog import get_main_logger
 from usrp_mpm.mpmutils import to_binary_str
@@ -22,6 +24,14 @@ MAX_SOCK_BUFSIZ = 9000
 # For setsockopt
 IP_MTU_DISCOVER = 10
 IP_PMTUDISC_DO = 2
+# Maximum number of queued requests which are handled in one go
+DISCOVERY_BATCH_SIZE = 64
+# Discovery responses per second (on average) and at once per source address.
+# Echo requests are not rate limited, they are used for MTU discovery.
+DISCOVERY_RATE_LIMIT = 10.0
+DISCOVERY_RATE_BURST = 10
+# Maximum number of source addresses tracked by the rate limiter
+DISCOVERY_MAX_SOURCES = 4096
 
 def spawn_discovery_process(shared_state, discovery_addr):
     """
@@ -40,22 +50,98 @@ def spawn_discovery_process(shared_state, discovery_addr):
     return proc
 
 
+class _SourceRateLimiter(object):
+    """
+    Token bucket per source address: Every source may get up to burst
+    responses at once, and rate responses per second on average.
+    """
+    def __init__(self, rate, burst, max_sources):
+        self.rate = rate
+        self.burst = burst
+        self.max_sources = max_sources
+        # source -> (tokens, time of last update)
+        self._buckets = {}
+
+    def allow(self, source, now):
+        """
+        Return True if source may get another response at time now (in
+        seconds, from time.monotonic()).
+        """
+        tokens, last_update = self._buckets.get(source, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last_update) * self.rate)
+        if tokens < 1:
+            self._buckets[source] = (tokens, now)
+            return False
+        if source not in self._buckets and len(self._buckets) >= self.max_sources:
+            self._prune(now)
+        self._buckets[source] = (tokens - 1, now)
+        return True
+
+    def _prune(self, now):
+        """
+        Forget all sources whose buckets have refilled. If that's not enough
+        to make room for another one, forget all of them.
+        """
+        self._buckets = {
+            source: (tokens, last_update)
+            for source, (tokens, last_update) in self._buckets.items()
+            if tokens + (now - last_update) * self.rate < self.burst
+        }
+        if len(self._buckets) >= self.max_sources:
+            self._buckets = {}
+
+
+def _get_discovery_network(discovery_addr):
+    """
+    Return the network that discovery requests are answered for, or None to
+    answer everyone.
+
+    discovery_addr is either 0.0.0.0 (answer everyone), a network in CIDR
+    notation, or an address. Trailing 255 octets of an address are treated
+    as a broadcast address, e.g. 192.168.10.255 is 192.168.10.0/24. Any other
+    address only matches itself.
+    """
+    if discovery_addr == '0.0.0.0':
+        return None
+    if '/' in discovery_addr:
+        return ipaddress.ip_network(discovery_addr, strict=False)
+    octets = discovery_addr.split('.')
+    num_host_octets = 0
+    while num_host_octets < len(octets) - 1 \
+            and octets[-1 - num_host_octets] == '255':
+        num_host_octets += 1
+    return ipaddress.ip_network(
+        "{}/{}".format(discovery_addr, 32 - 8 * num_host_octets), strict=False)
+
+
 def _discovery_process(state, discovery_addr):
     """
     The actual process for device discovery. Is spawned by
     spawn_discovery_process().
     """
     log = get_main_logger().getChild('discovery')
-    def create_response_string(state):
+    def get_state_snapshot(state):
+        """
+        Return the state version, and the parts of the shared state that go
+        into the response
+        """
+        with state.lock:
+            return state.version.value, (
+                state.dev_type.value, state.dev_product.value,
+                state.dev_serial.value, state.dev_name.value,
+                state.dev_fpga_type.value, state.claim_status.value)
+    def create_response_string(snapshot):
         " Generate the string that gets sent back to the requester. "
+        dev_type, dev_product, dev_serial, dev_name, dev_fpga_type, claimed = \
+            snapshot
         return RESPONSE_SEP.join(
             [RESPONSE_PREAMBLE] + \
-            [b"type="+state.dev_type.value] + \
-            [b"product="+state.dev_product.value] + \
-            [b"serial="+state.dev_serial.value] + \
-            [b"name="+state.dev_name.value] + \
-            [b"fpga="+state.dev_fpga_type.value] + \
-            [RESPONSE_CLAIMED_KEY+to_binary_str("={}".format(state.claim_status.value))]
+            [b"type="+dev_type] + \
+            [b"product="+dev_product] + \
+            [b"serial="+dev_serial] + \
+            [b"name="+dev_name] + \
+            [b"fpga="+dev_fpga_type] + \
+            [RESPONSE_CLAIMED_KEY+to_binary_str("={}".format(claimed))]
         )
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -64,33 +150,61 @@ def _discovery_process(state, discovery_addr):
     sock.bind((("0.0.0.0", MPM_DISCOVERY_PORT)))
     sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
 
-    # TODO yeah I know that's not how you do this
-    discovery_addr_prefix = discovery_addr.replace('.255', '')
-    if discovery_addr == '0.0.0.0':
-        discovery_addr_prefix = ''
+    rate_limiter = _SourceRateLimiter(
+        DISCOVERY_RATE_LIMIT, DISCOVERY_RATE_BURST, DISCOVERY_MAX_SOURCES)
+    # The response only changes when the claim status or the identity of the
+    # device does, which bumps the state version, so it's only regenerated then
+    response_version = None
+    response = None
 
     try:
+        try:
+            discovery_network = _get_discovery_network(discovery_addr)
+        except ValueError as ex:
+            log.warning("Invalid discovery address `%s' (%s), answering "
+                        "requests from all networks", discovery_addr, str(ex))
+            discovery_network = None
         while True:
-            data, sender = sock.recvfrom(MAX_SOCK_BUFSIZ)
-            log.debug("Got poked by: %s", sender[0])
-            # TODO this is still part of the awful subnet identification
-            if not sender[0].startswith(discovery_addr_prefix):
-                continue
-            if data.strip(b"\0") == b"MPM-DISC":
-                log.debug("Sending discovery response to %s port: %d",
-                          sender[0], sender[1])
-                resp_str = create_response_string(state)
-                send_data = resp_str
-                log.trace("Return data: %s", send_data)
-                sock.sendto(send_data, sender)
-            elif data.strip(b"\0").startswith(b"MPM-ECHO"):
-                log.debug("Received echo request from {sender}"
-                          .format(sender=sender[0]))
-                send_data = data
+            # Block for the first request, then drain whatever else is
+            # queued up without blocking
+            batch = [sock.recvfrom(MAX_SOCK_BUFSIZ)]
+            while len(batch) < DISCOVERY_BATCH_SIZE:
                 try:
+                    batch.append(sock.recvfrom(MAX_SOCK_BUFSIZ, socket.MSG_DONTWAIT))
+                except BlockingIOError:
+                    break
+            now = time.monotonic()
+            # Requesters which already got a response in this batch
+            answered = set()
+            for data, sender in batch:
+                log.debug("Got poked by: %s", sender[0])
+                if discovery_network is not None and \
+                        ipaddress.ip_address(sender[0]) not in discovery_network:
+                    continue
+                if data.strip(b"\0") == b"MPM-DISC":
+                    if sender in answered:
+                        continue
+                    if not rate_limiter.allow(sender[0], now):
+                        log.trace("Rate limiting discovery requests from %s",
+                                  sender[0])
+                        continue
+                    answered.add(sender)
+                    if state.version.value != response_version:
+                        response_version, snapshot = get_state_snapshot(state)
+                        response = create_response_string(snapshot)
+                    log.debug("Sending discovery response to %s port: %d",
+                              sender[0], sender[1])
+                    send_data = response
+                    log.trace("Return data: %s", send_data)
                     sock.sendto(send_data, sender)
-                except OSError as ex:
-                    log.warning("ECHO send error: %s", str(ex))
+                elif data.strip(b"\0").startswith(b"MPM-ECHO"):
+                    log.debug("Received echo request from {sender}"
+                              .format(sender=sender[0]))
+                    send_data = data
+                    try:
+                        sock.sendto(send_data, sender)
+                    except OSError as ex:
+                        log.warning("ECHO send error: %s", str(ex))
     except Exception as err:
         log.error("Unexpected error: `%s' Type: `%s'", str(err), type(err))
         sock.close()
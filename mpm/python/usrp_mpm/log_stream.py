@@ -0,0 +1,134 @@
+#
+# Copyright 2020 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Log streaming server
+
+Clients subscribe to MPM's log by opening a TCP connection to the log stream
+port (MPM_LOG_STREAM_PORT by default) and sending a single line containing a
+JSON object with these keys:
+- token: The claim token of the current session (required). The stream ends
+         when the device is unclaimed, or claimed by someone else.
+- level: Minimum log level, either a name (e.g. "INFO") or a number. Defaults
+         to TRACE, i.e., all records.
+- since: Sequence number of the first record to send. Defaults to the sequence
+         number of the next record, i.e., only new records are sent. Use 0 to
+         start with the oldest record still buffered.
+
+From then on, the server sends one JSON object per line. Log records have the
+keys seq, name, message, levelname, created, msecs and dropped, where dropped
+is the number of records which were lost right before this one, because the
+client fell too far behind. Records that were filtered out by the level are
+not counted as dropped.
+Lines without a seq key are status lines: One with a next_seq key is sent
+right after subscribing and whenever the stream has been idle for a while,
+and one with an error key is sent if the subscription was invalid or the
+token is no longer valid, after which the connection is closed.
+"""
+
+import json
+import time
+import logging
+from usrp_mpm.mpmlog import get_main_logger, TRACE
+
+# Seconds after which an idle stream gets a status line, so that clients which
+# went away are noticed
+LOG_STREAM_IDLE_INTERVAL = 5.0
+# Maximum number of concurrent log stream clients
+LOG_STREAM_MAX_CLIENTS = 16
+# Maximum length of the subscription line
+MAX_SUBSCRIPTION_LEN = 1024
+
+class LogStreamHandler(object):
+    """
+    Connection handler for the log stream server. Every connection follows
+    ring independently, see the module docstring for the protocol.
+
+    check_token is a callable which returns True if the given claim token is
+    valid, i.e., MPMServer._check_token_valid().
+    """
+    def __init__(self, ring, check_token):
+        self.log = get_main_logger().getChild('LogStream')
+        self.ring = ring
+        self.check_token = check_token
+
+    def __call__(self, sock, address):
+        """
+        Serve a single client, until it disconnects.
+        """
+        try:
+            try:
+                token, since, min_level = self._read_subscription(sock)
+            except ValueError as ex:
+                self._send(sock, [{'error': str(ex)}])
+                return
+            self.log.debug("Streaming logs to %s:%d (level: %s)",
+                           address[0], address[1], logging.getLevelName(min_level))
+            self._stream(sock, token, since, min_level)
+        except OSError as ex:
+            self.log.debug("Log stream to %s:%d closed: %s",
+                           address[0], address[1], str(ex))
+        finally:
+            sock.close()
+
+    def _read_subscription(self, sock):
+        """
+        Read the subscription line. Returns a tuple (token, since, min_level).
+        """
+        with sock.makefile('rb') as sock_file:
+            line = sock_file.readline(MAX_SUBSCRIPTION_LEN)
+        try:
+            subscription = json.loads(line.decode('utf-8')) if line.strip() else {}
+        except (UnicodeDecodeError, json.JSONDecodeError) as ex:
+            raise ValueError("Invalid subscription: {}".format(str(ex)))
+        if not isinstance(subscription, dict):
+            raise ValueError("Invalid subscription: Expected a JSON object")
+        token = subscription.get('token')
+        if not isinstance(token, str) or not self.check_token(token):
+            raise ValueError("Invalid token!")
+        min_level = subscription.get('level', TRACE)
+        if isinstance(min_level, str):
+            min_level = logging.getLevelName(min_level.upper())
+        if not isinstance(min_level, int):
+            raise ValueError("Invalid log level: `{}'".format(
+                subscription.get('level')))
+        since = subscription.get('since', self.ring.get_next_seq())
+        if not isinstance(since, int):
+            raise ValueError("Invalid sequence number: `{}'".format(since))
+        return token, since, min_level
+
+    def _stream(self, sock, token, since, min_level):
+        """
+        Send records from the ring to sock as they come in, for as long as
+        token stays valid
+        """
+        self._send(sock, [{'next_seq': since}])
+        last_send = time.monotonic()
+        dropped = 0
+        while True:
+            if not self.check_token(token):
+                self._send(sock, [{'error': "Invalid token!"}])
+                return
+            wakeup = self.ring.get_wakeup_event()
+            records, since, num_dropped = self.ring.read(since, min_level)
+            dropped += num_dropped
+            if records:
+                for record in records:
+                    record['dropped'] = 0
+                records[0]['dropped'] = dropped
+                dropped = 0
+                self._send(sock, records)
+                last_send = time.monotonic()
+            elif time.monotonic() - last_send > LOG_STREAM_IDLE_INTERVAL:
+                self._send(sock, [{'next_seq': since}])
+                last_send = time.monotonic()
+            wakeup.wait(max(
+                LOG_STREAM_IDLE_INTERVAL - (time.monotonic() - last_send), 0))
+
+    @staticmethod
+    def _send(sock, lines):
+        " Send a list of JSON objects, one per line "
+        sock.sendall("".join(
+            json.dumps(line) + "\n" for line in lines).encode('utf-8'))
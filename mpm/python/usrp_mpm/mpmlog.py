@@ -13,7 +13,10 @@ import logging
 from logging import CRITICAL, ERROR, WARNING, INFO, DEBUG
 from logging import handlers
 import collections
+import itertools
+import threading
 from builtins import str
+from gevent.event import Event
 
 # Colors
 BOLD = str('\033[1m')
@@ -66,6 +69,101 @@ class LossyQueueHandler(handlers.QueueHandler):
         """
         self.queue.appendleft(record)
 
+class LogRing(object):
+    """
+    Bounded ring of log records, each tagged with a sequence number.
+
+    Unlike the queue behind get_log_buf(), reading from the ring does not
+    remove records, so any number of readers can follow it independently.
+    Readers keep track of the next sequence number they expect; if the ring
+    has wrapped past it, read() reports how many records were lost.
+
+    Readers that want to block until there is something new call
+    get_wakeup_event() *before* read(), and wait on the returned event if
+    read() came back empty. The event is set by the next append().
+    """
+    def __init__(self, size):
+        self.size = size
+        self._records = collections.deque(maxlen=size)
+        self._next_seq = 0
+        self._lock = threading.Lock()
+        self._wakeup = None
+
+    def append(self, record):
+        """
+        Store record. The message is formatted right away, so later changes
+        to the record's arguments don't show up in the ring.
+        """
+        entry = (record.levelno, record.levelname, record.name,
+                 record.getMessage(), record.created, int(record.msecs))
+        with self._lock:
+            self._records.append((self._next_seq, entry))
+            self._next_seq += 1
+            wakeup, self._wakeup = self._wakeup, None
+        if wakeup is not None:
+            wakeup.set()
+
+    def get_wakeup_event(self):
+        """
+        Return an event which is set as soon as the next record is appended.
+        All readers share the event until then, and appending a record
+        replaces it with a fresh one, so nobody has to clear it.
+        """
+        with self._lock:
+            if self._wakeup is None:
+                self._wakeup = Event()
+            return self._wakeup
+
+    def get_next_seq(self):
+        """
+        Return the sequence number the next record will get
+        """
+        return self._next_seq
+
+    def read(self, since, min_level=0):
+        """
+        Return all records starting at sequence number since, with a level of
+        at least min_level.
+
+        Returns a tuple (records, next_seq, dropped). records is a list of
+        dictionaries, next_seq is the value of since for the next call, and
+        dropped is the number of records starting at since that had already
+        been overwritten.
+        """
+        with self._lock:
+            next_seq = self._next_seq
+            oldest = next_seq - len(self._records)
+            since = min(max(since, 0), next_seq)
+            dropped = max(oldest - since, 0)
+            entries = list(itertools.islice(
+                self._records, max(since, oldest) - oldest, None))
+        return [{
+            'seq': seq,
+            'name': name,
+            'message': message,
+            'levelname': levelname,
+            'created': created,
+            'msecs': msecs,
+        } for seq, (levelno, levelname, name, message, created, msecs) in entries
+                if levelno >= min_level], next_seq, dropped
+
+class LogRingHandler(logging.Handler):
+    """
+    Handler that stores records in a LogRing
+    """
+    def __init__(self, ring):
+        logging.Handler.__init__(self)
+        self.ring = ring
+
+    def emit(self, record):
+        """
+        Appends record to the ring, which wakes up its readers
+        """
+        try:
+            self.ring.append(record)
+        except Exception:
+            self.handleError(record)
+
 class MPMLogger(logging.getLoggerClass()):
     """
     Extends the regular Python logging with level 'trace' (like UHD)
@@ -82,6 +180,9 @@ class MPMLogger(logging.getLoggerClass()):
         self.py_log_buf = collections.deque(
             maxlen=prefs.get_prefs().getint('mpm', 'log_buf_size')
         )
+        self.py_log_ring = LogRing(
+            prefs.get_prefs().getint('mpm', 'log_stream_buf_size')
+        )
 
     def trace(self, *args, **kwargs):
         """ Extends logging for super-high verbosity """
@@ -141,6 +242,7 @@ def get_main_logger(
     if use_logbuf:
         queue_handler = LossyQueueHandler(LOGGER.py_log_buf)
         LOGGER.addHandler(queue_handler)
+        LOGGER.addHandler(LogRingHandler(LOGGER.py_log_ring))
     # Set default level:
     from usrp_mpm import prefs
     mpm_prefs = prefs.get_prefs()
@@ -13,6 +13,7 @@ from multiprocessing import Array
 from multiprocessing import RLock
 
 MPM_RPC_PORT = 49601
+MPM_LOG_STREAM_PORT = 49602
 MPM_DISCOVERY_PORT = 49600
 MPM_DISCOVERY_MESSAGE = "MPM-DISC"
 
@@ -32,3 +33,14 @@ class SharedState:
         self.dev_name = Array(ctypes.c_char, 21, lock=self.lock)
         self.dev_product = Array(ctypes.c_char, 16, lock=self.lock)
         self.dev_fpga_type = Array(ctypes.c_char, 8, lock=self.lock)
+        # Incremented whenever any of the above changes, see bump_version()
+        self.version = Value(ctypes.c_uint64, 0, lock=self.lock)
+
+    def bump_version(self):
+        """
+        Call this after changing the state, so that other processes can tell
+        that anything they derived from it (e.g., the discovery response) is
+        out of date.
+        """
+        with self.lock:
+            self.version.value += 1
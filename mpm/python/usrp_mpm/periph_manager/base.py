@@ -23,8 +23,17 @@ from usrp_mpm.sys_utils.udev import get_spidev_nodes
 from usrp_mpm.sys_utils import dtoverlay
 from usrp_mpm.sys_utils import net
 from usrp_mpm import eeprom
-from usrp_mpm.rpc_server import no_claim, no_rpc
+from usrp_mpm.rpc_server import no_claim, no_rpc, rpc_cache, rpc_invalidates
 from usrp_mpm import prefs
+from usrp_mpm.mpmutils import str2bool
+from usrp_mpm.sensor_sampler import SensorSampler
+from usrp_mpm.components import ComponentUpload
+
+# Seconds for which get_chdr_link_options() responses are cached. They
+# depend on interface state (IP addresses, link speed), so keep this short.
+CHDR_LINK_OPTIONS_CACHE_TTL = 2.0
+# Component files are uploaded to this directory before being installed
+COMPONENT_UPLOAD_PATH = os.path.join(os.sep, "tmp", "uploads")
 
 def get_dboard_class_from_pid(pid):
     """
@@ -106,6 +115,12 @@ class PeriphManagerBase:
     # A list of available sensors on the motherboard. This dictionary is a map
     # of the form sensor_name -> method name
     mboard_sensor_callback_map = {}
+    # Sampling intervals (in seconds) of motherboard sensors, used when the
+    # background sensor sampler is enabled. This is a map of the form
+    # sensor_name -> interval. Sensors not listed here use the
+    # sensor_sample_interval arg. Sensors matching
+    # SensorSampler.DIRECT_READ_SENSORS (e.g. lock sensors) are never sampled.
+    mboard_sensor_sample_intervals = {}
     # This is a sanity check value to see if the correct number of
     # daughterboards are detected. If somewhere along the line more than
     # max_num_dboards dboards are found, an error or warning is raised,
@@ -245,6 +260,11 @@ class PeriphManagerBase:
         # that added a feature.
         self.fpga_features = set()
         self._default_args = ""
+        # Background sensor sampler, only used if enabled by the
+        # sensor_sampler arg
+        self._sensor_sampler = None
+        # Chunked component uploads in progress, see begin_component_upload()
+        self._component_uploads = {}
         # CHDR transport managers. These need to be instantiated by the child
         # classes.
         self._xport_mgrs = {}
@@ -737,6 +757,7 @@ class PeriphManagerBase:
             return False
         for xport_mgr in self._xport_mgrs.values():
             xport_mgr.init(args)
+        self._init_sensor_sampler(args)
         if not self.dboards:
             return True
         if args.get("serialize_init", False):
@@ -770,6 +791,41 @@ class PeriphManagerBase:
             dboard.deinit()
         for xport_mgr in self._xport_mgrs.values():
             xport_mgr.deinit()
+        self._deinit_sensor_sampler()
+
+    def _init_sensor_sampler(self, args):
+        """
+        Start the background sensor sampler if the sensor_sampler arg is set,
+        either in args or in the default args. The sampling interval of
+        sensors that don't specify their own is set by sensor_sample_interval
+        (in seconds).
+        """
+        default_args = self._default_args \
+            if isinstance(self._default_args, dict) else {}
+        def get_arg(key, default):
+            " Return key from args, falling back to the default args "
+            return args.get(key, default_args.get(key, default))
+        if not str2bool(get_arg('sensor_sampler', False)):
+            return
+        if self._sensor_sampler is None:
+            self._sensor_sampler = SensorSampler(
+                self.log.getChild('SensorSampler'),
+                float(get_arg('sensor_sample_interval', 1.0)))
+        self._sensor_sampler.start()
+        for dboard in self.dboards:
+            dboard._sensor_sampler = self._sensor_sampler
+
+    def _deinit_sensor_sampler(self):
+        """
+        Stop the background sensor sampler, if it is running. Sensors are
+        read directly again afterwards.
+        """
+        if self._sensor_sampler is None:
+            return
+        for dboard in self.dboards:
+            dboard._sensor_sampler = None
+        self._sensor_sampler.stop()
+        self._sensor_sampler = None
 
     def tear_down(self):
         """
@@ -779,6 +835,10 @@ class PeriphManagerBase:
         self.log.trace("Teardown called for Peripheral Manager base.")
         for each in self.dboards:
             each.tear_down()
+        # Uploads in progress can be resumed by the next periph manager
+        for upload in self._component_uploads.values():
+            upload.close()
+        self._component_uploads = {}
 
     ###########################################################################
     # RFNoC & Device Info
@@ -922,15 +982,11 @@ class PeriphManagerBase:
         assert (len(metadata_l) == len(data_l)),\
             "update_component arguments must be the same length"
         # Iterate through the components, updating each in turn
-        basepath = os.path.join(os.sep, "tmp", "uploads")
+        basepath = COMPONENT_UPLOAD_PATH
         for metadata, data in zip(metadata_l, data_l):
             id_str = metadata['id']
             filename = os.path.basename(metadata['filename'])
-            if id_str not in self.updateable_components:
-                self.log.error("{0} not an updateable component ({1})".format(
-                    id_str, self.updateable_components.keys()
-                ))
-                raise KeyError("Update component not implemented for {}".format(id_str))
+            self._check_updateable_component(id_str)
             self.log.trace("Downloading component: {}".format(id_str))
             if 'md5' in metadata:
                 given_hash = metadata['md5']
@@ -961,15 +1017,104 @@ class PeriphManagerBase:
 
         # do the actual installation on the device
         for metadata in metadata_l:
-            id_str = metadata['id']
             filename = os.path.basename(metadata['filename'])
-            filepath = os.path.join(basepath, filename)
-            update_func = \
-                getattr(self, self.updateable_components[id_str]['callback'])
-            self.log.info("Installing component `%s'", id_str)
-            update_func(filepath, metadata)
+            self._install_component(
+                metadata, os.path.join(basepath, filename))
         return True
 
+    def begin_component_upload(self, metadata):
+        """
+        Start a chunked upload of a component file. This is an alternative to
+        update_component() for large files, which only needs to hold one chunk
+        in memory at a time.
+
+        The upload is done by calling append_component_chunk() for every
+        chunk of the file, followed by commit_component_upload(), which checks
+        the file and installs it. Only one upload per component can be in
+        progress at a time.
+
+        :param metadata: Dictionary of strings containing metadata, like for
+                         update_component(). If it contains a 'size' key
+                         (the file size in bytes), the upload is checked
+                         against it.
+        :return: The offset of the first chunk to upload. This is 0, unless
+                 an upload of the same file was interrupted earlier, in which
+                 case it resumes where that one stopped.
+        """
+        id_str = metadata['id']
+        self._check_updateable_component(id_str)
+        if id_str in self._component_uploads:
+            self._component_uploads.pop(id_str).close()
+        upload = ComponentUpload(self.log, COMPONENT_UPLOAD_PATH, metadata)
+        self._component_uploads[id_str] = upload
+        return upload.offset
+
+    def append_component_chunk(self, component_id, offset, data):
+        """
+        Append a chunk of data to the component upload started by
+        begin_component_upload().
+
+        :param component_id: The 'id' of the component metadata
+        :param offset: Offset of this chunk in the file. This must match the
+                       end of the previous chunk.
+        :param data: Binary string with the chunk contents
+        :return: The offset of the next chunk
+        """
+        return self._get_component_upload(component_id).append(offset, data)
+
+    def commit_component_upload(self, component_id):
+        """
+        Finish the component upload started by begin_component_upload(): Check
+        its size and hash, and install it on the device.
+
+        :param component_id: The 'id' of the component metadata
+        :return: The metadata the upload was started with
+        """
+        upload = self._get_component_upload(component_id)
+        del self._component_uploads[component_id]
+        upload.commit()
+        self._install_component(upload.metadata, upload.filepath)
+        return upload.metadata
+
+    def abort_component_upload(self, component_id):
+        """
+        Cancel the component upload started by begin_component_upload() and
+        discard the data uploaded so far.
+
+        :param component_id: The 'id' of the component metadata
+        """
+        self._get_component_upload(component_id).abort()
+        del self._component_uploads[component_id]
+
+    def _get_component_upload(self, component_id):
+        """
+        Return the upload in progress for component_id
+        """
+        if component_id not in self._component_uploads:
+            raise RuntimeError(
+                "No upload in progress for component `{}'".format(component_id))
+        return self._component_uploads[component_id]
+
+    def _check_updateable_component(self, id_str):
+        """
+        Raise a KeyError if id_str is not an updateable component
+        """
+        if id_str not in self.updateable_components:
+            self.log.error("{0} not an updateable component ({1})".format(
+                id_str, self.updateable_components.keys()
+            ))
+            raise KeyError("Update component not implemented for {}".format(id_str))
+
+    def _install_component(self, metadata, filepath):
+        """
+        Install the component file at filepath on the device
+        """
+        id_str = metadata['id']
+        update_func = \
+            getattr(self, self.updateable_components[id_str]['callback'])
+        self.log.info("Installing component `%s'", id_str)
+        update_func(filepath, metadata)
+
     @no_claim
     def get_component_info(self, component_name):
         """
@@ -1022,13 +1167,20 @@ class PeriphManagerBase:
             )
             self.log.error(error_msg)
             raise RuntimeError(error_msg)
-        return getattr(
+        read_func = getattr(
             self, self.mboard_sensor_callback_map.get(sensor_name)
-        )()
+        )
+        if self._sensor_sampler is not None \
+                and not self._sensor_sampler.is_direct_read(sensor_name):
+            return self._sensor_sampler.get(
+                ('mb', sensor_name), read_func,
+                self.mboard_sensor_sample_intervals.get(sensor_name))
+        return read_func()
 
     ##########################################################################
     # EEPROMS
     ##########################################################################
+    @rpc_cache(key='mb_eeprom')
     def get_mb_eeprom(self):
         """
         Return a dictionary with EEPROM contents
@@ -1040,6 +1192,7 @@ class PeriphManagerBase:
             for k, v in iteritems(self._eeprom_head)
         }
 
+    @rpc_invalidates('mb_eeprom', 'device_info')
     def set_mb_eeprom(self, eeprom_vals):
         """
         eeprom_vals is a dictionary (string -> string)
@@ -1051,6 +1204,7 @@ class PeriphManagerBase:
         self.log.debug("Skipping writing EEPROM keys: {}"
                        .format(list(eeprom_vals.keys())))
 
+    @rpc_cache(key='db_eeprom')
     def get_db_eeprom(self, dboard_idx):
         """
         Return a dictionary representing the content of the daughterboard
@@ -1066,6 +1220,7 @@ class PeriphManagerBase:
                        "what you want.")
         return self.dboards[dboard_idx].device_info
 
+    @rpc_invalidates('db_eeprom', 'device_info')
     def set_db_eeprom(self, dboard_idx, eeprom_data):
         """
         Write new EEPROM contents with eeprom_map.
@@ -1101,6 +1256,7 @@ class PeriphManagerBase:
         """
         return list(self._xport_mgrs.keys())
 
+    @rpc_cache(ttl=CHDR_LINK_OPTIONS_CACHE_TTL)
     def get_chdr_link_options(self, xport_type):
         """
         Returns a list of dictionaries. Every dictionary contains information
@@ -1188,6 +1344,7 @@ class PeriphManagerBase:
         """
         self.mboard_regs_control.set_tick_period(tk_idx, period_ns)
 
+    @rpc_cache(key='clocks')
     def get_clocks(self):
         """
         Gets the RFNoC-related clocks present in the FPGA design
@@ -1197,6 +1354,7 @@ class PeriphManagerBase:
     #######################################################################
     # GPIO API
     #######################################################################
+    @rpc_cache()
     def get_gpio_banks(self):
         """
         Returns a list of GPIO banks over which MPM has any control
@@ -1273,6 +1431,7 @@ class PeriphManagerBase:
         self.log.warning("get_sync_sources() was not specified for this device!")
         return []
 
+    @rpc_invalidates('clocks')
     def set_clock_source(self, *args):
         """
         Set a clock source.
@@ -1283,10 +1442,12 @@ class PeriphManagerBase:
         """
         raise NotImplementedError("set_clock_source() not available on this device!")
 
+    @rpc_invalidates('clocks')
     def set_time_source(self, time_source):
         " Set a time source "
         raise NotImplementedError("set_time_source() not available on this device!")
 
+    @rpc_invalidates('clocks')
     def set_sync_source(self, sync_args):
         """
         If a device has no special code for setting the sync-source atomically,
@@ -1306,6 +1467,7 @@ class PeriphManagerBase:
     ###########################################################################
     # Clock/Time API
     ###########################################################################
+    @rpc_invalidates('clocks')
     def set_clock_source_out(self, enable=True):
         """
         Allows routing the clock configured as source to the RefOut terminal.
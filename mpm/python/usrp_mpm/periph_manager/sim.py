@@ -27,6 +27,9 @@ class SimXportMgrUDP(XportMgrUDP):
     """This is an adaptor class for the normal XportMgrUDP
     In radios, the interface names are hardcoded. Since we are on a
     desktop computer, we generate the names at runtime.
+
+    The advertised CHDR port can be overridden with the chdr_port arg,
+    so that several simulated devices can share one host.
     """
     def __init__(self, log, args, eth_dispatcher_cls):
         with IPRoute() as ipr:
@@ -37,6 +40,7 @@ class SimXportMgrUDP(XportMgrUDP):
                 } for link in ipr.get_links()
             }
         super().__init__(log, args, eth_dispatcher_cls)
+        self.chdr_port = int(args.get('chdr_port', self.chdr_port))
 
 class SimEthDispatcher:
     """This is the hardware specific part of the normal XportMgrUDP
@@ -96,7 +100,10 @@ class sim(PeriphManagerBase):
         # This uses the description, mboard_info, and pids
         super().__init__()
 
-        self.chdr_endpoint = ChdrEndpoint(self.log, self.config)
+        self.chdr_endpoint = ChdrEndpoint(
+            self.log, self.config,
+            port=int(args.get('chdr_port', ChdrEndpoint.CHDR_PORT)),
+            bind_addr=args.get('chdr_addr', "0.0.0.0"))
 
         # Unlike the real hardware drivers, if there is an exception here,
         # we just crash. No use missing an error when testing.
@@ -237,6 +244,32 @@ class sim(PeriphManagerBase):
             return []
         return self._xport_mgrs[xport_type].get_chdr_link_options()
 
+    #######################################################################
+    # Simulator debugging API
+    #######################################################################
+    def dump_chdr_capture(self, path=""):
+        """
+        Write the simulator's CHDR packet capture ring to a pcap file and
+        return its path. If no path is given, the path from the [capture]
+        section of the simulator config is used.
+        """
+        return self.chdr_endpoint.dump_capture(path or None)
+
+    def get_chdr_stats(self):
+        """
+        Return the per-node packet counts and handling time histograms of
+        the simulated RFNoC graph, as well as the rates, flow control
+        stall times and dropped packets of the streams on each stream
+        endpoint.
+        """
+        return self.chdr_endpoint.get_stats()
+
+    def reset_chdr_stats(self):
+        """
+        Clear the packet statistics of the simulated RFNoC graph
+        """
+        self.chdr_endpoint.reset_stats()
+
     #######################################################################
     # Timekeeper API
     #######################################################################
@@ -257,6 +290,7 @@ class sim(PeriphManagerBase):
         """
         self.log.debug("Setting timekeeper time (tx_idx:{}, ticks: {}, next_pps: {})"
                        .format(tk_idx, ticks, next_pps))
+        self.chdr_endpoint.clock.set_ticks(ticks, next_pps)
 
     def get_timekeeper_time(self, tk_idx, last_pps):
         """
@@ -266,7 +300,7 @@ class sim(PeriphManagerBase):
         tk_idx: Index of timekeeper
         next_pps: If True, get time at last PPS. Otherwise, get time now.
         """
-        return 0
+        return self.chdr_endpoint.clock.get_ticks(last_pps)
 
     def set_tick_period(self, tk_idx, period_ns):
         """
@@ -278,6 +312,8 @@ class sim(PeriphManagerBase):
         """
         self.log.debug("Setting tick period (tk_idx: {}, period_ns: {})"
                        .format(tk_idx, period_ns))
+        # UHD sends the period as Q32 fixed point nanoseconds
+        self.chdr_endpoint.clock.set_tick_rate(1e9 * (1 << 32) / period_ns)
 
     def get_clocks(self):
         """
@@ -21,7 +21,7 @@ from usrp_mpm.sys_utils import ectool
 from usrp_mpm.sys_utils import i2c_dev
 from usrp_mpm.sys_utils.gpio import Gpio
 from usrp_mpm.sys_utils.udev import dt_symbol_get_spidev
-from usrp_mpm.rpc_server import no_claim, no_rpc
+from usrp_mpm.rpc_server import no_claim, no_rpc, rpc_invalidates
 from usrp_mpm.mpmutils import assert_compat_number, poll_with_timeout
 from usrp_mpm.periph_manager import PeriphManagerBase
 from usrp_mpm.xports import XportMgrUDP
@@ -868,6 +868,7 @@ class x4xx(ZynqComponents, PeriphManagerBase):
                 self.set_sync_source({**self._safe_sync_source, '__noretry__': True})
             raise
 
+    @rpc_invalidates('clocks')
     def set_master_clock_rate(self, master_clock_rate):
         """
         Sets the master clock rate by configuring the RFDC decimation and SPLL,
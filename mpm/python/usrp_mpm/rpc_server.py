@@ -15,6 +15,9 @@ from string import ascii_letters, digits
 from multiprocessing import Process
 import threading
 import sys
+import time
+from collections import deque
+from functools import wraps
 from gevent.server import StreamServer
 from gevent.pool import Pool
 from gevent import signal
@@ -25,6 +28,8 @@ monkey.patch_all()
 from contextlib import contextmanager
 from mprpc import RPCServer
 from usrp_mpm.mpmlog import get_main_logger
+from usrp_mpm.mpmtypes import MPM_LOG_STREAM_PORT
+from usrp_mpm.log_stream import LogStreamHandler, LOG_STREAM_MAX_CLIENTS
 from usrp_mpm.mpmutils import to_binary_str
 from usrp_mpm.sys_utils import watchdog
 from usrp_mpm.sys_utils import net
@@ -33,6 +38,14 @@ TIMEOUT_INTERVAL = 5.0 # Seconds before claim expires (default value)
 TOKEN_LEN = 16 # Length of the token string
 # Compatibility number for MPM
 MPM_COMPAT_NUM = (4, 2)
+# Key which invalidates all cached RPC responses, see rpc_invalidates()
+ALL_RPC_CACHE_KEYS = '*'
+# Seconds for which the periph manager part of get_device_info() is cached.
+# It includes dynamic info such as IP addresses, so this is kept short.
+DEVICE_INFO_CACHE_TTL = 1.0
+# RPC calls which take longer than this many seconds are logged (default
+# value, can be changed with the rpc_slow_call_threshold arg)
+SLOW_CALL_THRESHOLD = 1.0
 
 def no_claim(func):
     " Decorator for functions that require no token check "
@@ -44,13 +57,157 @@ def no_rpc(func):
     func._norpc = True
     return func
 
+def rpc_cache(ttl=None, key=None):
+    """
+    Decorator for idempotent getters whose RPC responses may be cached.
+
+    Responses are cached per list of arguments for ttl seconds, or until
+    they are invalidated if ttl is None. key names the group of cache
+    entries that rpc_invalidates() refers to, and defaults to the method
+    name.
+
+    The decorator also applies to overrides of the decorated method in
+    derived classes.
+    """
+    def decorator(func):
+        func._rpc_cache = (ttl, key or func.__name__)
+        return func
+    return decorator
+
+def rpc_invalidates(*keys):
+    """
+    Decorator for functions that change what cached getters return. After
+    every call via RPC, the cached responses with any of the given keys are
+    dropped (ALL_RPC_CACHE_KEYS drops all of them).
+
+    The decorator also applies to overrides of the decorated method in
+    derived classes.
+    """
+    def decorator(func):
+        func._rpc_invalidates = keys
+        return func
+    return decorator
+
+def _get_rpc_attr(component, method_name, attr_name):
+    """
+    Return the value of an RPC decorator attribute of a method, looking at
+    the method and everything it overrides. Returns None if it isn't set.
+    """
+    for cls in type(component).__mro__:
+        func = cls.__dict__.get(method_name)
+        if func is not None and hasattr(func, attr_name):
+            return getattr(func, attr_name)
+    return None
+
+class RPCResponseCache:
+    """
+    Stores responses of RPC calls, grouped by cache key.
+    """
+    def __init__(self):
+        self._entries = {}
+
+    def call(self, key, ttl, function, command, args):
+        """
+        Return the cached response of command for args, or call function if
+        there is none (or it expired) and cache its return value.
+        """
+        entry_key = (command, args)
+        try:
+            expiry, result = self._entries.get(key, {})[entry_key]
+            if expiry is None or expiry > time.monotonic():
+                return result
+        except KeyError:
+            pass
+        except TypeError:
+            # Arguments are unhashable (e.g. lists), so we can't cache
+            return function(*args)
+        result = function(*args)
+        expiry = None if ttl is None else time.monotonic() + ttl
+        self._entries.setdefault(key, {})[entry_key] = (expiry, result)
+        return result
+
+    def invalidate(self, keys):
+        """
+        Drop all cached responses with any of the given keys
+        """
+        if ALL_RPC_CACHE_KEYS in keys:
+            self._entries.clear()
+            return
+        for key in keys:
+            self._entries.pop(key, None)
+
+class RPCStats:
+    """
+    Keeps call counts, error counts and latencies per RPC command.
+
+    Percentiles are computed over the most recent WINDOW calls of each
+    command, everything else covers all calls since the last reset. Calls
+    which take longer than slow_call_threshold seconds are logged.
+    """
+    WINDOW = 1024
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, log, slow_call_threshold):
+        self.log = log
+        self.slow_call_threshold = slow_call_threshold
+        self._stats = {}
+
+    def record(self, command, elapsed, failed):
+        """
+        Record one call of command which took elapsed seconds
+        """
+        stats = self._stats.get(command)
+        if stats is None:
+            stats = self._stats[command] = {
+                'calls': 0,
+                'errors': 0,
+                'total': 0.0,
+                'max': 0.0,
+                'latencies': deque(maxlen=self.WINDOW),
+            }
+        stats['calls'] += 1
+        stats['errors'] += int(failed)
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+        stats['latencies'].append(elapsed)
+        if elapsed > self.slow_call_threshold:
+            self.log.warning("Slow RPC call: `%s' took %.3f s", command, elapsed)
+
+    def get(self):
+        """
+        Return a dict command -> stats, where stats is a dict with the
+        number of calls and errors, and the mean, p50, p95, p99 and max
+        latency in seconds
+        """
+        result = {}
+        for command, stats in self._stats.items():
+            latencies = sorted(stats['latencies'])
+            summary = {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'mean': stats['total'] / stats['calls'],
+                'max': stats['max'],
+            }
+            for percentile in self.PERCENTILES:
+                index = min(len(latencies) - 1, len(latencies) * percentile // 100)
+                summary['p{}'.format(percentile)] = latencies[index]
+            result[command] = summary
+        return result
+
+    def reset(self):
+        """
+        Clear all statistics
+        """
+        self._stats = {}
+
 class MPMServer(RPCServer):
     """
     Main MPM RPC class which holds the periph_manager object and translates
     RPC calls to appropiate calls in the periph_manager and dboard_managers.
     """
     # This is a list of methods in this class which require a claim
-    default_claimed_methods = ['init', 'update_component', 'reclaim', 'unclaim',
+    default_claimed_methods = ['init', 'update_component',
+                               'commit_component_upload', 'reclaim', 'unclaim',
                                'get_log_buf']
 
     ###########################################################################
@@ -69,6 +226,14 @@ class MPMServer(RPCServer):
             "rpc_timeout_interval",
             TIMEOUT_INTERVAL
         ))
+        self._rpc_stats = RPCStats(self.log, float(default_args.get(
+            "rpc_slow_call_threshold",
+            SLOW_CALL_THRESHOLD
+        )))
+        self._log_stream_port = int(default_args.get(
+            "log_stream_port",
+            MPM_LOG_STREAM_PORT
+        ))
         self.session_id = None
         # Create the periph_manager for this device
         # This call will be forwarded to the device specific implementation
@@ -91,10 +256,16 @@ class MPMServer(RPCServer):
                 to_binary_str(device_info.get("name", "n/a"))
         self._state.dev_fpga_type.value = \
                 to_binary_str(device_info.get("fpga", "n/a"))
+        self._state.bump_version()
         self._db_methods = []
         self._mb_methods = []
+        # Maps RPC command names of periph manager and dboard methods to
+        # the methods themselves, see multi_call()
+        self._component_functions = {}
         self.claimed_methods = copy.copy(self.default_claimed_methods)
         self._last_error = ""
+        self._response_cache = RPCResponseCache()
+        self._method_list = None
         self._init_rpc_calls(self.periph_manager)
         # We call the server __init__ function here, and not earlier, because
         # first the commands need to be registered
@@ -103,6 +274,7 @@ class MPMServer(RPCServer):
             unpack_params={'max_buffer_size': 50000000, 'raw': False},
         )
         self._state.system_ready.value = True
+        self._state.bump_version()
         self.log.info("RPC server ready!")
         # Optionally spawn watchdog. Note: In order for us to be able to spawn
         # the task from this thread, the main process needs to hand control to
@@ -120,6 +292,7 @@ class MPMServer(RPCServer):
         # Clear old calls:
         for meth_list in (self._db_methods, self._mb_methods):
             for method in meth_list:
+                self._component_functions.pop(method, None)
                 if hasattr(self, method):
                     delattr(self, method)
                 else:
@@ -129,6 +302,8 @@ class MPMServer(RPCServer):
                     )
         self._db_methods = []
         self._mb_methods = []
+        self._method_list = None
+        self._response_cache.invalidate((ALL_RPC_CACHE_KEYS,))
         # Register new ones:
         self._update_component_commands(mgr, '', '_mb_methods')
         for db_slot, dboard in enumerate(mgr.dboards):
@@ -154,8 +329,13 @@ class MPMServer(RPCServer):
                     and not hasattr(self, m) \
                     and not getattr(getattr(component, m), '_norpc', False)
             ):
-            new_rpc_method = getattr(component, method_name)
+            new_rpc_method = self._add_cache_handling(
+                getattr(component, method_name),
+                namespace + method_name,
+                _get_rpc_attr(component, method_name, '_rpc_cache'),
+                _get_rpc_attr(component, method_name, '_rpc_invalidates'))
             command_name = namespace + method_name
+            self._component_functions[command_name] = new_rpc_method
             if getattr(new_rpc_method, '_notok', False):
                 self._add_safe_command(new_rpc_method, command_name)
             else:
@@ -164,6 +344,40 @@ class MPMServer(RPCServer):
             getattr(self, storage).append(command_name)
 
 
+    def _add_cache_handling(self, function, command, cache_policy, invalidates):
+        """
+        Wrap function such that its responses are cached according to
+        cache_policy (a (ttl, key) tuple from @rpc_cache), and such that it
+        drops the cache entries given by invalidates (from @rpc_invalidates).
+        Returns function unchanged if both are None.
+        """
+        if cache_policy is not None:
+            ttl, key = cache_policy
+            @wraps(function)
+            def cached_function(*args):
+                " Serve a response from the RPC response cache "
+                return self._response_cache.call(key, ttl, function, command, args)
+            return cached_function
+        if invalidates is not None:
+            @wraps(function)
+            def invalidating_function(*args):
+                " Call function, then invalidate cached responses "
+                try:
+                    return function(*args)
+                finally:
+                    self._response_cache.invalidate(invalidates)
+            return invalidating_function
+        return function
+
+    def invalidate_rpc_cache(self):
+        """
+        Drop all cached RPC responses. Responses of idempotent getters are
+        cached, and are usually invalidated automatically when the
+        corresponding setters are called. Call this after changing device
+        state in other ways.
+        """
+        self._response_cache.invalidate((ALL_RPC_CACHE_KEYS,))
+
     def _add_claimed_command(self, function, command):
         """
         Adds a method with the name command to the RPC server
@@ -181,12 +395,15 @@ class MPMServer(RPCServer):
                     "token `{}'.".format(command, token)
                 )
                 raise RuntimeError("Invalid token!")
+            start_time = time.perf_counter()
+            failed = False
             try:
                 # Because we can only reach this point with a valid claim,
                 # there's no harm in resetting the timer
                 self._reset_timer()
                 return function(*args)
             except Exception as ex:
+                failed = True
                 self.log.error(
                     "Uncaught exception in method %s: %s \n %s ",
                     command, str(ex), traceback.format_exc()
@@ -194,6 +411,7 @@ class MPMServer(RPCServer):
                 self._last_error = str(ex)
                 raise
             finally:
+                self._rpc_stats.record(command, time.perf_counter() - start_time, failed)
                 if not self._state.claim_status.value:
                     self.log.error("Lost claim during API call to `%s'!",
                                    command)
@@ -209,15 +427,20 @@ class MPMServer(RPCServer):
         self.log.trace("adding safe command %s pointing to %s", command, function)
         def new_unclaimed_function(*args):
             " Define a function that does not require a claim token check "
+            start_time = time.perf_counter()
+            failed = False
             try:
                 return function(*args)
             except Exception as ex:
+                failed = True
                 self.log.error(
                     "Uncaught exception in method %s :%s\n %s ",
                     command, str(ex), traceback.format_exc()
                 )
                 self._last_error = str(ex)
                 raise
+            finally:
+                self._rpc_stats.record(command, time.perf_counter() - start_time, failed)
         new_unclaimed_function.__doc__ = function.__doc__
         setattr(self, command, new_unclaimed_function)
 
@@ -230,6 +453,12 @@ class MPMServer(RPCServer):
 
         Every tuple represents one call that's available over RPC.
         """
+        if self._method_list is None:
+            self._method_list = self._get_method_list()
+        return self._method_list
+
+    def _get_method_list(self):
+        " Build the return value of list_methods() "
         return [
             (
                 method,
@@ -241,6 +470,75 @@ class MPMServer(RPCServer):
                     and callable(getattr(self, method))
         ]
 
+    def multi_call(self, token, calls):
+        """
+        Run a list of RPC calls in one round trip.
+
+        calls is a list of (method_name, args) pairs, which are executed in
+        order. The claim token is checked once for the whole batch, and the
+        claim timer is reset once. Methods which require a claim fail if the
+        token is invalid, but methods which don't will still run.
+
+        Returns a list with one (success, result) pair per call. If success
+        is False, result is the error message. A failing call does not stop
+        the remaining ones.
+        """
+        token_valid = self._check_token_valid(token)
+        if token_valid:
+            self._reset_timer()
+        results = []
+        for method_name, args in calls:
+            start_time = time.perf_counter()
+            try:
+                if method_name == 'multi_call' or method_name.startswith('_') \
+                        or not callable(getattr(self, method_name, None)):
+                    raise RuntimeError(
+                        "Unknown or unsupported method `{}'".format(method_name))
+                claim_required = method_name in self.claimed_methods
+                if claim_required and not token_valid:
+                    self.log.warning(
+                        "Thwarted attempt to access function `{}' with invalid " \
+                        "token `{}'.".format(method_name, token))
+                    raise RuntimeError("Invalid token!")
+                if method_name in self._component_functions:
+                    # Skip the per-call token check and timer reset of the
+                    # RPC wrapper, we've done both for the whole batch
+                    result = self._component_functions[method_name](*args)
+                elif claim_required:
+                    result = getattr(self, method_name)(token, *args)
+                else:
+                    result = getattr(self, method_name)(*args)
+                results.append((True, result))
+                failed = False
+            except Exception as ex:
+                self.log.error(
+                    "Uncaught exception in method %s (via multi_call): %s \n %s ",
+                    method_name, str(ex), traceback.format_exc()
+                )
+                self._last_error = str(ex)
+                results.append((False, str(ex)))
+                failed = True
+            if method_name in self._component_functions:
+                self._rpc_stats.record(method_name, time.perf_counter() - start_time, failed)
+        if token_valid and not self._state.claim_status.value:
+            self.log.error("Lost claim during multi_call!")
+        return results
+
+    def get_rpc_stats(self, reset=False):
+        """
+        Returns a dictionary with an entry for every periph manager and
+        dboard RPC method that was called (including calls via multi_call).
+        Each entry is a dictionary with the number of calls and errors, and
+        the mean, p50, p95, p99 and max latency in seconds. Percentiles cover
+        the most recent calls only.
+
+        If reset is True, all statistics are cleared after reading them.
+        """
+        stats = self._rpc_stats.get()
+        if reset:
+            self._rpc_stats.reset()
+        return stats
+
     def ping(self, data=None):
         """
         Take in data as argument and send it back
@@ -290,8 +588,10 @@ class MPMServer(RPCServer):
             choice(ascii_letters + digits) for _ in range(TOKEN_LEN)
         ), 'ascii')
         self._state.claim_status.value = True
+        self._state.bump_version()
         self.periph_manager.claimed = True
         self.periph_manager.claim()
+        self._response_cache.invalidate((ALL_RPC_CACHE_KEYS,))
         if self.periph_manager.clear_rpc_registry_on_unclaim:
             self._init_rpc_calls(self.periph_manager)
         self._state.lock.release()
@@ -366,6 +666,8 @@ class MPMServer(RPCServer):
             # must always clear the claim and the _state lock at this point.
             self._state.claim_status.value = False
             self._state.claim_token.value = b''
+            self._state.bump_version()
+            self._response_cache.invalidate((ALL_RPC_CACHE_KEYS,))
             self._state.lock.release()
             self.session_id = None
 
@@ -417,7 +719,9 @@ class MPMServer(RPCServer):
         get device information
         This is as safe method which can be called without a claim on the device
         """
-        info = self.periph_manager.get_device_info()
+        info = dict(self._response_cache.call(
+            'device_info', DEVICE_INFO_CACHE_TTL,
+            self.periph_manager.get_device_info, 'get_device_info', ()))
         info["mpm_version"] = "{}.{}".format(*MPM_COMPAT_NUM)
         if _is_connection_local(self.client_host):
             info["connection"] = "local"
@@ -452,6 +756,24 @@ class MPMServer(RPCServer):
             for record in log_records
         ]
 
+    def get_log_stream_info(self):
+        """
+        Return where and how to subscribe to the log stream, as a dictionary:
+        - port: TCP port of the log stream server (0 if it's disabled)
+        - next_seq: The sequence number of the next log record
+        - buf_size: Number of records the server buffers for subscribers
+
+        Unlike get_log_buf(), the log stream does not take records away from
+        other clients, so any number of subscribers can follow it. Subscribing
+        requires the claim token, see usrp_mpm.log_stream for the protocol.
+        """
+        log_ring = get_main_logger().py_log_ring
+        return {
+            'port': self._log_stream_port,
+            'next_seq': log_ring.get_next_seq(),
+            'buf_size': log_ring.size,
+        }
+
     ###########################################################################
     # Session initialization
     ###########################################################################
@@ -470,6 +792,7 @@ class MPMServer(RPCServer):
             raise RuntimeError("init() called without valid claim.")
         try:
             result = self.periph_manager.init(args)
+            self._response_cache.invalidate((ALL_RPC_CACHE_KEYS,))
         except Exception as ex:
             self._last_error = str(ex)
             self.log.error("init() failed with error: %s", str(ex))
@@ -494,6 +817,7 @@ class MPMServer(RPCServer):
             pack_params={'use_bin_type': True},
             unpack_params={'max_buffer_size': 50000000, 'raw': False},
         )
+        self._method_list = None
 
     def _reset_mgr(self):
         """
@@ -511,6 +835,7 @@ class MPMServer(RPCServer):
         device_info = self.periph_manager.get_device_info()
         self._state.dev_fpga_type.value = \
                 to_binary_str(device_info.get("fpga", "n/a"))
+        self._state.bump_version()
 
     def reset_timer_and_mgr(self, token):
         """
@@ -557,38 +882,67 @@ class MPMServer(RPCServer):
             raise RuntimeError("Attempt to update component without valid claim.")
         with self._timeout_disabler():
             result = self.periph_manager.update_component(file_metadata_l, data_l)
+            self._response_cache.invalidate((ALL_RPC_CACHE_KEYS,))
             if not result:
                 component_ids = [metadata['id'] for metadata in file_metadata_l]
                 raise RuntimeError("Failed to update components: {}".format(component_ids))
 
-            # Check if we need to reset the peripheral manager
-            reset_now = False
-            for metadata, data in zip(file_metadata_l, data_l):
-                # Make sure the component is in the updateable_components
-                component_id = metadata['id']
-                if component_id in self.periph_manager.updateable_components:
-                    # Check if that updating that component means the PM should be reset
-                    reset_now = (reset_now or
-                                 self.periph_manager.updateable_components[component_id]['reset']) and \
-                                 not metadata.get('reset', "").lower() == "false"
-                else:
-                    self.log.debug("ID {} not in updateable components ({})".format(
-                        component_id, self.periph_manager.updateable_components))
-            try:
-                self.log.trace("Reset after updating component? {}".format(reset_now))
-                if reset_now:
-                    self._reset_mgr()
-                    self.log.debug("Reset the periph manager")
-            except Exception as ex:
-                self.log.error(
-                    "Error in update_component while resetting: {}".format(
-                        ex
-                    ))
-                self._last_error = str(ex)
+            self._reset_mgr_after_update(file_metadata_l)
 
         self.log.debug("End of update_component")
         self._reset_timer()
 
+    def commit_component_upload(self, token, component_id):
+        """
+        Finish a chunked component upload and install the component. See
+        PeriphManagerBase.begin_component_upload() for details.
+        :param component_id: The 'id' of the component metadata
+        """
+        # Check the claimed status
+        if not self._check_token_valid(token):
+            self._last_error =\
+                "Attempt to update component without valid claim from {}".format(
+                    self.client_host
+                )
+            self.log.error(self._last_error)
+            raise RuntimeError("Attempt to update component without valid claim.")
+        with self._timeout_disabler():
+            metadata = self.periph_manager.commit_component_upload(component_id)
+            self._response_cache.invalidate((ALL_RPC_CACHE_KEYS,))
+            self._reset_mgr_after_update([metadata])
+        self.log.debug("End of commit_component_upload")
+        self._reset_timer()
+
+    def _reset_mgr_after_update(self, file_metadata_l):
+        """
+        Reset the peripheral manager if updating any of the components in
+        file_metadata_l requires it.
+        """
+        # Check if we need to reset the peripheral manager
+        reset_now = False
+        for metadata in file_metadata_l:
+            # Make sure the component is in the updateable_components
+            component_id = metadata['id']
+            if component_id in self.periph_manager.updateable_components:
+                # Check if that updating that component means the PM should be reset
+                reset_now = (reset_now or
+                             self.periph_manager.updateable_components[component_id]['reset']) and \
+                             not metadata.get('reset', "").lower() == "false"
+            else:
+                self.log.debug("ID {} not in updateable components ({})".format(
+                    component_id, self.periph_manager.updateable_components))
+        try:
+            self.log.trace("Reset after updating component? {}".format(reset_now))
+            if reset_now:
+                self._reset_mgr()
+                self.log.debug("Reset the periph manager")
+        except Exception as ex:
+            self.log.error(
+                "Error in update_component while resetting: {}".format(
+                    ex
+                ))
+            self._last_error = str(ex)
+
 def _is_connection_local(client_hostname):
     return client_hostname in net.get_local_ip_addrs()
 
@@ -600,10 +954,20 @@ def _rpc_server_process(shared_state, port, default_args):
     This is the actual process that's running the RPC server.
     """
     connections = Pool(1000)
+    mpm_server = MPMServer(shared_state, default_args)
     server = StreamServer(
         ('0.0.0.0', port),
-        handle=MPMServer(shared_state, default_args),
+        handle=mpm_server,
         spawn=connections)
+    log_stream_port = int(default_args.get('log_stream_port', MPM_LOG_STREAM_PORT))
+    log_server = None
+    if log_stream_port:
+        log_server = StreamServer(
+            ('0.0.0.0', log_stream_port),
+            handle=LogStreamHandler(get_main_logger().py_log_ring,
+                                    mpm_server._check_token_valid),
+            spawn=Pool(LOG_STREAM_MAX_CLIENTS))
+        log_server.start()
     # catch signals and stop the stream server
     # Previously, the signal callbacks simply called server.stop()
     # gevent doesn't like this because server.stop() may block waiting
@@ -611,6 +975,8 @@ def _rpc_server_process(shared_state, port, default_args):
     stop_event = threading.Event()
     def stop_worker():
         stop_event.wait()
+        if log_server is not None:
+            log_server.stop()
         server.stop()
         sys.exit(0)
     threading.Thread(target=stop_worker, daemon=True).start()
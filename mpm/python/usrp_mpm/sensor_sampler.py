@@ -0,0 +1,149 @@
+#
+# Copyright 2020 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Background sampling of MPM sensors
+"""
+
+import threading
+import time
+from fnmatch import fnmatchcase
+
+class SensorSampler(object):
+    """
+    Reads sensors periodically in a background thread and serves their most
+    recent readings from a snapshot.
+
+    Sensors are registered the first time they are requested with get(): That
+    first read goes straight to the sensor, every later one is served from
+    the snapshot, which the background thread refreshes every `interval'
+    seconds per sensor.
+
+    The snapshot is a dictionary which is replaced, never modified, whenever
+    a reading is published, so get() never needs to take a lock.
+
+    Sensors matching DIRECT_READ_SENSORS must not be served from the snapshot
+    (see is_direct_read()): Callers poll lock sensors right after a tune or a
+    clock/time source change and wait for them to reflect it, and GPS
+    sensors such as gps_time are only useful when current.
+    """
+    # Shell-style patterns of sensor names which are always read directly
+    DIRECT_READ_SENSORS = ('*_lock', '*_locked', 'gps_*', 'rssi')
+
+    def __init__(self, log, default_interval=1.0):
+        self.log = log
+        self.default_interval = default_interval
+        # key -> [read_func, interval, next_due]. Only touched under _lock.
+        self._sensors = {}
+        # key -> (timestamp, value, error)
+        self._snapshot = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = False
+        self._thread = None
+
+    def start(self):
+        """
+        Start the sampler thread
+        """
+        if self._thread is not None:
+            return
+        self._stop = False
+        self._thread = threading.Thread(
+            target=self._run, name="SensorSampler", daemon=True)
+        self._thread.start()
+        self.log.debug("Started sensor sampler (default interval: %.2f s)",
+                       self.default_interval)
+
+    def stop(self):
+        """
+        Stop the sampler thread and forget all sensors and readings
+        """
+        if self._thread is None:
+            return
+        self._stop = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        with self._lock:
+            self._sensors = {}
+            self._snapshot = {}
+        self.log.debug("Stopped sensor sampler")
+
+    def is_direct_read(self, sensor_name):
+        """
+        Return True if sensor_name must always be read directly, bypassing
+        the sampler
+        """
+        return any(fnmatchcase(sensor_name, pattern)
+                   for pattern in self.DIRECT_READ_SENSORS)
+
+    def get(self, key, read_func, interval=None):
+        """
+        Return the latest reading of the sensor identified by key, with an
+        additional 'timestamp' entry (time of the reading in seconds since the
+        epoch, as a string).
+
+        read_func is a callable that reads the sensor and returns its sensor
+        value dictionary. If the sensor is not registered yet, it is read
+        immediately and then registered to be sampled every interval seconds
+        (or every default_interval seconds, if interval is None).
+
+        If the latest reading failed, a RuntimeError with its error message is
+        raised.
+        """
+        reading = self._snapshot.get(key)
+        if reading is None:
+            reading = self._read(read_func)
+            with self._lock:
+                if key not in self._sensors:
+                    interval = interval or self.default_interval
+                    self._sensors[key] = [read_func, interval, time.monotonic() + interval]
+                self._publish(key, reading)
+            self._wakeup.set()
+        timestamp, value, error = reading
+        if error is not None:
+            raise RuntimeError(error)
+        result = dict(value)
+        result['timestamp'] = "{:.6f}".format(timestamp)
+        return result
+
+    def _run(self):
+        " Sampler thread: Refresh every sensor when it's due "
+        while not self._stop:
+            now = time.monotonic()
+            with self._lock:
+                due = []
+                for key, sensor in self._sensors.items():
+                    if sensor[2] <= now:
+                        due.append((key, sensor[0]))
+                        sensor[2] = now + sensor[1]
+            for key, read_func in due:
+                if self._stop:
+                    return
+                reading = self._read(read_func)
+                with self._lock:
+                    if key in self._sensors:
+                        self._publish(key, reading)
+            with self._lock:
+                next_due = min(
+                    (sensor[2] for sensor in self._sensors.values()),
+                    default=time.monotonic() + self.default_interval)
+            self._wakeup.wait(max(0, next_due - time.monotonic()))
+            self._wakeup.clear()
+
+    def _publish(self, key, reading):
+        " Replace the snapshot with one that contains reading. Call with _lock held. "
+        snapshot = dict(self._snapshot)
+        snapshot[key] = reading
+        self._snapshot = snapshot
+
+    def _read(self, read_func):
+        " Read a sensor, returns a (timestamp, value, error) tuple "
+        try:
+            return (time.time(), read_func(), None)
+        except Exception as ex:
+            self.log.debug("Sensor read failed: %s", str(ex))
+            return (time.time(), None, str(ex))
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Throughput and latency benchmark for the simulator's CHDR datapath.
+
+This spins up a ChdrEndpoint in-process, and drives it from a client
+socket over UDP loopback with synthetic MGMT, CTRL, STRC and DATA
+packets, the way UHD would. It does not need a USRP or a UHD device,
+only the uhd Python module. Run it with:
+
+    python3 -m usrp_mpm.simulator.benchmark --json results.json
+
+Every phase reports packets/s, bytes/s, the CPU time consumed by the
+whole process (client and simulator), and, where a packet type has a
+response, latency percentiles in microseconds.
+"""
+
+import argparse
+import json
+import socket
+import sys
+import time
+from uhd.chdr import ChdrPacket, ChdrHeader, ChdrWidth, PacketType, MgmtPayload, MgmtHop, \
+    MgmtOp, MgmtOpCode, MgmtOpCfg, MgmtOpSelDest, CtrlPayload, CtrlOpCode, CtrlStatus, \
+    StrcPayload, StrcOpCode, StrsPayload, StrsStatus
+from usrp_mpm.mpmlog import get_main_logger, WARNING
+from .chdr_endpoint import ChdrEndpoint
+from .config import Config
+from .rfnoc_common import NodeType
+from .stream_ep_regs import REG_EPID_SELF, REG_OSTRM_DST_EPID, REG_OSTRM_CTRL_STATUS, \
+    REG_ISTRM_CTRL_STATUS
+from .noc_block_regs import RADIO_BASE_ADDR, REG_RX_MAX_WORDS_PER_PKT, REG_RX_CMD, \
+    RX_CMD_CONTINUOUS, RX_CMD_STOP, PROTOVER_ADDR
+
+CHDR_W = ChdrWidth.W64
+CLIENT_EPID = 1
+SEP_EPID = 2
+# Index of the stream endpoint port on the default crossbar (see
+# ChdrEndpoint.get_default_nodes())
+XBAR_XPORT_PORT = 0
+XBAR_SEP_PORT = 1
+PROTO_VER = 0x0100
+RECV_TIMEOUT = 2.0 # seconds
+
+def parse_args():
+    """Parse arguments when running this as a script"""
+    parser_help = 'Benchmark the USRP simulator CHDR datapath over UDP loopback'
+    parser = argparse.ArgumentParser(description=parser_help)
+    parser.add_argument('--port', type=int, default=ChdrEndpoint.CHDR_PORT + 100,
+                        help='UDP port for the simulated device')
+    parser.add_argument('--count', type=int, default=2000,
+                        help='Number of request/response round trips per packet type')
+    parser.add_argument('--duration', type=float, default=3.0,
+                        help='Duration of each streaming phase in seconds')
+    parser.add_argument('--payload', type=int, default=4096,
+                        help='Payload size of DATA packets in bytes')
+    parser.add_argument('--rate', type=float, default=10e6,
+                        help='Requested sample rate of the simulated RX stream')
+    parser.add_argument('--capacity', type=int, default=1024 * 1024,
+                        help='Buffer capacity advertised by simulated TX streams in bytes')
+    parser.add_argument('--fc-pkts', type=int, default=32,
+                        help='Flow control update frequency in packets')
+    parser.add_argument('--json', dest='json_path', default=None,
+                        help='Write machine-readable results to this file ("-" for stdout)')
+    return parser.parse_args()
+
+def percentiles(samples):
+    """Return a dictionary of latency percentiles of samples (in
+    seconds), in microseconds
+    """
+    if not samples:
+        return None
+    samples = sorted(samples)
+    def pick(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1e6
+    return {
+        'p50': pick(0.50),
+        'p90': pick(0.90),
+        'p99': pick(0.99),
+        'max': samples[-1] * 1e6,
+    }
+
+class PhaseTimer:
+    """Measures wall and CPU time of a benchmark phase, and packs the
+    results into a dictionary
+    """
+    def __init__(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+    def result(self, num_packets, num_bytes, latencies=None, **extra):
+        """Stop the timer and return the phase results"""
+        seconds = time.perf_counter() - self.wall_start
+        cpu_seconds = time.process_time() - self.cpu_start
+        result = {
+            'packets': num_packets,
+            'bytes': num_bytes,
+            'seconds': seconds,
+            'packets_per_sec': num_packets / seconds,
+            'bytes_per_sec': num_bytes / seconds,
+            'cpu_seconds': cpu_seconds,
+            'latency_us': percentiles(latencies),
+        }
+        result.update(extra)
+        return result
+
+class BenchClient:
+    """Plays the role of UHD: builds synthetic CHDR packets and talks to
+    the simulated device over a connected UDP socket
+    """
+    def __init__(self, port):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                             ChdrEndpoint.SOCK_BUFFER_BYTES)
+        self.sock.connect(("127.0.0.1", port))
+        self.sock.settimeout(RECV_TIMEOUT)
+        self.buffer = bytearray(ChdrEndpoint.MAX_MTU)
+        self.ctrl_seq_num = 0
+
+    def send(self, packet):
+        """Serialize and send packet, returns the number of bytes sent"""
+        return self.sock.send(bytes(packet.serialize()))
+
+    def recv(self, pkt_type):
+        """Receive packets until one of pkt_type arrives, and return it
+        together with its length in bytes
+        """
+        while True:
+            n_bytes = self.sock.recv_into(self.buffer)
+            packet = ChdrPacket.deserialize(CHDR_W, bytes(self.buffer[:n_bytes]))
+            if packet.get_header().pkt_type == pkt_type:
+                return packet, n_bytes
+
+    @staticmethod
+    def mgmt_packet(hops):
+        """Build a management packet. hops is a list of lists of MgmtOps,
+        one list per node on the path
+        """
+        payload = MgmtPayload()
+        payload.set_header(CLIENT_EPID, PROTO_VER, CHDR_W)
+        for ops in hops:
+            hop = MgmtHop()
+            for op in ops:
+                hop.add_op(op)
+            payload.add_hop(hop)
+        header = ChdrHeader()
+        header.pkt_type = PacketType.MGMT
+        return ChdrPacket(CHDR_W, header, payload)
+
+    @staticmethod
+    def cfg_write(addr, data):
+        """Build a CFG_WR_REQ management op"""
+        return MgmtOp(MgmtOpCode.CFG_WR_REQ, MgmtOpCfg(addr, data))
+
+    def sep_mgmt_packet(self, sep_ops):
+        """Build a management packet which passes the xport and the
+        crossbar, executes sep_ops on the stream endpoint, and returns
+        """
+        return self.mgmt_packet([
+            [MgmtOp(MgmtOpCode.NOP)],
+            [MgmtOp(MgmtOpCode.SEL_DEST, MgmtOpSelDest(XBAR_SEP_PORT))],
+            sep_ops + [MgmtOp(MgmtOpCode.RETURN)],
+            [MgmtOp(MgmtOpCode.NOP)],
+        ])
+
+    def ctrl_packet(self, op_code, address, data=0):
+        """Build a control packet for the stream endpoint's ctrl port"""
+        header = ChdrHeader()
+        header.pkt_type = PacketType.CTRL
+        header.dst_epid = SEP_EPID
+        payload = CtrlPayload()
+        payload.src_epid = CLIENT_EPID
+        payload.seq_num = self.ctrl_seq_num
+        payload.op_code = op_code
+        payload.status = CtrlStatus.OKAY
+        payload.address = address
+        payload.set_data([data])
+        self.ctrl_seq_num = (self.ctrl_seq_num + 1) & 0x3F
+        return ChdrPacket(CHDR_W, header, payload)
+
+    @staticmethod
+    def strc_packet(op_code, fc_pkts=0, fc_bytes=0):
+        """Build a stream command packet for the stream endpoint"""
+        header = ChdrHeader()
+        header.pkt_type = PacketType.STRC
+        header.dst_epid = SEP_EPID
+        payload = StrcPayload()
+        payload.src_epid = CLIENT_EPID
+        payload.op_code = op_code
+        payload.num_pkts = fc_pkts
+        payload.num_bytes = fc_bytes
+        return ChdrPacket(CHDR_W, header, payload)
+
+    @staticmethod
+    def strs_packet(capacity_bytes, xfer_pkts, xfer_bytes):
+        """Build a stream status packet for the stream endpoint"""
+        header = ChdrHeader()
+        header.pkt_type = PacketType.STRS
+        header.dst_epid = SEP_EPID
+        payload = StrsPayload()
+        payload.src_epid = CLIENT_EPID
+        payload.status = StrsStatus.OKAY
+        payload.capacity_bytes = capacity_bytes
+        payload.capacity_pkts = 0xFFFFFF
+        payload.xfer_count_bytes = xfer_bytes
+        payload.xfer_count_pkts = xfer_pkts
+        return ChdrPacket(CHDR_W, header, payload)
+
+    @staticmethod
+    def data_packet(seq_num, payload):
+        """Build a data packet for the stream endpoint"""
+        header = ChdrHeader()
+        header.pkt_type = PacketType.DATA_NO_TS
+        header.dst_epid = SEP_EPID
+        header.seq_num = seq_num
+        return ChdrPacket(CHDR_W, header, payload)
+
+class Benchmark:
+    """Runs the benchmark phases against a ChdrEndpoint"""
+    def __init__(self, args):
+        self.args = args
+        log = get_main_logger(use_logbuf=False)
+        log.setLevel(WARNING)
+        config = Config.default()
+        config.rx_capacity_bytes = args.capacity
+        config.rx_queue_depth = max(ChdrEndpoint.RECV_BATCH_SIZE,
+                                    args.capacity // max(1, args.payload))
+        self.endpoint = ChdrEndpoint(log, config, port=args.port)
+        self.client = BenchClient(args.port)
+
+    def setup(self):
+        """Configure routing and endpoint ids, the way UHD's mgmt_portal
+        would, and start a simulated TX stream
+        """
+        client = self.client
+        client.send(client.mgmt_packet([
+            [MgmtOp(MgmtOpCode.ADVERTISE)],
+            [client.cfg_write(CLIENT_EPID, XBAR_XPORT_PORT),
+             client.cfg_write(SEP_EPID, XBAR_SEP_PORT),
+             MgmtOp(MgmtOpCode.SEL_DEST, MgmtOpSelDest(XBAR_SEP_PORT))],
+            [client.cfg_write(REG_EPID_SELF, SEP_EPID),
+             client.cfg_write(REG_OSTRM_DST_EPID, CLIENT_EPID),
+             client.cfg_write(REG_ISTRM_CTRL_STATUS, 0),
+             MgmtOp(MgmtOpCode.RETURN)],
+            [MgmtOp(MgmtOpCode.NOP)],
+        ]))
+        client.recv(PacketType.MGMT)
+
+    def strc_init_packet(self):
+        """Build a STRC INIT packet which requests a flow control update
+        every fc_pkts DATA packets
+        """
+        fc_bytes = self.args.fc_pkts * (self.args.payload + 8)
+        return self.client.strc_packet(StrcOpCode.INIT, self.args.fc_pkts, fc_bytes)
+
+    def run_mgmt(self):
+        """Round trips of node info requests to the stream endpoint"""
+        client = self.client
+        latencies = []
+        num_bytes = 0
+        timer = PhaseTimer()
+        for _ in range(self.args.count):
+            packet = client.sep_mgmt_packet([MgmtOp(MgmtOpCode.INFO_REQ)])
+            start = time.perf_counter()
+            num_bytes += client.send(packet)
+            _, resp_len = client.recv(PacketType.MGMT)
+            latencies.append(time.perf_counter() - start)
+            num_bytes += resp_len
+        return timer.result(2 * self.args.count, num_bytes, latencies)
+
+    def run_ctrl(self):
+        """Round trips of register reads through the ctrl port"""
+        client = self.client
+        latencies = []
+        num_bytes = 0
+        timer = PhaseTimer()
+        for _ in range(self.args.count):
+            packet = client.ctrl_packet(CtrlOpCode.READ, PROTOVER_ADDR)
+            start = time.perf_counter()
+            num_bytes += client.send(packet)
+            _, resp_len = client.recv(PacketType.CTRL)
+            latencies.append(time.perf_counter() - start)
+            num_bytes += resp_len
+        return timer.result(2 * self.args.count, num_bytes, latencies)
+
+    def run_graph(self):
+        """Calls RFNoCGraph.handle_packet() directly (no sockets) with
+        pre-serialized control packets. The socket thread is idle
+        during this phase.
+        """
+        client = self.client
+        graph = self.endpoint.graph
+        data = bytes(client.ctrl_packet(CtrlOpCode.READ, PROTOVER_ADDR).serialize())
+        entry_xport = (NodeType.XPORT, 0)
+        addr = client.sock.getsockname()
+        latencies = []
+        timer = PhaseTimer()
+        for _ in range(self.args.count):
+            start = time.perf_counter()
+            packet = ChdrPacket.deserialize(CHDR_W, data)
+            graph.handle_packet(packet, entry_xport, addr, addr, len(data))
+            latencies.append(time.perf_counter() - start)
+        return timer.result(self.args.count, self.args.count * len(data), latencies)
+
+    def run_strc(self):
+        """Stream initialization followed by round trips of STRC pings"""
+        client = self.client
+        latencies = []
+        num_bytes = 0
+        timer = PhaseTimer()
+        client.send(self.strc_init_packet())
+        client.recv(PacketType.STRS)
+        for _ in range(self.args.count):
+            packet = client.strc_packet(StrcOpCode.PING)
+            start = time.perf_counter()
+            num_bytes += client.send(packet)
+            _, resp_len = client.recv(PacketType.STRS)
+            latencies.append(time.perf_counter() - start)
+            num_bytes += resp_len
+        return timer.result(2 * self.args.count, num_bytes, latencies)
+
+    def run_data_in(self):
+        """Stream DATA packets into a simulated TX stream (ChdrInputStream)
+        as fast as its flow control window allows. The latency of a
+        DATA packet is the time until a STRS acknowledges it.
+        """
+        client = self.client
+        client.send(self.strc_init_packet())
+        strs, _ = client.recv(PacketType.STRS)
+        capacity = strs.get_payload_strs().capacity_bytes
+        payload = bytes(self.args.payload)
+        send_times = []
+        sent_bytes = 0
+        acked_pkts = 0
+        acked_bytes = 0
+        latencies = []
+        def wait_for_strs():
+            nonlocal acked_pkts, acked_bytes
+            strs, _ = client.recv(PacketType.STRS)
+            now = time.perf_counter()
+            strs_payload = strs.get_payload_strs()
+            for index in range(acked_pkts, min(strs_payload.xfer_count_pkts, len(send_times))):
+                latencies.append(now - send_times[index])
+            acked_pkts = strs_payload.xfer_count_pkts
+            acked_bytes = strs_payload.xfer_count_bytes
+        timer = PhaseTimer()
+        end_time = time.perf_counter() + self.args.duration
+        while time.perf_counter() < end_time:
+            packet = client.data_packet(len(send_times) & 0xFFFF, payload)
+            if sent_bytes + packet.get_packet_len() - acked_bytes > capacity:
+                wait_for_strs()
+                continue
+            send_times.append(time.perf_counter())
+            sent_bytes += client.send(packet)
+        # The last fc update may not be due yet, so ping for the final
+        # status. The ping itself counts as one more transferred packet.
+        client.send(client.strc_packet(StrcOpCode.PING))
+        while acked_pkts <= len(send_times):
+            wait_for_strs()
+        return timer.result(len(send_times), sent_bytes, latencies)
+
+    def run_data_out(self):
+        """Receive DATA packets from a simulated RX stream
+        (ChdrOutputStream) for the configured duration, acknowledging
+        them with STRS packets the way UHD does
+        """
+        client = self.client
+        capacity = self.args.capacity
+        client.send(client.sep_mgmt_packet([client.cfg_write(REG_OSTRM_CTRL_STATUS, 1)]))
+        client.recv(PacketType.STRC)
+        # The mgmt response may arrive before or after the STRC, and
+        # is not needed
+        client.send(client.strs_packet(capacity, 0, 0))
+        self.endpoint.set_sample_rate(self.args.rate)
+        client.send(client.ctrl_packet(CtrlOpCode.WRITE,
+                                       RADIO_BASE_ADDR + REG_RX_MAX_WORDS_PER_PKT,
+                                       self.args.payload))
+        client.recv(PacketType.CTRL)
+        # Ask the stream spec for the rate, so this matches the stream's pacing
+        requested_packets_per_sec = \
+            1 / self.endpoint.graph.get_stream_spec().seconds_per_packet()
+        num_pkts = 0
+        num_bytes = 0
+        gaps = []
+        timer = PhaseTimer()
+        client.send(client.ctrl_packet(CtrlOpCode.WRITE, RADIO_BASE_ADDR + REG_RX_CMD,
+                                       RX_CMD_CONTINUOUS))
+        end_time = time.perf_counter() + self.args.duration
+        last_arrival = None
+        while time.perf_counter() < end_time:
+            _, n_bytes = client.recv(PacketType.DATA_WITH_TS)
+            now = time.perf_counter()
+            if last_arrival is not None:
+                gaps.append(now - last_arrival)
+            last_arrival = now
+            num_pkts += 1
+            num_bytes += n_bytes
+            if num_pkts % self.args.fc_pkts == 0:
+                client.send(client.strs_packet(capacity, num_pkts, num_bytes))
+        result = timer.result(num_pkts, num_bytes, gaps,
+                              requested_packets_per_sec=requested_packets_per_sec)
+        client.send(client.ctrl_packet(CtrlOpCode.WRITE, RADIO_BASE_ADDR + REG_RX_CMD,
+                                       RX_CMD_STOP))
+        return result
+
+    def run(self):
+        """Run all phases and return the results"""
+        self.setup()
+        phases = {}
+        phases['mgmt'] = self.run_mgmt()
+        phases['ctrl'] = self.run_ctrl()
+        phases['graph_ctrl'] = self.run_graph()
+        phases['strc'] = self.run_strc()
+        phases['data_in'] = self.run_data_in()
+        phases['data_out'] = self.run_data_out()
+        return {
+            'args': vars(self.args),
+            'phases': phases,
+        }
+
+def print_results(results, output):
+    """Print a human-readable summary of the results"""
+    output.write("{:<12}{:>12}{:>14}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(
+        "phase", "pkts/s", "MB/s", "cpu s", "p50 us", "p90 us", "p99 us", "max us"))
+    for name, phase in results['phases'].items():
+        latency = phase['latency_us'] or {}
+        output.write("{:<12}{:>12.0f}{:>14.2f}{:>10.2f}{:>10}{:>10}{:>10}{:>10}\n".format(
+            name, phase['packets_per_sec'], phase['bytes_per_sec'] / 1e6,
+            phase['cpu_seconds'],
+            *["{:.0f}".format(latency[key]) if key in latency else "-"
+              for key in ('p50', 'p90', 'p99', 'max')]))
+    output.write("(data_out latencies are packet inter-arrival times)\n")
+
+def main():
+    """Run the benchmark as a script"""
+    args = parse_args()
+    results = Benchmark(args).run()
+    if args.json_path == '-':
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    print_results(results, sys.stdout)
+    if args.json_path is not None:
+        with open(args.json_path, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+if __name__ == "__main__":
+    main()
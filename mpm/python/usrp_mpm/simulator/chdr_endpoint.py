@@ -8,13 +8,17 @@ packet dispatch, and acts as an interface between these and the RFNoC
 Graph.
 """
 
-from threading import Thread
+from threading import Thread, Lock
 import socket
 import queue
-import select
+import selectors
 from uhd.chdr import ChdrPacket, ChdrWidth
+from usrp_mpm.mpmlog import TRACE
 from .rfnoc_graph import XbarNode, XportNode, StreamEndpointNode, RFNoCGraph, NodeType
+from .rfnoc_common import trace_packet, set_packet_dumps
 from .chdr_stream import ChdrOutputStream, ChdrInputStream
+from .virtual_clock import VirtualClock
+from .packet_capture import PacketCapture
 
 CHDR_W = ChdrWidth.W64
 
@@ -42,12 +46,24 @@ class SelectableQueue:
         self._send_signal_rx.recv(1)
         return self._queue.get_nowait()
 
+    def get_batch(self, max_items):
+        """ Return up to max_items elements from the queue as a list,
+        blocking until at least one is available.
+
+        Every put() writes exactly one signal byte, so consuming n
+        signal bytes entitles us to exactly n queue elements.
+        """
+        num_items = len(self._send_signal_rx.recv(max_items))
+        return [self._queue.get_nowait() for _ in range(num_items)]
+
 class SendWrapper:
     """This class is used as an abstraction over queueing packets to be
-    sent by the socket thread.
+    sent by the event loop thread on the socket of a particular
+    ChdrEndpoint.
     """
-    def __init__(self, queue):
+    def __init__(self, queue, endpoint):
         self.queue = queue
+        self.endpoint = endpoint
 
     def send_packet(self, packet, addr):
         """Serialize packet and then queue the data to be sent to addr
@@ -59,7 +75,87 @@ class SendWrapper:
 
     def send_data(self, data, addr):
         """Queue data to be sent to addr"""
-        self.queue.put((data, addr))
+        self.queue.put((self.endpoint, data, addr))
+
+
+class ChdrEventLoop:
+    """Polls the sockets of any number of ChdrEndpoints from a single
+    thread.
+
+    All endpoints registered with one loop share its polling thread,
+    its preallocated receive ring and its outbound send queue, so
+    hosting many simulated devices in one process does not cost one
+    socket thread per device.
+    """
+    RECV_BATCH_SIZE = 64
+    SEND_BATCH_SIZE = 64
+    def __init__(self, log):
+        self.log = log.getChild("ChdrEventLoop")
+        self.send_queue = SelectableQueue()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.send_queue, selectors.EVENT_READ, None)
+        # Preallocated receive ring, reused for every burst
+        self.recv_ring = [memoryview(bytearray(ChdrEndpoint.MAX_MTU))
+                          for _ in range(ChdrEventLoop.RECV_BATCH_SIZE)]
+        self._start_lock = Lock()
+        self.thread = None
+
+    def register(self, sock, endpoint):
+        """Start polling sock, and pass its datagrams to
+        endpoint.recv_burst()
+        """
+        self.selector.register(sock, selectors.EVENT_READ, endpoint)
+
+    def unregister(self, sock):
+        """Stop polling sock"""
+        self.selector.unregister(sock)
+
+    def start(self):
+        """Start the polling thread, if it isn't running already"""
+        with self._start_lock:
+            if self.thread is None:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def run(self):
+        """This is the method that runs in a background thread. It
+        blocks on every registered socket and the send queue, and
+        processes packets as they come in.
+
+        Errors are handled per endpoint, so that one failing endpoint
+        cannot stop the traffic of all others sharing this loop.
+        """
+        self.log.info("Starting ChdrEventLoop Thread")
+        while True:
+            for key, _ in self.selector.select():
+                if key.data is None:
+                    self._send_burst()
+                    continue
+                try:
+                    key.data.recv_burst(key.fileobj, self.recv_ring)
+                except Exception as ex:
+                    self.log.error("Endpoint on port {} failed to receive: {}"
+                                   .format(key.data.port, ex))
+
+    def _send_burst(self):
+        """Flush up to SEND_BATCH_SIZE queued outbound packets"""
+        for endpoint, data, addr in self.send_queue.get_batch(ChdrEventLoop.SEND_BATCH_SIZE):
+            try:
+                endpoint.sendto(data, addr)
+            except Exception as ex:
+                self.log.error("Endpoint on port {} failed to send to {}: {}"
+                               .format(endpoint.port, addr, ex))
+
+_default_event_loop = None
+_default_event_loop_lock = Lock()
+
+def get_default_event_loop(log):
+    """Return the process-wide ChdrEventLoop, creating it on first use"""
+    global _default_event_loop
+    with _default_event_loop_lock:
+        if _default_event_loop is None:
+            _default_event_loop = ChdrEventLoop(log)
+        return _default_event_loop
 
 
 class ChdrEndpoint:
@@ -69,21 +165,57 @@ class ChdrEndpoint:
     traffic.
 
     The config parameter is a Config object (see simulator/config.py)
+
+    The socket is polled by a ChdrEventLoop, which may be shared with
+    other endpoints in the same process (see device_host.py). If none
+    is given, the process-wide default loop is used. Incoming datagrams
+    are drained in bursts of up to RECV_BATCH_SIZE per wakeup into the
+    loop's preallocated ring of buffers.
     """
-    def __init__(self, log, config):
+    CHDR_PORT = 49153
+    MAX_MTU = 8000
+    RECV_BATCH_SIZE = ChdrEventLoop.RECV_BATCH_SIZE
+    SEND_BATCH_SIZE = ChdrEventLoop.SEND_BATCH_SIZE
+    SOCK_BUFFER_BYTES = 8 * 1024 * 1024 # 8 MiB
+    def __init__(self, log, config, port=CHDR_PORT, bind_addr="0.0.0.0",
+                 event_loop=None):
         self.log = log.getChild("ChdrEndpoint")
         self.config = config
+        self.port = port
+        self.bind_addr = bind_addr
         self.source_gen = config.source_gen
         self.sink_gen = config.sink_gen
         self.xport_map = {}
+        set_packet_dumps(config.packet_dumps)
 
-        self.send_queue = SelectableQueue()
-        self.send_wrapper = SendWrapper(self.send_queue)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Give the kernel enough room to absorb a burst while we are
+        # busy processing the previous one. The kernel may clamp this.
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                             ChdrEndpoint.SOCK_BUFFER_BYTES)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF,
+                             ChdrEndpoint.SOCK_BUFFER_BYTES)
+        self.sock.bind((bind_addr, port))
+
+        if event_loop is None:
+            event_loop = get_default_event_loop(log)
+        self.event_loop = event_loop
+        self.send_wrapper = SendWrapper(event_loop.send_queue, self)
+
+        self.capture = None
+        self.capture_path = config.capture_path.format(port=port)
+        if config.capture_packets > 0:
+            self.capture = PacketCapture(config.capture_packets, config.capture_snaplen,
+                                         (bind_addr, port))
 
         self.graph = RFNoCGraph(self.get_default_nodes(), self.log, 0, self.send_wrapper,
                                 CHDR_W, config.hardware.rfnoc_device_type)
-        self.thread = Thread(target=self.socket_worker, daemon=True)
-        self.thread.start()
+        self.clock = VirtualClock(config.clock_mode, config.clock_speed)
+        self.graph.get_stream_spec().max_burst = config.max_burst
+        self.graph.get_stream_spec().clock = self.clock
+        self.log.info("Listening for CHDR traffic on {}:{}".format(bind_addr, port))
+        self.event_loop.register(self.sock, self)
+        self.event_loop.start()
 
     def set_device_id(self, device_id):
         """Set the device_id for this endpoint"""
@@ -104,7 +236,8 @@ class ChdrEndpoint:
         nodes = [
             XportNode(0),
             XbarNode(0, [2], [0]),
-            StreamEndpointNode(0, self.source_gen, self.sink_gen)
+            StreamEndpointNode(0, self.source_gen, self.sink_gen,
+                               self.config.rx_queue_depth, self.config.rx_capacity_bytes)
         ]
         return nodes
 
@@ -120,44 +253,71 @@ class ChdrEndpoint:
     def begin_rx(self, dst_epid):
         pass # TODO: currently not implemented
 
-    def socket_worker(self):
-        """This is the method that runs in a background thread. It
-        blocks on the CHDR socket and processes packets as they come
-        in.
+    def recv_burst(self, main_sock, recv_ring):
+        """Drain up to len(recv_ring) datagrams from main_sock without
+        blocking, then hand each of them to the graph. This is called
+        from the ChdrEventLoop thread.
         """
-        self.log.info("Starting ChdrEndpoint Thread")
-        main_sock = socket.socket(socket.AF_INET,
-                                  socket.SOCK_DGRAM)
-        main_sock.bind(("0.0.0.0", 49153))
+        received = []
+        for buffer in recv_ring:
+            try:
+                n_bytes, sender = main_sock.recvfrom_into(buffer, 0, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            received.append((buffer, n_bytes, sender))
+            if self.capture is not None:
+                self.capture.record(PacketCapture.RX, buffer[:n_bytes], sender)
+        trace_enabled = self.log.isEnabledFor(TRACE)
+        for buffer, n_bytes, sender in received:
+            if trace_enabled:
+                self.log.trace("Received %d bytes of data from %s", n_bytes, sender)
+            try:
+                packet = ChdrPacket.deserialize(CHDR_W, bytes(buffer[:n_bytes]))
+                trace_packet(self.log, "chdr_endpoint", "Decoded Packet: %s", packet)
+                entry_xport = (NodeType.XPORT, 0)
+                response = self.graph.handle_packet(packet, entry_xport, sender,
+                                                    sender, n_bytes)
 
-        while True:
-            # This allows us to block on multiple sockets at the same time
-            ready_list, _, _ = select.select([main_sock, self.send_queue], [], [])
-            buffer = bytearray(8000) # Max MTU
-            for sock in ready_list:
-                if sock is main_sock:
-                    # Received Data over socket
-                    n_bytes, sender = main_sock.recvfrom_into(buffer)
-                    self.log.trace("Received {} bytes of data from {}"
-                                   .format(n_bytes, sender))
-                    try:
-                        packet = ChdrPacket.deserialize(CHDR_W, buffer[:n_bytes])
-                        self.log.trace("Decoded Packet: {}"
-                                       .format(packet.to_string_with_payload()))
-                        entry_xport = (NodeType.XPORT, 0)
-                        response = self.graph.handle_packet(packet, entry_xport, sender,
-                                                            sender, n_bytes)
-
-                        if response is not None:
-                            data = response.serialize()
-                            self.log.trace("Returning Packet: {}"
-                                           .format(packet.to_string_with_payload()))
-                            main_sock.sendto(bytes(data), sender)
-                    except BaseException as ex:
-                        self.log.warning("Unable to decode packet: {}"
-                                         .format(ex))
-                        raise ex
-                else:
-                    data, addr = self.send_queue.get()
-                    sent_len = main_sock.sendto(data, addr)
-                    assert len(data) == sent_len, "Didn't send whole packet."
+                if response is not None:
+                    data = response.serialize()
+                    trace_packet(self.log, "chdr_endpoint", "Returning Packet: %s", response)
+                    self.sendto(bytes(data), sender)
+            except Exception as ex:
+                # Drop the packet, but keep serving this and every other
+                # endpoint on the event loop
+                self.log.error("Dropping packet of {} bytes from {}: {}"
+                               .format(n_bytes, sender, ex))
+                if self.capture is not None:
+                    self.dump_capture()
+
+    def sendto(self, data, addr):
+        """Send data to addr on this endpoint's socket. This is called
+        from the ChdrEventLoop thread.
+        """
+        sent_len = self.sock.sendto(data, addr)
+        assert len(data) == sent_len, "Didn't send whole packet."
+        if self.capture is not None:
+            self.capture.record(PacketCapture.TX, data, addr)
+
+    def get_stats(self):
+        """Return the packet statistics of every node in the graph, as
+        well as those of its streams, as a dict
+        """
+        return self.graph.get_stats()
+
+    def reset_stats(self):
+        """Clear the packet statistics of every node in the graph"""
+        self.graph.reset_stats()
+
+    def dump_capture(self, path=None):
+        """Write the packet capture ring to a pcap file at path (or the
+        configured capture path, if path is None) and return the path.
+        Raises a RuntimeError if packet capture is disabled.
+        """
+        if self.capture is None:
+            raise RuntimeError("Packet capture is disabled. "
+                               "Set [capture] packets in the simulator config.")
+        path = path or self.capture_path
+        count = self.capture.dump(path)
+        self.log.info("Wrote {} captured packets to {}".format(count, path))
+        return path
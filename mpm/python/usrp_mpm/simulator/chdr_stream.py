@@ -9,10 +9,26 @@ handles managing threads, as well as interfacing with sample sources
 and sinks.
 """
 import time
+from functools import partial
 from threading import Thread
 import queue
 import socket
-from uhd.chdr import PacketType, StrcOpCode, StrcPayload, StrsPayload, StrsStatus, ChdrHeader, ChdrPacket
+import struct
+from uhd.chdr import PacketType, StrcOpCode, StrcPayload, StrsPayload, StrsStatus, ChdrHeader, \
+    ChdrPacket, ChdrWidth
+from .rfnoc_common import trace_packet, SC16_BYTES
+from .virtual_clock import VirtualClock
+
+def chdr_header_len(chdr_w, has_timestamp):
+    """Return the length in bytes of a CHDR header (including the
+    timestamp, if present) for a given ChdrWidth
+    """
+    chdr_w_bytes = 8 << int(chdr_w)
+    # The timestamp and header take up 2 chdr_w lengths only when
+    # CHDR_W = 64 bits (RFNoC Specification section 2.2.1)
+    if has_timestamp and chdr_w == ChdrWidth.W64:
+        return 2 * chdr_w_bytes
+    return chdr_w_bytes
 
 class XferCount:
     """This class keeps track of flow control transfer status which are
@@ -56,15 +72,152 @@ class XferCount:
     def __str__(self):
         return "XferCount{{num_bytes:{}, num_packets:{}}}".format(self.num_bytes, self.num_packets)
 
+class DataPacketTemplate:
+    """This class holds a pre-serialized CHDR data packet header and a
+    reusable send buffer for a single output stream.
+
+    The header is packed once per stream. For every packet, only the
+    seq_num, length and (optional) timestamp fields are patched in
+    place, and the sample source writes the payload directly into
+    the buffer returned by payload_view().
+
+    The payload always starts at the same offset in the buffer. A
+    packet without a timestamp simply starts later in the buffer than
+    a packet with one, so the payload never has to be moved.
+    """
+    # Fields which are patched per packet, see chdr_types.hpp:chdr_header
+    SEQ_NUM_OFFSET = 32
+    LENGTH_OFFSET = 16
+    PATCH_MASK = ~((0xFFFF << SEQ_NUM_OFFSET) | (0xFFFF << LENGTH_OFFSET))
+    WORD = struct.Struct("<Q")
+
+    def __init__(self, chdr_w, dst_epid, max_payload_size):
+        header = ChdrHeader()
+        header.dst_epid = dst_epid
+        header.pkt_type = PacketType.DATA_NO_TS
+        self.header_no_ts = header.pack() & DataPacketTemplate.PATCH_MASK
+        header.pkt_type = PacketType.DATA_WITH_TS
+        self.header_with_ts = header.pack() & DataPacketTemplate.PATCH_MASK
+        self.len_no_ts = chdr_header_len(chdr_w, False)
+        self.len_with_ts = chdr_header_len(chdr_w, True)
+        self.payload_offset = self.len_with_ts
+        self.buffer = bytearray(self.payload_offset + max_payload_size)
+        self.view = memoryview(self.buffer)
+
+    def payload_view(self, payload_size):
+        """Return a writable view of the payload area of the buffer"""
+        return self.view[self.payload_offset:self.payload_offset + payload_size]
+
+    def finalize(self, seq_num, payload_size, timestamp):
+        """Patch the header (and timestamp) in front of a payload of
+        payload_size bytes and return a view of the complete packet.
+        """
+        if timestamp is None:
+            start = self.payload_offset - self.len_no_ts
+            header = self.header_no_ts
+        else:
+            start = self.payload_offset - self.len_with_ts
+            header = self.header_with_ts
+            DataPacketTemplate.WORD.pack_into(self.buffer, start + 8, timestamp)
+        length = self.payload_offset - start + payload_size
+        header |= (seq_num << DataPacketTemplate.SEQ_NUM_OFFSET) \
+            | (length << DataPacketTemplate.LENGTH_OFFSET)
+        DataPacketTemplate.WORD.pack_into(self.buffer, start, header)
+        return self.view[start:self.payload_offset + payload_size]
+
+class PacketPacer:
+    """This class paces packets to a requested rate, measured on a
+    VirtualClock.
+
+    It keeps a schedule of deadlines, one per packet, and works like a
+    token bucket: whenever it has fallen behind the schedule, it grants
+    a burst of packets without sleeping (and without reading the clock
+    again until the burst is used up). At most max_burst packets of
+    backlog are kept. If the sender falls further behind, the excess is
+    forgiven, so the achieved rate drops below the requested one rather
+    than the stream later bursting indefinitely.
+
+    If the clock is not real time (AFAP mode), waiting moves the clock
+    forward instead of sleeping, and no backlog is ever forgiven.
+
+    The first packet is due at start_time (in clock.elapsed() seconds),
+    or immediately if start_time is None.
+
+    The achieved rate is logged every REPORT_INTERVAL virtual seconds.
+    """
+    REPORT_INTERVAL = 1.0 # seconds
+
+    def __init__(self, log, seconds_per_packet, max_burst, clock=None, start_time=None):
+        self.log = log
+        self.period = seconds_per_packet
+        self.max_burst = max(1, max_burst)
+        self.clock = clock if clock is not None else VirtualClock()
+        now = self.clock.elapsed()
+        self.start_time = max(now, start_time) if start_time is not None else now
+        self.next_deadline = self.start_time
+        self.credit = 0
+        self.num_packets = 0
+        self._report_time = self.start_time
+        self._report_packets = 0
+
+    def wait(self, period=None):
+        """Block until the next packet may be sent. period is how long
+        this packet takes up on the schedule, and defaults to the period
+        the pacer was created with.
+        """
+        if self.credit == 0:
+            now = self.clock.elapsed()
+            if now < self.next_deadline:
+                self.clock.sleep_until(self.next_deadline)
+                now = self.clock.elapsed()
+            backlog = int((now - self.next_deadline) / self.period) + 1
+            if backlog > self.max_burst and self.clock.is_realtime():
+                self.next_deadline = now - (self.max_burst - 1) * self.period
+                backlog = self.max_burst
+            self.credit = backlog
+            if now - self._report_time >= PacketPacer.REPORT_INTERVAL:
+                self._report(now)
+        self.credit -= 1
+        self.next_deadline += self.period if period is None else period
+        self.num_packets += 1
+
+    def requested_rate(self):
+        """Return the requested rate in packets/sec"""
+        return 1 / self.period
+
+    def achieved_rate(self):
+        """Return the average rate since the start in packets/sec"""
+        elapsed = self.clock.elapsed() - self.start_time
+        return self.num_packets / elapsed if elapsed > 0 else 0.0
+
+    def _report(self, now):
+        interval_rate = (self.num_packets - self._report_packets) / (now - self._report_time)
+        self.log.debug("Achieved %.1f packets/sec of requested %.1f packets/sec",
+                       interval_rate, self.requested_rate())
+        self._report_time = now
+        self._report_packets = self.num_packets
+
 class ChdrInputStream:
     """This class encapsulates an Rx Thread. This thread blocks on a
     queue which receives STRC and DATA ChdrPackets. It places the data
     packets into the sample_sink and responds to the STRC packets using
     the send_wrapper
+
+    queue_depth sets how many packets may be waiting for the worker, and
+    capacity_bytes is the buffer size advertised to the upstream
+    endpoint. The worker drains up to DRAIN_BATCH packets per wakeup,
+    and sends at most one flow control STRS per batch.
+
+    queue_packet() is called from the ChdrEventLoop thread, which may be
+    shared by many endpoints, so it never blocks: a packet which arrives
+    while the queue is full is dropped and counted. get_stats() reports
+    the achieved receive rate and the number of dropped packets.
     """
     CAPACITY_BYTES = int(5e3) # 5 KB
     QUEUE_CAP = 3
-    def __init__(self, log, chdr_w, sample_sink, send_wrapper, our_epid):
+    DRAIN_BATCH = 64
+    def __init__(self, log, chdr_w, sample_sink, send_wrapper, our_epid,
+                 queue_depth=QUEUE_CAP, capacity_bytes=CAPACITY_BYTES):
         self.log = log
         self.chdr_w = chdr_w
         self.sample_sink = sample_sink
@@ -76,58 +229,92 @@ class ChdrInputStream:
         self.command_addr = None
         self.command_epid = None
         self.our_epid = our_epid
-        self.rx_queue = queue.Queue(ChdrInputStream.QUEUE_CAP)
+        self.capacity_bytes = capacity_bytes
+        self.rx_queue = queue.Queue(queue_depth)
         self.stop = False
+        self.total = XferCount()
+        self.first_time = None
+        self.last_time = None
+        self.num_dropped = 0
         self.thread = Thread(target=self._rx_worker, daemon=True)
         self.thread.start()
 
     def _rx_worker(self):
         self.log.info("Stream RX Worker Starting")
-        while True:
-            packet, recv_len, addr = self.rx_queue.get()
-            # This break is here because when ChdrInputStream.stop() is called,
-            # a tuple of 3 None values is pushed into the queue to unblock the worker.
-            if self.stop:
-                break
-            header = packet.get_header()
-            self.xfer.count_packet(recv_len)
-            self.accum.count_packet(recv_len)
-            pkt_type = header.pkt_type
-            if pkt_type in (PacketType.DATA_WITH_TS, PacketType.DATA_NO_TS):
-                self.sample_sink.accept_packet(packet)
-            elif pkt_type == PacketType.STRC:
-                req_payload = packet.get_payload_strc()
-                # Ping doesn't change anything, just requests a stream status packet
-                if req_payload.op_code == StrcOpCode.INIT:
-                    self.xfer.clear()
-                    self.fc_freq = XferCount.from_strc(req_payload)
-                    self.command_addr = addr
-                    self.command_epid = req_payload.src_epid
-                elif req_payload.op_code == StrcOpCode.RESYNC:
-                    self.xfer = XferCount.from_strc(req_payload)
-                resp_packet = self._generate_strs_packet(req_payload.src_epid, self.our_epid)
-                self.send_wrapper.send_packet(resp_packet, addr)
-            else:
-                raise RuntimeError("RX Worker received unsupported packet: {}".format(pkt_type))
-
-            # Check if a fc status packet is due
-            if self.fc_freq is not None and self.accum.has_exceeded(self.fc_freq):
-                self.accum.clear()
+        while not self.stop:
+            fc_due = False
+            for packet, recv_len, addr in self._get_batch():
+                # When ChdrInputStream.finish() is called, a tuple of 3
+                # None values is pushed into the queue to unblock the worker.
+                if self.stop:
+                    break
+                self._handle_packet(packet, recv_len, addr)
+                # Check if a fc status packet is due
+                if self.fc_freq is not None and self.accum.has_exceeded(self.fc_freq):
+                    self.accum.clear()
+                    fc_due = True
+            # Any number of due fc updates is satisfied by one STRS
+            # carrying the latest transfer counts
+            if fc_due and not self.stop:
                 self.log.trace("Flow Control Due, sending STRS")
                 self.command_target = None
                 resp_packet = self._generate_strs_packet(self.command_epid, self.our_epid)
-                self.log.trace("Sending Flow Control: {}".format(resp_packet.to_string_with_payload()))
+                trace_packet(self.log, "chdr_stream", "Sending Flow Control: %s", resp_packet)
                 self.send_wrapper.send_packet(resp_packet, self.command_addr)
 
         self.sample_sink.close()
         self.log.info("Stream RX Worker Done")
 
+    def _get_batch(self):
+        """Block until at least one packet is queued, then return up to
+        DRAIN_BATCH queued packets
+        """
+        batch = [self.rx_queue.get()]
+        try:
+            while len(batch) < ChdrInputStream.DRAIN_BATCH:
+                batch.append(self.rx_queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _handle_packet(self, packet, recv_len, addr):
+        """Account for and process a single DATA or STRC packet"""
+        header = packet.get_header()
+        self.xfer.count_packet(recv_len)
+        self.accum.count_packet(recv_len)
+        pkt_type = header.pkt_type
+        if pkt_type in (PacketType.DATA_WITH_TS, PacketType.DATA_NO_TS):
+            self.last_time = time.monotonic()
+            if self.first_time is None:
+                self.first_time = self.last_time
+            self.total.count_packet(recv_len)
+            self.sample_sink.accept_packet(packet)
+        elif pkt_type == PacketType.STRC:
+            req_payload = packet.get_payload_strc()
+            # Ping doesn't change anything, just requests a stream status packet
+            if req_payload.op_code == StrcOpCode.INIT:
+                self.xfer.clear()
+                self.fc_freq = XferCount.from_strc(req_payload)
+                self.command_addr = addr
+                self.command_epid = req_payload.src_epid
+            elif req_payload.op_code == StrcOpCode.RESYNC:
+                self.xfer = XferCount.from_strc(req_payload)
+            resp_packet = self._generate_strs_packet(req_payload.src_epid, self.our_epid)
+            self.send_wrapper.send_packet(resp_packet, addr)
+        else:
+            raise RuntimeError("RX Worker received unsupported packet: {}".format(pkt_type))
+
     def finish(self):
         """Unblocks the worker and stops the thread.
         The worker will close its sample_sink
         """
         self.stop = True
-        self.rx_queue.put((None, None, None))
+        try:
+            self.rx_queue.put_nowait((None, None, None))
+        except queue.Full:
+            # The worker isn't waiting on an empty queue, it will see
+            # self.stop after its current batch
+            pass
 
     def _generate_strs_packet(self, dst_epid, src_epid):
         """Create an strs packet from the information in self.xfer"""
@@ -136,7 +323,7 @@ class ChdrInputStream:
         resp_payload = StrsPayload()
         resp_payload.src_epid = src_epid
         resp_payload.status = StrsStatus.OKAY
-        resp_payload.capacity_bytes = ChdrInputStream.CAPACITY_BYTES
+        resp_payload.capacity_bytes = self.capacity_bytes
         resp_payload.capacity_pkts = 0xFFFFFF
         resp_payload.xfer_count_bytes = self.xfer.num_bytes
         resp_payload.xfer_count_pkts = self.xfer.num_packets
@@ -144,8 +331,34 @@ class ChdrInputStream:
         return resp_packet
 
     def queue_packet(self, packet, recv_len, addr):
-        """Queue a packet to be processed by the ChdrInputStream"""
-        self.rx_queue.put((packet, recv_len, addr))
+        """Queue a packet to be processed by the ChdrInputStream. If the
+        queue is full, the packet is dropped rather than blocking the
+        event loop thread.
+        """
+        try:
+            self.rx_queue.put_nowait((packet, recv_len, addr))
+        except queue.Full:
+            if self.num_dropped == 0:
+                self.log.warning("RX queue full, dropping packets. Is the "
+                                 "sender ignoring flow control?")
+            self.num_dropped += 1
+
+    def get_stats(self):
+        """Return the data packets and bytes received, the achieved
+        rate in packets/sec and bytes/sec between the first and last
+        data packet, and the number of packets dropped on a full queue,
+        as a dict
+        """
+        elapsed = 0.0
+        if self.first_time is not None:
+            elapsed = self.last_time - self.first_time
+        return {
+            'packets': self.total.num_packets,
+            'bytes': self.total.num_bytes,
+            'packets_per_sec': self.total.num_packets / elapsed if elapsed > 0 else 0.0,
+            'bytes_per_sec': self.total.num_bytes / elapsed if elapsed > 0 else 0.0,
+            'dropped_packets': self.num_dropped,
+        }
 
 class ChdrOutputStream:
     """This class encapsulates a Tx Thread. It takes data from its
@@ -154,6 +367,20 @@ class ChdrOutputStream:
 
     The tx stream is configured using the stream_spec object, which
     sets parameters such as sample rate and destination
+
+    If the sample_source provides a fill_buffer() method, packets are
+    assembled from a DataPacketTemplate without constructing a
+    ChdrPacket per packet. Otherwise, the source's fill_packet() is used.
+
+    Every packet is sent as DATA_WITH_TS. Timestamps are counted in
+    ticks of the stream_spec's VirtualClock, starting at the requested
+    time for timed streams and at the current time otherwise, and
+    advance with the number of samples sent. Pacing uses the same clock,
+    and schedules every packet for exactly as long as its samples last,
+    so the timestamps keep up with the clock.
+
+    get_stats() reports the achieved and requested rate, and how long
+    the stream stalled waiting for flow control credit.
     """
     def __init__(self, log, chdr_w, sample_source, stream_spec, send_wrapper):
         self.log = log
@@ -167,6 +394,8 @@ class ChdrOutputStream:
         self.strs_queue = queue.Queue(100)
         self.strc_seq_num = 0
         self.data_seq_num = 0
+        self.pacer = None
+        self.stall_time = 0.0
 
         self.thread = Thread(target=self._tx_worker, daemon=True)
         self.thread.start()
@@ -176,11 +405,19 @@ class ChdrOutputStream:
                       .format(1/self.stream_spec.seconds_per_packet()))
         self.log.info("Downstream Buffer Capacity: {} packets or {} bytes"
                       .format(self.stream_spec.capacity_packets, self.stream_spec.capacity_bytes))
-        header = ChdrHeader()
-        start_time = time.time()
-        next_send = start_time
-        header.dst_epid = self.stream_spec.dst_epid
-        header.pkt_type = PacketType.DATA_NO_TS
+        clock = self.stream_spec.clock
+        if self.stream_spec.is_timed:
+            first_timestamp = self.stream_spec.init_timestamp
+            start_time = clock.ticks_to_elapsed(first_timestamp)
+        else:
+            first_timestamp = clock.get_ticks()
+            start_time = None
+        ticks_per_sample = clock.tick_rate / self.stream_spec.sample_rate
+        header_len = chdr_header_len(self.chdr_w, True)
+        num_samps_sent = 0
+        pacer = PacketPacer(self.log, self.stream_spec.seconds_per_packet(),
+                            self.stream_spec.max_burst, clock, start_time)
+        self.pacer = pacer
 
         is_continuous = self.stream_spec.is_continuous
         num_samps_left = None
@@ -188,49 +425,101 @@ class ChdrOutputStream:
             # TODO: Put sample format/width in the stream spec
             num_samps_left = self.stream_spec.total_samples * 4 # SC16 is 4 bytes per sample
 
-        timestamp = self.stream_spec.init_timestamp  \
-            if self.stream_spec.is_timed else None
+        if hasattr(self.sample_source, "fill_buffer"):
+            template = DataPacketTemplate(self.chdr_w, self.stream_spec.dst_epid,
+                                          self.stream_spec.packet_samples)
+            make_packet = partial(self._make_packet_from_template, template)
+        else:
+            make_packet = self._make_packet
 
         while is_continuous or num_samps_left > 0:
             if self.stop:
                 self.log.info("Stream Worker Stopped")
                 break
-            header.seq_num = self.data_seq_num
+            seq_num = self.data_seq_num
             # When seq_num gets to 65535 (Max Unsigned 16 bit integer)
             # It wraps back around to 0
             self.data_seq_num = int(self.data_seq_num + 1) & 0xFFFF
-            packet = ChdrPacket(self.chdr_w, header, bytes(0), timestamp)
             packet_samples = self.stream_spec.packet_samples
             if num_samps_left is not None:
                 packet_samples = min(packet_samples, num_samps_left)
                 num_samps_left -= packet_samples
-            packet = self.sample_source.fill_packet(packet, packet_samples)
-            if packet is None:
+            timestamp = first_timestamp + round(num_samps_sent * ticks_per_sample)
+            send_data = make_packet(seq_num, packet_samples, timestamp)
+            if send_data is None:
                 break
-            send_data = bytes(packet.serialize()) # Serialize before waiting
+            num_samps = (len(send_data) - header_len) // SC16_BYTES
+            num_samps_sent += num_samps
 
-            delay = next_send - time.time()
-            if delay > 0:
-                time.sleep(delay)
-            next_send = next_send + self.stream_spec.seconds_per_packet()
-
-            timestamp = None
+            pacer.wait(num_samps / self.stream_spec.sample_rate)
 
             # Check Flow Control to assert there is space downstream
-            while not self._can_fit_packet(len(send_data)):
-                strs_update = self.strs_queue.get()
-                strs_payload = strs_update.get_payload_strs()
-                self._update_recv(strs_payload)
+            if not self._can_fit_packet(len(send_data)):
+                start_time = time.monotonic()
+                while not self._can_fit_packet(len(send_data)):
+                    strs_update = self.strs_queue.get()
+                    strs_payload = strs_update.get_payload_strs()
+                    self._update_recv(strs_payload)
+                self.stall_time += time.monotonic() - start_time
 
             self.send_wrapper.send_data(send_data, self.stream_spec.addr)
             self.xfer.count_packet(len(send_data))
 
         self.log.info("Stream Worker Done")
-        finish_time = time.time()
-        self.log.info("Actual Packet Rate was {} packets/sec"
-                      .format(self.xfer.num_packets/(finish_time - start_time)))
+        self.log.info("Actual Packet Rate was {} packets/sec (requested {} packets/sec)"
+                      .format(pacer.achieved_rate(), pacer.requested_rate()))
         self.sample_source.close()
 
+    def _make_packet(self, seq_num, payload_size, timestamp):
+        """Build and serialize a data packet using the sample source's
+        fill_packet(). Returns None if the source is exhausted.
+        """
+        header = ChdrHeader()
+        header.dst_epid = self.stream_spec.dst_epid
+        header.pkt_type = PacketType.DATA_NO_TS if timestamp is None \
+            else PacketType.DATA_WITH_TS
+        header.seq_num = seq_num
+        packet = ChdrPacket(self.chdr_w, header, bytes(0), timestamp)
+        packet = self.sample_source.fill_packet(packet, payload_size)
+        if packet is None:
+            return None
+        return bytes(packet.serialize())
+
+    def _make_packet_from_template(self, template, seq_num, payload_size, timestamp):
+        """Assemble a data packet in place using the sample source's
+        fill_buffer(). Returns None if the source is exhausted.
+        """
+        num_bytes = self.sample_source.fill_buffer(template.payload_view(payload_size),
+                                                   payload_size)
+        if num_bytes == 0:
+            return None
+        # The template buffer is reused for the next packet, so hand the
+        # socket thread an immutable copy of this one.
+        return bytes(template.finalize(seq_num, num_bytes, timestamp))
+
+    def get_rates(self):
+        """Return the (achieved, requested) packet rate of this stream in
+        packets/sec, or None if the stream has not started pacing yet
+        """
+        pacer = self.pacer
+        if pacer is None:
+            return None
+        return (pacer.achieved_rate(), pacer.requested_rate())
+
+    def get_stats(self):
+        """Return the data packets and bytes sent, the achieved and
+        requested rate in packets/sec, and the time in seconds the
+        stream stalled waiting for flow control, as a dict
+        """
+        rates = self.get_rates()
+        return {
+            'packets': self.xfer.num_packets,
+            'bytes': self.xfer.num_bytes,
+            'packets_per_sec': rates[0] if rates is not None else 0.0,
+            'requested_packets_per_sec': rates[1] if rates is not None else 0.0,
+            'fc_stall_sec': self.stall_time,
+        }
+
     def finish(self):
         """Stops the ChdrOutputStream"""
         self.stop = True
@@ -13,6 +13,10 @@ it identifies itself as.
 import configparser
 from .sample_source import sinks, sources, NullSamples, from_import_path
 from .hardware_presets import presets
+from .rfnoc_common import StreamSpec
+from .chdr_stream import ChdrInputStream
+from .virtual_clock import VirtualClock
+from .packet_capture import PacketCapture
 import numbers
 
 class HardwareDescriptor:
@@ -64,11 +68,54 @@ class Config:
     Source/Sink class to instanitate (see the decorators in
     sample_source.py). The other key value pairs in the section are
     passed to the source/sink constructor as strings through **kwargs
+
+    It may have a [stream] section with the following optional keys:
+    - max_burst: How many packets a simulated RX stream may send back
+      to back when it has fallen behind its sample rate
+    - rx_queue_depth: How many received packets a simulated TX stream
+      may buffer. Packets arriving while it is full are dropped
+    - rx_capacity_bytes: The buffer capacity a simulated TX stream
+      advertises to UHD, which bounds the bytes UHD keeps in flight.
+      This should be consistent with rx_queue_depth.
+
+    It may have a [trace] section with a 'packet_dumps' key, which is a
+    comma separated list of simulator modules (e.g.
+    "chdr_endpoint, stream_endpoint_node") whose TRACE output should
+    include full packet dumps. Packet dumps are disabled by default.
+
+    It may have a [clock] section with the following optional keys:
+    - mode: "realtime" (the default) to run the simulated device clock
+      off the wall clock, or "afap" to run streams as fast as possible
+      and advance the clock as they go
+    - speed: In realtime mode, how many times faster than real time the
+      simulated device clock runs (default 1.0)
+
+    It may have a [capture] section with the following optional keys:
+    - packets: How many of the most recent CHDR datagrams to keep in
+      the packet capture ring. 0 (the default) disables capture.
+    - snaplen: How many bytes of each datagram to keep
+    - path: Where to write the pcap file when the ring is dumped. A
+      {port} placeholder is replaced by the device's CHDR port.
     """
-    def __init__(self, source_gen, sink_gen, hardware):
+    def __init__(self, source_gen, sink_gen, hardware, packet_dumps=(),
+                 max_burst=StreamSpec.DEFAULT_MAX_BURST,
+                 rx_queue_depth=ChdrInputStream.QUEUE_CAP,
+                 rx_capacity_bytes=ChdrInputStream.CAPACITY_BYTES,
+                 clock_mode=VirtualClock.REALTIME, clock_speed=1.0,
+                 capture_packets=0, capture_snaplen=PacketCapture.DEFAULT_SNAPLEN,
+                 capture_path=PacketCapture.DEFAULT_PATH):
         self.source_gen = source_gen
         self.sink_gen = sink_gen
         self.hardware = hardware
+        self.packet_dumps = packet_dumps
+        self.max_burst = max_burst
+        self.rx_queue_depth = rx_queue_depth
+        self.rx_capacity_bytes = rx_capacity_bytes
+        self.clock_mode = clock_mode
+        self.clock_speed = clock_speed
+        self.capture_packets = capture_packets
+        self.capture_snaplen = capture_snaplen
+        self.capture_path = capture_path
 
     @classmethod
     def from_path(cls, log, path):
@@ -86,6 +133,34 @@ class Config:
         if 'sample.sink' in parser:
             sink_gen = Config._read_sample_section(parser['sample.sink'], sinks)
             parser.pop('sample.sink')
+        stream_args = {}
+        if 'stream' in parser:
+            stream_section = parser['stream']
+            for key in ('max_burst', 'rx_queue_depth', 'rx_capacity_bytes'):
+                if key in stream_section:
+                    stream_args[key] = stream_section.getint(key)
+            parser.pop('stream')
+        packet_dumps = ()
+        if 'trace' in parser:
+            packet_dumps = Config._read_list(parser['trace'].get('packet_dumps', ''))
+            parser.pop('trace')
+        clock_args = {}
+        if 'clock' in parser:
+            clock_section = parser['clock']
+            if 'mode' in clock_section:
+                clock_args['clock_mode'] = clock_section['mode'].strip().lower()
+            if 'speed' in clock_section:
+                clock_args['clock_speed'] = clock_section.getfloat('speed')
+            parser.pop('clock')
+        capture_args = {}
+        if 'capture' in parser:
+            capture_section = parser['capture']
+            for key in ('packets', 'snaplen'):
+                if key in capture_section:
+                    capture_args['capture_' + key] = capture_section.getint(key)
+            if 'path' in capture_section:
+                capture_args['capture_path'] = capture_section['path']
+            parser.pop('capture')
         hardware_section = dict(parser['hardware'])
         preset_name = hardware_section.get('preset', None)
         hardware_preset = presets[preset_name].copy() if preset_name is not None else {}
@@ -99,7 +174,12 @@ class Config:
             # This helps stop you from shooting yourself in the foot when you add
             # the [sampel.sink] section
             log.warning("Unrecognized section in config file: {}".format(unused_section))
-        return cls(source_gen, sink_gen, hardware)
+        return cls(source_gen, sink_gen, hardware, packet_dumps, **stream_args, **clock_args,
+                   **capture_args)
+
+    @staticmethod
+    def _read_list(value):
+        return tuple(item.strip() for item in value.split(',') if item.strip())
 
     @staticmethod
     def _read_sample_section(section, lookup):
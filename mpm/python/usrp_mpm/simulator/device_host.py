@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Host many simulated devices in one process.
+
+Every simulated device gets its own ChdrEndpoint (and therefore its own
+address/port, device_id and RFNoCGraph), but all of them are polled by a
+single shared ChdrEventLoop. Run it with:
+
+    python3 -m usrp_mpm.simulator.device_host --num-devices 16
+
+By default, device i listens on the CHDR port plus i. Alternatively,
+pass a list of addresses (for example, loopback aliases such as
+127.0.1.1,127.0.1.2,...) and every device listens on the same port at
+its own address.
+
+Note that the host only covers the CHDR data plane. It does not run an MPM
+RPC server or a discovery responder for the hosted devices, so UHD cannot
+find or claim them the way it does with a full simulated device (see
+periph_manager/sim.py). It is meant for driving CHDR traffic directly, such
+as in benchmarks (see benchmark.py) and tests, or for load testing the
+data plane of many devices at once.
+"""
+
+import argparse
+import threading
+from usrp_mpm.mpmlog import get_main_logger
+from .chdr_endpoint import ChdrEndpoint, ChdrEventLoop
+from .config import Config
+
+class MultiDeviceHost:
+    """Creates and owns a ChdrEndpoint for each config in configs.
+
+    If bind_addrs is None, device i binds to 0.0.0.0 at base_port + i.
+    Otherwise, bind_addrs must contain one address per config, and every
+    device binds to base_port at its own address.
+
+    Device ids are assigned sequentially, starting at first_device_id.
+    """
+    def __init__(self, log, configs, base_port=ChdrEndpoint.CHDR_PORT,
+                 bind_addrs=None, first_device_id=1):
+        self.log = log.getChild("MultiDeviceHost")
+        if bind_addrs is not None and len(bind_addrs) != len(configs):
+            raise ValueError("Expected {} bind addresses, got {}"
+                             .format(len(configs), len(bind_addrs)))
+        self.event_loop = ChdrEventLoop(log)
+        self.endpoints = []
+        for index, config in enumerate(configs):
+            if bind_addrs is None:
+                addr, port = "0.0.0.0", base_port + index
+            else:
+                addr, port = bind_addrs[index], base_port
+            endpoint = ChdrEndpoint(log, config, port=port, bind_addr=addr,
+                                    event_loop=self.event_loop)
+            endpoint.set_device_id(first_device_id + index)
+            self.endpoints.append(endpoint)
+        self.log.info("Hosting {} simulated devices".format(len(self.endpoints)))
+
+    def get_device_list(self):
+        """Return a list of (device_id, bind_addr, port) tuples, one per
+        hosted device.
+        """
+        return [(endpoint.graph.get_device_id(), endpoint.bind_addr, endpoint.port)
+                for endpoint in self.endpoints]
+
+def parse_args():
+    """Parse arguments when running this as a script"""
+    parser_help = 'Host many simulated USRPs in one process'
+    parser = argparse.ArgumentParser(description=parser_help)
+    parser.add_argument('--num-devices', type=int, default=2,
+                        help='Number of simulated devices')
+    parser.add_argument('--config', default=None,
+                        help='Simulator config file used for every device')
+    parser.add_argument('--base-port', type=int, default=ChdrEndpoint.CHDR_PORT,
+                        help='CHDR port of the first device')
+    parser.add_argument('--addrs', default=None,
+                        help='Comma separated list of one bind address per device. '
+                             'If given, all devices use --base-port.')
+    return parser.parse_args()
+
+def main():
+    """Run the device host as a script"""
+    args = parse_args()
+    log = get_main_logger(use_logbuf=False)
+    if args.config is not None:
+        configs = [Config.from_path(log, args.config) for _ in range(args.num_devices)]
+    else:
+        configs = [Config.default() for _ in range(args.num_devices)]
+    bind_addrs = None
+    if args.addrs is not None:
+        bind_addrs = [addr.strip() for addr in args.addrs.split(',')]
+    host = MultiDeviceHost(log, configs, args.base_port, bind_addrs)
+    for device_id, addr, port in host.get_device_list():
+        print("Device {}: {}:{}".format(device_id, addr, port))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -214,9 +214,10 @@ class NocBlockRegs:
         elif reg == REG_RX_CMD_TIME_LO:
             self.get_stream_spec().set_timestamp_lo(value)
         elif reg == REG_RX_CMD:
-            if value & (1 << 31) != 0:
-                value = value & ~(1 << 31) # Clear the flag
-                self.get_stream_spec().is_timed = True
+            # Every command sets or clears the timed flag, so a timed
+            # stream doesn't make all later streams timed as well
+            self.get_stream_spec().is_timed = value & (1 << 31) != 0
+            value = value & ~(1 << 31) # Clear the flag
             if value == RX_CMD_STOP:
                 sep_block_id = self.resolve_ep_towards_outputs((self.get_radio_port(), chan))
                 self.stop_tx_stream(sep_block_id)
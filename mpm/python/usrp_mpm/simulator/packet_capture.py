@@ -0,0 +1,166 @@
+#
+# Copyright 2020 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""This module houses the PacketCapture class, a fixed size ring of raw
+CHDR datagrams which can be written out as a pcap file and inspected
+with the RFNoC Wireshark dissectors (see tools/dissectors).
+"""
+
+import socket
+import struct
+import time
+from array import array
+from threading import Lock
+
+class PacketCapture:
+    """Records the most recent num_slots datagrams seen by a
+    ChdrEndpoint.
+
+    All storage is allocated up front. Recording a datagram copies at
+    most snaplen bytes of it into the next slot of the ring and stores
+    its direction, peer address and time.monotonic() timestamp, so the
+    datapath never formats or allocates anything per packet.
+
+    dump() writes the ring, oldest datagram first, as a pcap file with
+    raw IPv4 link type. Every datagram is wrapped in an IPv4 and UDP
+    header built from the local and peer address, so that Wireshark
+    hands it to the dissector registered for the CHDR UDP port. If the
+    endpoint is bound to the wildcard address, the local address of
+    each datagram is the one the kernel would use to reach its peer.
+    """
+    RX = 0
+    TX = 1
+    DEFAULT_SNAPLEN = 8000 # The simulator's MTU
+    DEFAULT_PATH = "/tmp/usrp_sim_chdr_{port}.pcap"
+    PCAP_HEADER = struct.Struct("<IHHiIII")
+    PCAP_RECORD = struct.Struct("<IIII")
+    PCAP_MAGIC = 0xA1B2C3D4
+    LINKTYPE_RAW = 101
+    IPV4_HEADER = struct.Struct("!BBHHHBBH4s4s")
+    UDP_HEADER = struct.Struct("!HHHH")
+    HEADERS_LEN = IPV4_HEADER.size + UDP_HEADER.size
+    IPPROTO_UDP = 17
+    TTL = 64
+    ANY_ADDR = "0.0.0.0"
+    FALLBACK_ADDR = "127.0.0.1"
+
+    def __init__(self, num_slots, snaplen, local_addr):
+        assert num_slots > 0 and snaplen > 0
+        self.num_slots = num_slots
+        self.snaplen = snaplen
+        self.local_addr = local_addr
+        self.buffer = bytearray(num_slots * snaplen)
+        self.view = memoryview(self.buffer)
+        self.lengths = array('I', bytes(4 * num_slots))
+        self.timestamps = array('d', bytes(8 * num_slots))
+        self.directions = bytearray(num_slots)
+        self.peers = [None] * num_slots
+        self.next_slot = 0
+        self.num_recorded = 0
+        self._lock = Lock()
+        # Used to convert monotonic timestamps to wall clock time for
+        # the pcap file
+        self._wall_offset = time.time() - time.monotonic()
+
+    def record(self, direction, data, peer):
+        """Copy a datagram (any bytes-like object) into the ring"""
+        length = len(data)
+        copy_len = min(length, self.snaplen)
+        with self._lock:
+            slot = self.next_slot
+            offset = slot * self.snaplen
+            self.view[offset:offset + copy_len] = data[:copy_len]
+            self.lengths[slot] = length
+            self.timestamps[slot] = time.monotonic()
+            self.directions[slot] = direction
+            self.peers[slot] = peer
+            self.next_slot = (slot + 1) % self.num_slots
+            self.num_recorded += 1
+
+    def clear(self):
+        """Forget all recorded datagrams"""
+        with self._lock:
+            self.next_slot = 0
+            self.num_recorded = 0
+
+    def dump(self, path):
+        """Write the contents of the ring to a pcap file at path.
+        Returns the number of datagrams written.
+        """
+        with self._lock:
+            count = min(self.num_recorded, self.num_slots)
+            first = (self.next_slot - count) % self.num_slots
+            records = []
+            for index in range(count):
+                slot = (first + index) % self.num_slots
+                length = self.lengths[slot]
+                offset = slot * self.snaplen
+                records.append((self.directions[slot], self.peers[slot],
+                                self.timestamps[slot], length,
+                                bytes(self.view[offset:offset + min(length, self.snaplen)])))
+        local_addrs = {}
+        with open(path, 'wb') as pcap_file:
+            pcap_file.write(PacketCapture.PCAP_HEADER.pack(
+                PacketCapture.PCAP_MAGIC, 2, 4, 0, 0,
+                self.snaplen + PacketCapture.HEADERS_LEN, PacketCapture.LINKTYPE_RAW))
+            for direction, peer, timestamp, length, data in records:
+                if peer[0] not in local_addrs:
+                    local_addrs[peer[0]] = self._resolve_local_addr(peer)
+                local_addr = local_addrs[peer[0]]
+                if direction == PacketCapture.RX:
+                    src, dst = peer, local_addr
+                else:
+                    src, dst = local_addr, peer
+                headers = self._make_headers(src, dst, length)
+                wall_time = timestamp + self._wall_offset
+                ts_sec = int(wall_time)
+                ts_usec = int((wall_time - ts_sec) * 1e6)
+                pcap_file.write(PacketCapture.PCAP_RECORD.pack(
+                    ts_sec, ts_usec, len(headers) + len(data), len(headers) + length))
+                pcap_file.write(headers)
+                pcap_file.write(data)
+        return count
+
+    def _resolve_local_addr(self, peer):
+        """Return the (ip, port) local address of datagrams exchanged
+        with peer. Connecting a UDP socket sends nothing, but makes the
+        kernel pick the source address of the route to peer.
+        """
+        local_ip, local_port = self.local_addr
+        if local_ip != PacketCapture.ANY_ADDR:
+            return self.local_addr
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.connect(peer)
+                local_ip = sock.getsockname()[0]
+        except OSError:
+            local_ip = PacketCapture.FALLBACK_ADDR
+        return (local_ip, local_port)
+
+    @staticmethod
+    def _make_headers(src, dst, length):
+        """Build the IPv4 and UDP headers for a datagram of length bytes
+        sent from src to dst, which are (ip, port) tuples
+        """
+        total_len = min(PacketCapture.HEADERS_LEN + length, 0xFFFF)
+        src_ip = socket.inet_aton(src[0])
+        dst_ip = socket.inet_aton(dst[0])
+        ip_header = PacketCapture.IPV4_HEADER.pack(
+            0x45, 0, total_len, 0, 0, PacketCapture.TTL, PacketCapture.IPPROTO_UDP, 0,
+            src_ip, dst_ip)
+        checksum = PacketCapture._ipv4_checksum(ip_header)
+        ip_header = ip_header[:10] + struct.pack("!H", checksum) + ip_header[12:]
+        # A zero UDP checksum means "no checksum" for IPv4
+        udp_header = PacketCapture.UDP_HEADER.pack(
+            src[1], dst[1], total_len - PacketCapture.IPV4_HEADER.size, 0)
+        return ip_header + udp_header
+
+    @staticmethod
+    def _ipv4_checksum(header):
+        """Return the ones' complement checksum of an IPv4 header"""
+        total = sum(struct.unpack("!10H", header))
+        while total > 0xFFFF:
+            total = (total & 0xFFFF) + (total >> 16)
+        return ~total & 0xFFFF
@@ -9,6 +9,104 @@ and stream_endpoint_node.py
 """
 from enum import IntEnum
 from uhd.chdr import MgmtOpCode, MgmtOpNodeInfo, MgmtOp, PacketType
+from usrp_mpm.mpmlog import TRACE
+from .virtual_clock import VirtualClock
+
+# Names of the simulator modules (e.g. "chdr_endpoint") whose TRACE
+# output includes full packet dumps. Pretty-printing a packet is
+# expensive, so this is empty unless enabled in the config file
+# (see config.py).
+packet_dump_modules = set()
+
+SC16_BYTES = 4 # Bytes per sample of the SC16 wire format
+
+class PacketDump:
+    """Wraps a packet so that it is only pretty-printed if a log record
+    which references it is actually emitted.
+    """
+    def __init__(self, packet):
+        self.packet = packet
+
+    def __str__(self):
+        return self.packet.to_string_with_payload()
+
+def set_packet_dumps(module_names):
+    """Enable packet dumps for the modules in module_names, and disable
+    them for all other modules
+    """
+    packet_dump_modules.clear()
+    packet_dump_modules.update(module_names)
+
+def trace_packet(log, module_name, msg, packet, *args):
+    """Log msg with a dump of packet at TRACE level, provided that
+    packet dumps are enabled for module_name. The packet dump is
+    formatted into the last placeholder of msg, after args.
+    """
+    if module_name in packet_dump_modules and log.isEnabledFor(TRACE):
+        log.trace(msg, *args, PacketDump(packet))
+
+class NodeStats:
+    """Packet statistics of a single Node.
+
+    Packets and bytes are counted per packet type. Packets which a node
+    handles itself also have their handling time recorded in a
+    histogram with power of two buckets: a packet which took t ns to
+    handle is counted in the bucket with upper bound 2**t.bit_length()
+    ns. Packets which the graph forwards past a node from its route
+    cache (see RFNoCGraph.resolve_route()) are recorded with their share
+    of the route lookup time, which is what forwarding them costs.
+
+    Statistics are updated from the socket thread only. to_dict() may be
+    called from any thread, so it works on copies.
+    """
+    NUM_BUCKETS = 32 # The last bucket holds everything above ~1 s
+
+    def __init__(self):
+        self.counters = {}
+        self.latency_hist = [0] * NodeStats.NUM_BUCKETS
+        self.latency_total_ns = 0
+        self.latency_max_ns = 0
+
+    def count(self, pkt_type, num_bytes):
+        """Count one packet of pkt_type and length num_bytes"""
+        counts = self.counters.get(pkt_type)
+        if counts is None:
+            counts = self.counters[pkt_type] = [0, 0]
+        counts[0] += 1
+        counts[1] += num_bytes
+
+    def record(self, pkt_type, num_bytes, elapsed_ns):
+        """Count one packet which took elapsed_ns to handle"""
+        self.count(pkt_type, num_bytes)
+        bucket = min(elapsed_ns.bit_length(), NodeStats.NUM_BUCKETS - 1)
+        self.latency_hist[bucket] += 1
+        self.latency_total_ns += elapsed_ns
+        self.latency_max_ns = max(self.latency_max_ns, elapsed_ns)
+
+    def reset(self):
+        """Clear all counters and histograms"""
+        self.counters = {}
+        self.latency_hist = [0] * NodeStats.NUM_BUCKETS
+        self.latency_total_ns = 0
+        self.latency_max_ns = 0
+
+    def to_dict(self):
+        """Return the statistics as a dict that can be sent over RPC.
+        Empty histogram buckets are omitted.
+        """
+        # Copying is atomic, iterating over the live containers is not
+        counters = dict(self.counters)
+        latency_hist = list(self.latency_hist)
+        num_handled = sum(latency_hist)
+        return {
+            'packets': {pkt_type.name: {'packets': counts[0], 'bytes': counts[1]}
+                        for pkt_type, counts in counters.items()},
+            'latency_hist_ns': {str(1 << bucket): count
+                                for bucket, count in enumerate(latency_hist)
+                                if count != 0},
+            'latency_mean_ns': self.latency_total_ns // num_handled if num_handled else 0,
+            'latency_max_ns': self.latency_max_ns,
+        }
 
 def to_iter(index_func, length):
     """Allows looping over an indexed object in a for-each loop"""
@@ -52,11 +150,20 @@ class Node:
         self.node_inst = node_inst
         self.log = None
         self.get_device_id = None
+        self.topology_changed = lambda: None
+        self.stats = NodeStats()
 
-    def graph_init(self, log, get_device_id, **kwargs):
-        """This method is called to initialize the Node Graph"""
+    def graph_init(self, log, get_device_id, topology_changed=None, **kwargs):
+        """This method is called to initialize the Node Graph
+
+        topology_changed is a callback which the node must call whenever
+        a change to its state affects packet routing or endpoint lookup
+        (e.g. routing tables, EPIDs, or xport address maps)
+        """
         self.log = log
         self.get_device_id = get_device_id
+        if topology_changed is not None:
+            self.topology_changed = topology_changed
 
     def get_id(self):
         """Return the NodeID (device_id, node_type, node_inst)"""
@@ -121,6 +228,14 @@ class Node:
         """Initialize this node's indexes to block_id references"""
         pass
 
+    def get_stats(self):
+        """Return the statistics of this node as a dict"""
+        return self.stats.to_dict()
+
+    def reset_stats(self):
+        """Clear the statistics of this node"""
+        self.stats.reset()
+
     def info_response(self, extended_info):
         """Generate a node info response MgmtOp"""
         return MgmtOp(
@@ -141,7 +256,14 @@ class StreamSpec:
     dst_epid comes from the source stream_ep
 
     addr comes from the xport passed through when routing to dst_epid
+
+    max_burst comes from the simulator config file, and limits how many
+    packets may be sent back to back when the stream falls behind
+
+    clock is the device's VirtualClock (owned by the ChdrEndpoint), which
+    paces the stream and provides its timestamps
     """
+    DEFAULT_MAX_BURST = 16
     LOW_MASK = 0xFFFFFFFF
     HIGH_MASK = (0xFFFFFFFF) << 32
     def __init__(self):
@@ -155,6 +277,8 @@ class StreamSpec:
         self.addr = None
         self.capacity_packets = 0
         self.capacity_bytes = 0
+        self.max_burst = StreamSpec.DEFAULT_MAX_BURST
+        self.clock = VirtualClock()
 
     def set_timestamp_lo(self, low):
         """Set the low 32 bits of the initial timestamp"""
@@ -178,11 +302,12 @@ class StreamSpec:
 
     def seconds_per_packet(self):
         """Calculates how many seconds should be between each packet
-        transmit
+        transmit. packet_samples is used as the payload size in bytes, so
+        a full packet carries packet_samples // SC16_BYTES samples.
         """
         assert self.packet_samples != 0
         assert self.sample_rate != 0
-        return self.packet_samples / self.sample_rate
+        return (self.packet_samples // SC16_BYTES) / self.sample_rate
 
     def __str__(self):
         return "StreamSpec{{total_samples: {}, is_continuous: {}, packet_samples: {}," \
@@ -10,11 +10,20 @@ This module handles and responds to Management and Ctrl Packets. It
 also instantiates the registers and acts as an interface between
 the chdr packets on the network and the registers.
 """
-from uhd.chdr import MgmtOpCode, MgmtOpCfg, MgmtOpSelDest
+import time
+from uhd.chdr import MgmtOpCode, MgmtOpCfg, MgmtOpSelDest, PacketType
 from .noc_block_regs import NocBlockRegs, NocBlock, StreamEndpointPort, NocBlockPort
 from .rfnoc_common import Node, NodeType, StreamSpec, to_iter, swap_src_dst, RETURN_TO_SENDER
 from .stream_endpoint_node import StreamEndpointNode
 
+# time.perf_counter_ns() is only available from Python 3.7 onwards
+if hasattr(time, 'perf_counter_ns'):
+    _perf_counter_ns = time.perf_counter_ns
+else:
+    def _perf_counter_ns():
+        """Fallback for time.perf_counter_ns(), in integer nanoseconds"""
+        return int(time.perf_counter() * 1e9)
+
 class XportNode(Node):
     """Represents an Xport node
 
@@ -48,10 +57,10 @@ class XportNode(Node):
                                       packet.get_header().dst_epid))
                 self.log.info("addr_map updated: EPID:{} -> {}".format(payload.src_epid, addr))
                 self.addr_map[payload.src_epid] = addr
+                self.topology_changed()
             else:
                 raise NotImplementedError(op.op_code)
-        self.log.trace("Xport {} processed hop:\n{}"
-                       .format(self.node_inst, our_hop))
+        self.log.trace("Xport %d processed hop:\n%s", self.node_inst, our_hop)
         packet.set_payload(payload)
         if send_upstream:
             return RETURN_TO_SENDER
@@ -99,12 +108,14 @@ class XbarNode(Node):
                 pass
             elif op.op_code == MgmtOpCode.ADVERTISE:
                 self.log.info("Advertise: {}".format(self.get_id()))
+                self.topology_changed()
             elif op.op_code == MgmtOpCode.CFG_WR_REQ:
                 cfg = op.get_op_payload()
                 cfg = MgmtOpCfg.parse(cfg)
                 self.routing_table[cfg.addr] = cfg.data
-                self.log.debug("Xbar {} routing changed: {}"
-                               .format(self.node_inst, self.routing_table))
+                self.topology_changed()
+                self.log.debug("Xbar %d routing changed: %s",
+                               self.node_inst, self.routing_table)
             elif op.op_code == MgmtOpCode.SEL_DEST:
                 cfg = op.get_op_payload()
                 cfg = MgmtOpSelDest.parse(cfg)
@@ -112,8 +123,7 @@ class XbarNode(Node):
                 destination = self.ports[dest_port]
             else:
                 raise NotImplementedError(op.op_code)
-        self.log.trace("Xbar {} processed hop:\n{}"
-                       .format(self.node_inst, our_hop))
+        self.log.trace("Xbar %d processed hop:\n%s", self.node_inst, our_hop)
         packet.set_payload(payload)
         if send_upstream:
             return RETURN_TO_SENDER
@@ -123,7 +133,12 @@ class XbarNode(Node):
             return self._handle_default_packet(packet, **kwargs)
 
     def _handle_default_packet(self, packet, **kwargs):
-        dst_epid = packet.get_header().dst_epid
+        return self.route(packet.get_header().dst_epid)
+
+    def route(self, dst_epid):
+        """Return the node id of the port which packets heading for
+        dst_epid leave through
+        """
         if dst_epid not in self.routing_table:
             raise RuntimeError("Xbar no destination for packet (dst_epid: {})".format(dst_epid))
         return self.ports[self.routing_table[dst_epid]]
@@ -147,17 +162,30 @@ class RFNoCGraph:
 
     It serves as an interface between the ChdrEndpoint and the
     individual blocks/nodes.
+
+    To keep packet dispatch cheap, the graph caches an EPID -> stream
+    endpoint index, the resolved route from an xport to the node
+    which consumes packets for a given dst_epid, and the results of
+    dst_to_addr(). Nodes call invalidate_routes() (through their
+    topology_changed callback) whenever these may have changed.
+
+    Every node keeps NodeStats, which handle_packet() updates with
+    the packet counts and handling time of each packet.
     """
     def __init__(self, graph_list, log, device_id, send_wrapper, chdr_w, rfnoc_device_id):
         self.log = log.getChild("Graph")
         self.device_id = device_id
         self.stream_spec = StreamSpec()
         self.stream_ep = []
+        self.ep_index = None
+        self.route_cache = {}
+        self.addr_cache = {}
         for node in graph_list:
             if node.__class__ is StreamEndpointNode:
                 self.stream_ep.append(node)
             node.graph_init(self.log, self.get_device_id, send_wrapper=send_wrapper,
-                            chdr_w=chdr_w, dst_to_addr=self.dst_to_addr)
+                            chdr_w=chdr_w, dst_to_addr=self.dst_to_addr,
+                            topology_changed=self.invalidate_routes)
         # These must be done sequentially so that get_device_id is initialized on all nodes
         # before from_index is called on any node
         for node in graph_list:
@@ -220,12 +248,21 @@ class RFNoCGraph:
         """Change the Stream Samples per Packet"""
         self.stream_spec.packet_samples = spp
 
+    def invalidate_routes(self):
+        """Drop all cached routes, endpoint and address lookups.
+
+        This must be called whenever routing tables, EPIDs or xport
+        address maps change.
+        """
+        self.ep_index = None
+        self.route_cache.clear()
+        self.addr_cache.clear()
+
     def find_ep_by_id(self, epid):
         """Find a Stream Endpoint which identifies with epid"""
-        for node in self.graph_map.values():
-            if node.__class__ is StreamEndpointNode:
-                if node.epid == epid:
-                    return node
+        if self.ep_index is None:
+            self.ep_index = {node.epid: node for node in self.stream_ep}
+        return self.ep_index.get(epid)
 
     # Fixme: This doesn't support intra-device connections
     # i.e. connecting nodes by connecting two internal stream endpoints
@@ -239,8 +276,11 @@ class RFNoCGraph:
         returns the address associated with the dst_epid in the xport's
         addr_map
         """
-        current_node = src_ep
         dst_epid = src_ep.dst_epid
+        cache_key = (src_ep.get_local_id(), dst_epid)
+        if cache_key in self.addr_cache:
+            return self.addr_cache[cache_key]
+        current_node = src_ep
         while current_node.__class__ != XportNode:
             if current_node.__class__ == StreamEndpointNode:
                 current_node = self.graph_map[current_node.upstream]
@@ -249,7 +289,35 @@ class RFNoCGraph:
                 port = current_node.routing_table[dst_epid]
                 upstream_id = current_node.ports[port]
                 current_node = self.graph_map[upstream_id]
-        return current_node.addr_map[dst_epid]
+        addr = current_node.addr_map[dst_epid]
+        self.addr_cache[cache_key] = addr
+        return addr
+
+    def resolve_route(self, xport_input, dst_epid):
+        """Return the node_id of the first node past the xports and
+        crossbars which a packet for dst_epid entering at xport_input
+        is delivered to, and a tuple of the xports and crossbars it
+        passes on the way.
+
+        Xports and crossbars forward all non-management packets purely
+        based on dst_epid, so the result is cached until the topology
+        changes.
+        """
+        cache_key = (xport_input, dst_epid)
+        route = self.route_cache.get(cache_key)
+        if route is None:
+            node_id = xport_input
+            bypassed = []
+            while node_id is not None and node_id[0] in (NodeType.XPORT, NodeType.XBAR):
+                node = self.graph_map[node_id]
+                bypassed.append(node)
+                if node_id[0] == NodeType.XPORT:
+                    node_id = node.downstream
+                else:
+                    node_id = node.route(dst_epid)
+            route = (node_id, tuple(bypassed))
+            self.route_cache[cache_key] = route
+        return route
 
     def handle_packet(self, packet, xport_input, addr, sender, num_bytes):
         """Given a chdr_packet, the id of an xport node to serve as an
@@ -257,6 +325,17 @@ class RFNoCGraph:
         node graph.
         """
         node_id = xport_input
+        header = packet.get_header()
+        pkt_type = header.pkt_type
+        if pkt_type != PacketType.MGMT:
+            # Management packets are the only ones which xports and
+            # crossbars act upon, everything else can skip straight
+            # to its destination
+            start_ns = _perf_counter_ns()
+            node_id, bypassed = self.resolve_route(xport_input, header.dst_epid)
+            elapsed_ns = (_perf_counter_ns() - start_ns) // max(1, len(bypassed))
+            for node in bypassed:
+                node.stats.record(pkt_type, num_bytes, elapsed_ns)
         response_packet = None
         while node_id is not None:
             assert len(node_id) == 2, "Node returned non-local node_id of len {}: {}" \
@@ -269,10 +348,24 @@ class RFNoCGraph:
             # If the node returns a value, it is the node id of the
             # node the packet should be passed to next
             # or RETURN_TO_SENDER
+            start_ns = _perf_counter_ns()
             node_id = node.handle_packet(packet, regs=self.regs, addr=addr,
                                          sender=sender, num_bytes=num_bytes)
+            node.stats.record(pkt_type, num_bytes, _perf_counter_ns() - start_ns)
         return response_packet
 
+    def get_stats(self):
+        """Return the statistics of every node in the graph as a dict,
+        keyed by "<node type>:<node inst>"
+        """
+        return {"{}:{}".format(node_type.name, node_inst): node.get_stats()
+                for (node_type, node_inst), node in self.graph_map.items()}
+
+    def reset_stats(self):
+        """Clear the statistics of every node in the graph"""
+        for node in self.graph_map.values():
+            node.reset_stats()
+
     def get_stream_spec(self):
         """ Get the current output stream configuration """
         return self.stream_spec
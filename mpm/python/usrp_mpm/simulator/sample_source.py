@@ -8,6 +8,10 @@ This module contains the interface for providing data to a simulator
 stream and receiving data from a simulator stream.
 """
 import importlib.util
+import mmap
+import os
+from fractions import Fraction
+import numpy as np
 
 sources = {}
 sinks = {}
@@ -42,6 +46,13 @@ class SampleSource:
     """This class defines the interface of a SampleSource. It
     provides samples to the simulator which are then sent over the
     network to a UHD client.
+
+    A SampleSource may optionally provide a method
+    fill_buffer(buffer, payload_size), which writes up to payload_size
+    bytes of samples into the writable memoryview buffer and returns
+    the number of bytes written (0 signals that the source is
+    exhausted). If present, ChdrOutputStream uses it to assemble
+    packets in place instead of calling fill_packet().
     """
     def fill_packet(self, packet, payload_size):
         """This method should fill the packet with enough samples to
@@ -76,6 +87,7 @@ class NullSamples(SampleSource, SampleSink):
     """
     def __init__(self, log=None):
         self.log = log
+        self._zeros = memoryview(bytes(0))
 
     def fill_packet(self, packet, payload_size):
         if self.log is not None:
@@ -84,6 +96,14 @@ class NullSamples(SampleSource, SampleSink):
         packet.set_payload_bytes(payload)
         return packet
 
+    def fill_buffer(self, buffer, payload_size):
+        if self.log is not None:
+            self.log.debug("Null Source called, providing {} bytes of zeroes".format(payload_size))
+        if len(self._zeros) < payload_size:
+            self._zeros = memoryview(bytes(payload_size))
+        buffer[:payload_size] = self._zeros[:payload_size]
+        return payload_size
+
     def accept_packet(self, packet):
         if self.log is not None:
             self.log.debug("Null Source called, accepting {} bytes of payload"
@@ -107,6 +127,11 @@ class IOSource(SampleSource):
         packet.set_payload_bytes(payload)
         return packet
 
+    def fill_buffer(self, buffer, payload_size):
+        payload = self.read_obj.read(payload_size)
+        buffer[:len(payload)] = payload
+        return len(payload)
+
     def close(self):
         self.read_obj.close()
 
@@ -150,9 +175,298 @@ class FileSource(IOSource):
         packet.set_payload_bytes(payload)
         return packet
 
+    def fill_buffer(self, buffer, payload_size):
+        num_bytes = self.read_obj.readinto(buffer[:payload_size])
+        if num_bytes == 0 and self.repeat:
+            self.read_obj.close()
+            self.read_obj = self.open()
+            num_bytes = self.read_obj.readinto(buffer[:payload_size])
+        return num_bytes
+
 @cli_sink
 class FileSink(IOSink):
     """This class creates a SampleSink using a file path"""
     def __init__(self, write_file):
         write = open(write_file, "wb")
         super().__init__(write)
+
+@cli_source
+class MmapFileSource(SampleSource):
+    """This class creates a SampleSource which memory maps a file. Packets
+    are filled from slices of the mapping, so no read() call is made per
+    packet. With repeat=True, a packet which crosses the end of the file
+    continues seamlessly at its beginning.
+    """
+    def __init__(self, read_file, repeat=False):
+        if isinstance(repeat, bool):
+            self.repeat = repeat
+        else:
+            self.repeat = repeat == "True"
+        with open(read_file, "rb") as read:
+            # An empty file cannot be mapped
+            if os.fstat(read.fileno()).st_size == 0:
+                raise ValueError("Cannot use empty file {} as a sample source"
+                                 .format(read_file))
+            # The mapping stays valid after the file is closed
+            self._mmap = mmap.mmap(read.fileno(), 0, access=mmap.ACCESS_READ)
+        # madvise() is only available from Python 3.8 on
+        if hasattr(self._mmap, 'madvise'):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+        self._view = memoryview(self._mmap)
+        self._offset = 0
+
+    def _next_chunks(self, payload_size):
+        """Return a list of slices of the mapping, which together hold
+        the next payload_size bytes. Without repeat, fewer bytes are
+        returned at the end of the file. With repeat, the slices wrap
+        around as often as needed, even if the file is shorter than
+        one payload.
+        """
+        chunks = []
+        remaining = payload_size
+        while remaining > 0:
+            chunk = self._view[self._offset:self._offset + remaining]
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            self._offset += len(chunk)
+            if not self.repeat:
+                break
+            self._offset %= len(self._view)
+        return chunks
+
+    def fill_packet(self, packet, payload_size):
+        payload = b"".join(self._next_chunks(payload_size))
+        if len(payload) == 0:
+            return None
+        packet.set_payload_bytes(payload)
+        return packet
+
+    def fill_buffer(self, buffer, payload_size):
+        num_bytes = 0
+        for chunk in self._next_chunks(payload_size):
+            buffer[num_bytes:num_bytes + len(chunk)] = chunk
+            num_bytes += len(chunk)
+        return num_bytes
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+
+@cli_sink
+class MmapFileSink(SampleSink):
+    """This class creates a SampleSink which writes into a memory mapped
+    file. The file is grown extent_size bytes at a time and truncated to
+    the amount of data actually received when the sink is closed.
+    """
+    def __init__(self, write_file, extent_size=str(64 * 1024 * 1024)):
+        self._extent_size = int(extent_size)
+        self._file = open(write_file, "w+b")
+        self._file.truncate(self._extent_size)
+        self._mmap = mmap.mmap(self._file.fileno(), self._extent_size)
+        self._offset = 0
+
+    def accept_packet(self, packet):
+        payload = bytes(packet.get_payload_bytes())
+        end = self._offset + len(payload)
+        if end > len(self._mmap):
+            extents = -(-end // self._extent_size)
+            self._mmap.resize(extents * self._extent_size)
+        self._mmap[self._offset:end] = payload
+        self._offset = end
+
+    def close(self):
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.truncate(self._offset)
+        self._file.close()
+
+# Full scale of a signed 16 bit sample
+SC16_FULL_SCALE = 32767
+
+def to_sc16(samples, amplitude):
+    """Convert an array of complex samples in the range [-1, 1] to sc16
+    bytes, scaled by amplitude.
+
+    Each sample is a little endian 32 bit word with I in the upper and
+    Q in the lower 16 bits (see convert_common.hpp), so Q comes first
+    in memory.
+    """
+    words = np.empty((len(samples), 2), dtype='<i2')
+    words[:, 0] = np.round(samples.imag * amplitude * SC16_FULL_SCALE)
+    words[:, 1] = np.round(samples.real * amplitude * SC16_FULL_SCALE)
+    return words.tobytes()
+
+class TableSource(SampleSource):
+    """This is a base class for sources which endlessly repeat a
+    precomputed period of sc16 data.
+
+    The period is repeated into a table which is at least one payload
+    longer than the period, so every packet is a contiguous slice of
+    the table which can be handed out without copying.
+    """
+    def __init__(self, period):
+        self._period = period
+        self._table = memoryview(period)
+        self._offset = 0
+
+    def _next_payload(self, payload_size):
+        period_len = len(self._period)
+        if len(self._table) < period_len + payload_size:
+            repeats = -(-(period_len + payload_size) // period_len)
+            self._table = memoryview(self._period * repeats)
+        payload = self._table[self._offset:self._offset + payload_size]
+        self._offset = (self._offset + payload_size) % period_len
+        return payload
+
+    def fill_packet(self, packet, payload_size):
+        packet.set_payload_bytes(bytes(self._next_payload(payload_size)))
+        return packet
+
+    def fill_buffer(self, buffer, payload_size):
+        buffer[:payload_size] = self._next_payload(payload_size)
+        return payload_size
+
+    def close(self):
+        pass
+
+class BlockSource(SampleSource):
+    """This is a base class for sources which cannot be expressed as a
+    short period (e.g. noise). Data is generated BLOCK_PACKETS packets
+    at a time by _generate() and handed out as slices of that block.
+    """
+    BLOCK_PACKETS = 64
+
+    def __init__(self):
+        self._block = memoryview(bytes(0))
+        self._offset = 0
+
+    def _generate(self, num_bytes):
+        """Return at least num_bytes of new sc16 data"""
+        raise NotImplementedError()
+
+    def _next_payload(self, payload_size):
+        if self._offset + payload_size > len(self._block):
+            self._block = memoryview(self._generate(payload_size * self.BLOCK_PACKETS))
+            self._offset = 0
+        payload = self._block[self._offset:self._offset + payload_size]
+        self._offset += payload_size
+        return payload
+
+    def fill_packet(self, packet, payload_size):
+        packet.set_payload_bytes(bytes(self._next_payload(payload_size)))
+        return packet
+
+    def fill_buffer(self, buffer, payload_size):
+        buffer[:payload_size] = self._next_payload(payload_size)
+        return payload_size
+
+    def close(self):
+        pass
+
+@cli_source
+class ToneSource(TableSource):
+    """This class provides a phase continuous complex tone of freq Hz,
+    assuming the stream runs at rate samples/sec.
+
+    The tone frequency is rounded such that the tone repeats after at
+    most MAX_PERIOD samples. The rounding error is below
+    rate / (2 * MAX_PERIOD).
+    """
+    MAX_PERIOD = 1 << 16
+
+    def __init__(self, freq, rate="1e6", amplitude="0.7"):
+        ratio = (Fraction(float(freq)) / Fraction(float(rate))) \
+            .limit_denominator(self.MAX_PERIOD)
+        # Keep the phase computation in integers to avoid precision
+        # loss for long periods
+        n = np.arange(ratio.denominator, dtype=np.int64)
+        phase = (n * ratio.numerator) % ratio.denominator / ratio.denominator
+        samples = np.exp(2j * np.pi * phase)
+        super().__init__(to_sc16(samples, float(amplitude)))
+
+@cli_source
+class ChirpSource(TableSource):
+    """This class provides a linear chirp which sweeps from start_freq
+    to stop_freq Hz over duration seconds and then starts over,
+    assuming the stream runs at rate samples/sec.
+    """
+    MAX_PERIOD = 1 << 22
+
+    def __init__(self, start_freq, stop_freq, duration="1e-3", rate="1e6", amplitude="0.7"):
+        rate = float(rate)
+        num_samps = int(round(float(duration) * rate))
+        if not 0 < num_samps <= self.MAX_PERIOD:
+            raise ValueError("Chirp duration must be between 1 and {} samples, got {}"
+                             .format(self.MAX_PERIOD, num_samps))
+        start = float(start_freq) / rate
+        slope = (float(stop_freq) - float(start_freq)) / rate / num_samps
+        n = np.arange(num_samps)
+        samples = np.exp(2j * np.pi * (start * n + slope / 2 * n * n))
+        super().__init__(to_sc16(samples, float(amplitude)))
+
+@cli_source
+class NoiseSource(BlockSource):
+    """This class provides complex additive white gaussian noise with a
+    standard deviation of amplitude (relative to full scale). Samples
+    are clipped to full scale. Provide a seed for reproducible noise.
+    """
+    def __init__(self, amplitude="0.1", seed=None):
+        super().__init__()
+        # The power is split evenly between I and Q
+        self._scale = float(amplitude) * SC16_FULL_SCALE / np.sqrt(2)
+        self._rng = np.random.default_rng(None if seed is None else int(seed))
+
+    def _generate(self, num_bytes):
+        num_samps = -(-num_bytes // 4)
+        words = self._rng.standard_normal(2 * num_samps) * self._scale
+        np.clip(np.round(words, out=words), -SC16_FULL_SCALE - 1, SC16_FULL_SCALE, out=words)
+        return words.astype('<i2').tobytes()
+
+@cli_source
+class PrbsSource(TableSource):
+    """This class provides a PRBS bit pattern (MSB first) of the given
+    order. Supported orders are the keys of PRBS_TAPS.
+
+    The pattern repeats after 2**order - 1 bytes.
+    """
+    # order -> (a, b), such that bit[n] = bit[n - a] ^ bit[n - b]
+    PRBS_TAPS = {
+        7: (7, 6),
+        9: (9, 5),
+        11: (11, 9),
+        15: (15, 14),
+        23: (23, 18),
+    }
+
+    def __init__(self, order="15"):
+        order = int(order)
+        if order not in self.PRBS_TAPS:
+            raise ValueError("Unsupported PRBS order {}, use one of {}"
+                             .format(order, sorted(self.PRBS_TAPS)))
+        # The bit period is 2**order - 1, which takes 8 periods to
+        # align with a byte boundary
+        bits = self.generate_bits(order, 8 * ((1 << order) - 1))
+        super().__init__(np.packbits(bits).tobytes())
+
+    @classmethod
+    def generate_bits(cls, order, num_bits):
+        """Return the first num_bits of the PRBS sequence of the given
+        order, starting with an all-ones state
+        """
+        lag_a, lag_b = cls.PRBS_TAPS[order]
+        bits = np.empty(num_bits, dtype=np.uint8)
+        bits[:lag_a] = 1
+        filled = lag_a
+        while filled < num_bits:
+            # Squaring the generator polynomial over GF(2) shows that
+            # the recurrence also holds for both lags scaled by any
+            # power of two, so the chunk size can grow with the sequence
+            scale = 1
+            while 2 * scale * lag_a <= filled:
+                scale *= 2
+            a, b = scale * lag_a, scale * lag_b
+            chunk = min(b, num_bits - filled)
+            bits[filled:filled + chunk] = \
+                bits[filled - a:filled - a + chunk] ^ bits[filled - b:filled - b + chunk]
+            filled += chunk
+        return bits
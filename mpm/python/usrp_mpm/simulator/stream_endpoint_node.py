@@ -9,7 +9,7 @@ It also houses the logic to create output and input streams.
 """
 from uhd.chdr import MgmtOpCode, MgmtOpCfg, MgmtOp, PacketType, CtrlStatus, CtrlOpCode, \
     ChdrHeader, StrcOpCode, StrcPayload, ChdrPacket, StrsStatus
-from .rfnoc_common import Node, NodeType, to_iter, swap_src_dst, RETURN_TO_SENDER
+from .rfnoc_common import Node, NodeType, to_iter, swap_src_dst, trace_packet, RETURN_TO_SENDER
 from .stream_ep_regs import StreamEpRegs, STRM_STATUS_FC_ENABLED
 from .chdr_stream import ChdrOutputStream, ChdrInputStream
 
@@ -20,8 +20,13 @@ class StreamEndpointNode(Node):
     packets access these registers, while control packets access the
     registers of the noc_blocks which are held in the RFNoCGraph and
     passed into handle_packet as the regs parameter
+
+    rx_queue_depth and rx_capacity_bytes configure the ChdrInputStreams
+    created by this endpoint
     """
-    def __init__(self, node_inst, source_gen, sink_gen):
+    def __init__(self, node_inst, source_gen, sink_gen,
+                 rx_queue_depth=ChdrInputStream.QUEUE_CAP,
+                 rx_capacity_bytes=ChdrInputStream.CAPACITY_BYTES):
         super().__init__(node_inst)
         self.epid = node_inst
         self.dst_epid = None
@@ -39,6 +44,8 @@ class StreamEndpointNode(Node):
         self.dst_to_addr = None
         self.source_gen = source_gen
         self.sink_gen = sink_gen
+        self.rx_queue_depth = rx_queue_depth
+        self.rx_capacity_bytes = rx_capacity_bytes
         self.downstream_capacity = None
         self.strs_handlers = {}
         self.ep_regs = StreamEpRegs(self.get_epid, self.set_epid, self.set_dst_epid,
@@ -70,8 +77,9 @@ class StreamEndpointNode(Node):
         self.begin_input()
         return STRM_STATUS_FC_ENABLED
 
-    def graph_init(self, log, set_device_id, send_wrapper, chdr_w, dst_to_addr, **kwargs):
-        super().graph_init(log, set_device_id)
+    def graph_init(self, log, set_device_id, send_wrapper, chdr_w, dst_to_addr,
+                   topology_changed=None, **kwargs):
+        super().graph_init(log, set_device_id, topology_changed)
         self.ep_regs.log = log
         self.chdr_w = chdr_w
         self.send_wrapper = send_wrapper
@@ -87,10 +95,12 @@ class StreamEndpointNode(Node):
     def set_epid(self, epid):
         """Set this endpoint's endpoint id"""
         self.epid = epid
+        self.topology_changed()
 
     def set_dst_epid(self, dst_epid):
         """Set this endpoint's destination endpoint id"""
         self.dst_epid = dst_epid
+        self.topology_changed()
 
     def _handle_mgmt_packet(self, packet, **kwargs):
         send_upstream = False
@@ -120,13 +130,12 @@ class StreamEndpointNode(Node):
             else:
                 raise NotImplementedError("op_code {} is not implemented for StreamEndpointNode"
                                           .format(op.op_code))
-        self.log.trace("Stream Endpoint {} processed hop:\n{}"
-                       .format(self.node_inst, our_hop))
+        self.log.trace("Stream Endpoint %d processed hop:\n%s", self.node_inst, our_hop)
         packet.set_payload(payload)
         if send_upstream:
             return RETURN_TO_SENDER
-        self.log.trace("Stream Endpoint {} received packet:\n{}"
-                       .format(self.node_inst, packet))
+        trace_packet(self.log, "stream_endpoint_node",
+                     "Stream Endpoint %d received packet:\n%s", packet, self.node_inst)
 
     def _handle_ctrl_packet(self, packet, regs, **kwargs):
         payload = packet.get_payload_ctrl()
@@ -177,6 +186,17 @@ class StreamEndpointNode(Node):
         packet = ChdrPacket(self.chdr_w, header, payload)
         self.send_wrapper.send_packet(packet, addr)
 
+    def get_stats(self):
+        """Return the statistics of this node, and those of its current
+        input and output stream (None if not running), as a dict
+        """
+        stats = super().get_stats()
+        input_stream = self.input_stream
+        output_stream = self.output_stream
+        stats['input_stream'] = input_stream.get_stats() if input_stream else None
+        stats['output_stream'] = output_stream.get_stats() if output_stream else None
+        return stats
+
     def begin_output(self, stream_spec):
         """Spin up a new ChdrOutputStream thread which transmits from src_epid
         according to stream_spec.
@@ -220,4 +240,5 @@ class StreamEndpointNode(Node):
         if self.input_stream is not None:
             self.input_stream.finish()
         self.input_stream = ChdrInputStream(self.log, self.chdr_w,
-                                            self.sink_gen(), self.send_wrapper, self.epid)
+                                            self.sink_gen(), self.send_wrapper, self.epid,
+                                            self.rx_queue_depth, self.rx_capacity_bytes)
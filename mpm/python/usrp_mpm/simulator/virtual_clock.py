@@ -0,0 +1,102 @@
+#
+# Copyright 2020 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""This module houses the VirtualClock class, the simulated time base of
+a device. It backs the sim periph manager's timekeeper and paces (and
+timestamps) all output streams of that device.
+"""
+
+import time
+from threading import Lock
+
+class VirtualClock:
+    """A simulated device clock, counting ticks at tick_rate.
+
+    The clock keeps two related notions of time:
+    - elapsed(): virtual seconds since the clock was created. This never
+      goes backwards and is what output streams are paced against.
+    - get_ticks(): the timekeeper value in ticks. This follows elapsed(),
+      but can be set to arbitrary values by the timekeeper API.
+
+    In REALTIME mode, virtual time follows time.monotonic(), scaled by
+    speed (e.g. speed=10 runs ten times faster than real time). In AFAP
+    (as fast as possible) mode, virtual time does not move on its own at
+    all. It only moves forward when a stream sleeps until a deadline, so
+    streams never wait for the wall clock.
+    """
+    REALTIME = "realtime"
+    AFAP = "afap"
+    MODES = (REALTIME, AFAP)
+    DEFAULT_TICK_RATE = 122.88e6
+
+    def __init__(self, mode=REALTIME, speed=1.0, tick_rate=DEFAULT_TICK_RATE):
+        if mode not in VirtualClock.MODES:
+            raise ValueError("Unknown clock mode `{}', expected one of {}"
+                             .format(mode, VirtualClock.MODES))
+        if speed <= 0:
+            raise ValueError("Clock speed must be positive, got {}".format(speed))
+        self.mode = mode
+        self.speed = speed
+        self.tick_rate = tick_rate
+        self._lock = Lock()
+        self._elapsed_base = 0.0
+        self._wall_base = time.monotonic()
+        self._tick_offset = 0
+
+    def is_realtime(self):
+        """Return True if this clock is throttled to the wall clock"""
+        return self.mode == VirtualClock.REALTIME
+
+    def elapsed(self):
+        """Return the virtual seconds since this clock was created"""
+        if self.mode == VirtualClock.AFAP:
+            return self._elapsed_base
+        return self._elapsed_base + (time.monotonic() - self._wall_base) * self.speed
+
+    def sleep_until(self, deadline):
+        """Wait until elapsed() reaches deadline. In AFAP mode, this
+        moves the clock forward to deadline instead of waiting.
+        """
+        if self.mode == VirtualClock.AFAP:
+            with self._lock:
+                self._elapsed_base = max(self._elapsed_base, deadline)
+            return
+        remaining = deadline - self.elapsed()
+        if remaining > 0:
+            time.sleep(remaining / self.speed)
+
+    def get_ticks(self, last_pps=False):
+        """Return the current time in ticks. If last_pps is True, return
+        the time of the most recent PPS (whole second) edge instead.
+        """
+        ticks = self._tick_offset + round(self.elapsed() * self.tick_rate)
+        if last_pps:
+            ticks -= ticks % round(self.tick_rate)
+        return ticks
+
+    def set_ticks(self, ticks, next_pps=False):
+        """Set the current time in ticks. If next_pps is True, the time
+        will be ticks at the next PPS (whole second) edge instead.
+        """
+        with self._lock:
+            if next_pps:
+                ticks_per_pps = round(self.tick_rate)
+                ticks -= ticks_per_pps - (self.get_ticks() % ticks_per_pps)
+            self._tick_offset = ticks - round(self.elapsed() * self.tick_rate)
+
+    def set_tick_rate(self, tick_rate):
+        """Change the tick rate without a discontinuity in get_ticks()"""
+        with self._lock:
+            ticks = self.get_ticks()
+            self.tick_rate = tick_rate
+            self._tick_offset = ticks - round(self.elapsed() * tick_rate)
+
+    def ticks_to_elapsed(self, ticks):
+        """Return the elapsed() value at which get_ticks() reaches ticks"""
+        return (ticks - self._tick_offset) / self.tick_rate
+
+    def __str__(self):
+        return "VirtualClock{{mode: {}, speed: {}, tick_rate: {}}}" \
+               .format(self.mode, self.speed, self.tick_rate)
@@ -8,9 +8,11 @@ Network utilities for MPM
 """
 import itertools
 import socket
+import threading
+import time
 import pyudev
 from six import iteritems
-from pyroute2 import IPRoute, IPDB
+from pyroute2 import IPRoute
 from usrp_mpm.mpmlog import get_logger
 
 def get_hostname():
@@ -185,16 +187,90 @@ def get_mac_addr(ip_addr):
         ip2.close()
         return mac_addr
 
+# Seconds after which the cached set of local IP addresses is refreshed.
+# While the netlink monitor is running, address changes invalidate the cache
+# immediately, and the TTL is only a safety net.
+LOCAL_IP_ADDRS_TTL = 2.0
+LOCAL_IP_ADDRS_MONITORED_TTL = 60.0
+
+class _LocalIpAddrCache(object):
+    """
+    Process-wide cache for get_local_ip_addrs().
+
+    On first use, a background thread subscribes to netlink address
+    notifications and invalidates the cache whenever an address is added
+    or removed. If that fails, the cache is refreshed on a short TTL.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._addrs = None
+        self._expiry = 0
+        self._monitor = None
+        self._monitor_running = False
+
+    def get(self):
+        """
+        Return the (frozen) set of local IP addresses
+        """
+        with self._lock:
+            if self._monitor is None:
+                self._monitor = threading.Thread(
+                    target=self._run_monitor, name="LocalIpAddrMonitor", daemon=True)
+                self._monitor.start()
+            if self._addrs is None or time.monotonic() >= self._expiry:
+                self._addrs = self._read_addrs()
+                ttl = LOCAL_IP_ADDRS_MONITORED_TTL if self._monitor_running \
+                    else LOCAL_IP_ADDRS_TTL
+                self._expiry = time.monotonic() + ttl
+            return self._addrs
+
+    def invalidate(self):
+        """
+        Force a refresh on the next call to get()
+        """
+        with self._lock:
+            self._addrs = None
+
+    @staticmethod
+    def _read_addrs():
+        " Read all addresses bound to local interfaces from the kernel "
+        with IPRoute() as ipr:
+            return frozenset(
+                addr.get_attr('IFA_ADDRESS') for addr in ipr.get_addr()
+                if addr.get_attr('IFA_ADDRESS') is not None
+            )
+
+    def _run_monitor(self):
+        " Invalidate the cache whenever local addresses change "
+        try:
+            from pyroute2.netlink.rtnl import RTMGRP_IPV4_IFADDR, RTMGRP_IPV6_IFADDR
+            with IPRoute() as ipr:
+                ipr.bind(groups=RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR)
+                self._monitor_running = True
+                # Anything that changed before we subscribed is not reflected
+                # in the cache yet
+                self.invalidate()
+                while True:
+                    for msg in ipr.get():
+                        if msg.get('event') in ('RTM_NEWADDR', 'RTM_DELADDR'):
+                            self.invalidate()
+        except Exception as ex:
+            get_logger('net').warning(
+                "Local IP address monitor stopped, falling back to polling: %s",
+                str(ex))
+        finally:
+            self._monitor_running = False
+            self.invalidate()
+
+_local_ip_addr_cache = _LocalIpAddrCache()
+
 def get_local_ip_addrs(ipv4_only=False):
     """
     Return a set of IP addresses which are bound to local interfaces.
-    """
-    with IPDB() as ipdb:
-        return {
-            ip_subnet[0]
-            for ip_subnet_list
-                in [x['ipaddr'] for x in ipdb.interfaces.values()]
-                    for ip_subnet in ip_subnet_list
-            if not ipv4_only or ip_subnet[0].find(':') == -1
-        }
 
+    The addresses are cached process-wide, see _LocalIpAddrCache.
+    """
+    addrs = _local_ip_addr_cache.get()
+    if ipv4_only:
+        return {addr for addr in addrs if addr.find(':') == -1}
+    return set(addrs)
@@ -8,6 +8,7 @@ Access to UIO mapped memory.
 """
 
 import os
+from array import array
 from contextlib import contextmanager
 from builtins import object
 import pyudev
@@ -16,6 +17,10 @@ from usrp_mpm.mpmlog import get_logger
 
 UIO_SYSFS_BASE_DIR = '/sys/class/uio'
 UIO_DEV_BASE_DIR = '/dev'
+# The array.array type code for 32-bit unsigned integers
+_U32_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+# The struct format characters of integer buffers
+_INT_FORMATS = ('i', 'I', 'l', 'L')
 
 
 @contextmanager
@@ -204,3 +209,80 @@ class UIO(object):
         """
         assert not self._read_only
         return self._uio.poke32(addr, val)
+
+    def peek32_block(self, addr, num_words=None, out=None):
+        """
+        Reads num_words consecutive 32-bit values starting at address addr in
+        a single call, and returns them.
+
+        If out is given, the values are read into it instead, and it is
+        returned. out can be any writable, contiguous buffer of 32-bit
+        integers, such as an array.array('I') or a numpy.uint32 array. By
+        default, a new array.array('I') is returned.
+
+        Addresses which are not 32-bit aligned or not mapped, and buffers of
+        anything but 32-bit integers, raise a RuntimeError.
+        """
+        if out is None:
+            out = _make_u32_array(num_words)
+        self._uio.peek32_block(addr, out)
+        return out
+
+    def poke32_block(self, addr, vals):
+        """
+        Writes the 32-bit values vals to consecutive addresses starting at addr
+        in a single call. vals is a buffer of 32-bit integers (see
+        peek32_block()) or any iterable of integers.
+        Will throw if read_only was set to True.
+        """
+        assert not self._read_only
+        self._uio.poke32_block(addr, _as_u32_buffer(vals))
+
+    def peek32_gather(self, addrs, out=None):
+        """
+        Reads the 32-bit values at all addresses in addrs in a single call, in
+        order, and returns them (see peek32_block() for out).
+        """
+        addrs = _as_u32_buffer(addrs)
+        if out is None:
+            out = _make_u32_array(len(addrs))
+        self._uio.peek32_gather(addrs, out)
+        return out
+
+    def poke32_scatter(self, addrs, vals):
+        """
+        Writes vals[i] to addrs[i] for every i in a single call, in order.
+        Will throw if read_only was set to True.
+        """
+        assert not self._read_only
+        self._uio.poke32_scatter(_as_u32_buffer(addrs), _as_u32_buffer(vals))
+
+    def get_buffer(self):
+        """
+        Returns a memoryview of the mapped registers as 32-bit words, i.e.,
+        index i is the register at address 4*i. The view is read-only if
+        read_only was set to True.
+        Do not use the view after the UIO device was closed.
+        """
+        return memoryview(self._uio)
+
+
+def _make_u32_array(num_words):
+    """
+    Return a zeroed array.array of num_words 32-bit integers
+    """
+    return array(_U32_TYPECODE, bytes(4 * num_words))
+
+
+def _as_u32_buffer(vals):
+    """
+    Return vals if it is a buffer of 32-bit integers, or an array.array with
+    its values otherwise.
+    """
+    try:
+        view = memoryview(vals)
+        if view.itemsize == 4 and view.format.lstrip('@=') in _INT_FORMATS:
+            return vals
+    except TypeError:
+        pass
+    return array(_U32_TYPECODE, vals)